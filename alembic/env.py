@@ -19,7 +19,10 @@ DB_PORT = os.environ.get("STARGAZER_DB_PORT")
 DB_USER = os.environ.get("STARGAZER_DB_USER")
 DB_PASS = os.environ.get("STARGAZER_DB_PASS")
 DB_NAME = os.environ.get("STARGAZER_DB_NAME")
-DB_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DB_URL = os.environ.get(
+    "STARGAZER_DB_URL",
+    f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+)
 
 config.set_main_option("sqlalchemy.url", DB_URL)
 
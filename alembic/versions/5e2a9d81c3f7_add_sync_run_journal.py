@@ -0,0 +1,44 @@
+"""add sync run journal
+
+Revision ID: 5e2a9d81c3f7
+Revises: b3f1c7a2d904
+Create Date: 2026-10-18 14:37:52.904118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2a9d81c3f7"
+down_revision: Union[str, None] = "b3f1c7a2d904"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "sync_runs",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "sync_run_pages",
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.Column("page_name", sa.String(), nullable=False),
+        sa.Column("prototype_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["run_id"], ["sync_runs.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("run_id", "page_name"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("sync_run_pages")
+    op.drop_table("sync_runs")
@@ -0,0 +1,33 @@
+"""add page revisions
+
+Revision ID: b3f1c7a2d904
+Revises: 4792b5bddfdb
+Create Date: 2026-10-18 12:04:31.218406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b3f1c7a2d904"
+down_revision: Union[str, None] = "4792b5bddfdb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "page_revisions",
+        sa.Column("page_name", sa.String(), nullable=False),
+        sa.Column("revision_id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("page_name"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("page_revisions")
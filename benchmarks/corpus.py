@@ -0,0 +1,113 @@
+import os
+import random
+from dataclasses import dataclass
+
+# a handful of real component types, so the category rules have something to match
+KNOWN_COMPONENTS = ["Item", "Food", "Clothing", "Cartridge", "Mail", "Sprite"]
+TAGS = ["Trash", "Figurine", "Recyclable", "Meat", "Fruit"]
+
+
+@dataclass
+class CorpusOptions:
+    entities: int = 1000
+    # number of levels below each root prototype
+    depth: int = 4
+    # number of children of every non-leaf prototype
+    fanout: int = 4
+    # components declared by each prototype
+    components: int = 4
+    # number of distinct synthetic component types, on top of the known ones
+    component_types: int = 50
+    # chance of any component field being a `!type:` tagged mapping
+    tag_ratio: float = 0.1
+    # chance of a prototype having a second parent from another tree
+    multi_parent_ratio: float = 0.05
+    entities_per_file: int = 25
+    seed: int = 0
+
+
+def _component(rng: random.Random, component_type: str, options: CorpusOptions) -> str:
+    lines = [f"  - type: {component_type}"]
+    if component_type == "Tag":
+        lines.append("    tags:")
+        for tag in rng.sample(TAGS, rng.randint(1, 2)):
+            lines.append(f"    - {tag}")
+        return "\n".join(lines)
+
+    if component_type == "Sprite":
+        lines.append(f"    sprite: Objects/Synthetic/thing{rng.randint(0, 99)}.rsi")
+        lines.append(f"    state: icon")
+        return "\n".join(lines)
+
+    for field in range(rng.randint(0, 4)):
+        if rng.random() < options.tag_ratio:
+            lines.append(f"    field{field}: !type:Synthetic{rng.randint(0, 9)}")
+            lines.append(f"      value: {rng.randint(0, 1000)}")
+        else:
+            lines.append(
+                f"    field{field}: {rng.choice(['true', '1.5', 'text', '42'])}"
+            )
+    return "\n".join(lines)
+
+
+def _prototype(
+    rng: random.Random, entity_id: str, parents: list[str], options: CorpusOptions
+) -> str:
+    lines = ["- type: entity", f"  id: {entity_id}"]
+    if len(parents) == 1:
+        lines.append(f"  parent: {parents[0]}")
+    elif len(parents) > 1:
+        lines.append(f"  parent: [{', '.join(parents)}]")
+    if rng.random() < 0.5:
+        lines.append(f"  name: synthetic {entity_id.lower()}")
+    if rng.random() < 0.5:
+        lines.append(f"  description: A synthetic prototype. # comment")
+
+    component_pool = KNOWN_COMPONENTS + ["Tag"]
+    component_pool += [f"Synthetic{i}" for i in range(options.component_types)]
+    lines.append("  components:")
+    for component_type in rng.sample(component_pool, options.components):
+        lines.append(_component(rng, component_type, options))
+    return "\n".join(lines)
+
+
+def generate_corpus(base_path: str, options: CorpusOptions) -> int:
+    """
+    Writes a synthetic `Resources/Prototypes` tree below `base_path`, made of complete inheritance trees with the
+    requested depth and fan-out, and returns the number of files written.
+    """
+    rng = random.Random(options.seed)
+
+    # lay out the inheritance trees breadth first, starting a new tree whenever the previous one is complete
+    tree_size = sum(options.fanout**level for level in range(options.depth + 1))
+    parents: list[list[str]] = []
+    for index in range(options.entities):
+        tree, position = divmod(index, tree_size)
+        if position == 0:
+            parents.append([])
+        else:
+            parents.append(
+                [f"Synthetic{tree * tree_size + (position - 1) // options.fanout}"]
+            )
+
+        if index > tree_size and rng.random() < options.multi_parent_ratio:
+            # a second parent from an earlier tree, which can never form a cycle
+            other_tree = rng.randrange(0, tree)
+            parents[-1].append(f"Synthetic{other_tree * tree_size}")
+
+    prototypes_path = os.path.join(base_path, "Resources", "Prototypes", "Synthetic")
+    os.makedirs(prototypes_path, exist_ok=True)
+
+    files = 0
+    for start in range(0, options.entities, options.entities_per_file):
+        end = min(start + options.entities_per_file, options.entities)
+        documents = [
+            _prototype(rng, f"Synthetic{index}", parents[index], options)
+            for index in range(start, end)
+        ]
+        file_path = os.path.join(prototypes_path, f"synthetic{files}.yml")
+        with open(file_path, "w") as f:
+            f.write("\n\n".join(documents) + "\n")
+        files += 1
+
+    return files
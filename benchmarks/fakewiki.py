@@ -0,0 +1,707 @@
+import email.parser
+import email.policy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, cast
+from urllib.parse import parse_qs, urlsplit
+
+USERNAME = "Stargazer"
+BOT_PASSWORD_NAME = "stargazer"
+BOT_PASSWORD = "benchmark"
+CSRF_TOKEN = "fakecsrftoken+\\"
+LOGIN_TOKEN = "fakelogintoken+\\"
+
+# the namespaces pywikibot needs to know about, along with the one entity pages live in
+NAMESPACES = {
+    -2: "Media",
+    -1: "Special",
+    0: "",
+    1: "Talk",
+    2: "User",
+    3: "User talk",
+    4: "Project",
+    5: "Project talk",
+    6: "File",
+    7: "File talk",
+    8: "MediaWiki",
+    9: "MediaWiki talk",
+    10: "Template",
+    11: "Template talk",
+    12: "Help",
+    13: "Help talk",
+    14: "Category",
+    15: "Category talk",
+    3000: "Entity",
+    3001: "Entity talk",
+}
+
+# the api modules pywikibot is told about, with the parameter prefix of each query module
+ACTION_MODULES = ["query", "login", "logout", "edit", "upload", "paraminfo"]
+WRITE_MODULES = {"login", "logout", "edit", "upload"}
+QUERY_MODULES = {
+    "prop": {
+        "info": "in",
+        "revisions": "rv",
+        "templates": "tl",
+        "imageinfo": "ii",
+        "categoryinfo": "ci",
+        "categories": "cl",
+        "pageprops": "pp",
+        "langlinks": "ll",
+    },
+    "list": {"allpages": "ap"},
+    "meta": {"siteinfo": "si", "userinfo": "ui", "tokens": ""},
+}
+GENERATORS = ["allpages", "templates", "revisions"]
+LIMITED_MODULES = {
+    "revisions",
+    "templates",
+    "imageinfo",
+    "categories",
+    "langlinks",
+    "allpages",
+}
+
+
+def _module_parameter(name: str, modules: list[str], path: str) -> dict[str, Any]:
+    return {
+        "name": name,
+        "type": modules,
+        "submodules": {module: f"{path}{module}" for module in modules},
+        "multi": name != "action" and name != "generator",
+        "limit": 50,
+        "lowlimit": 50,
+        "highlimit": 500,
+    }
+
+
+def _paraminfo_module(path: str) -> dict[str, Any] | None:
+    module: dict[str, Any] = {
+        "name": path.rsplit("+", 1)[-1],
+        "classname": "ApiFake",
+        "path": path,
+        "source": "MediaWiki",
+        "sourcename": "mediawiki",
+        "licensetag": "GPL-2.0-or-later",
+        "licenselink": "",
+        "prefix": "",
+        "helpurls": [],
+        "parameters": [],
+        "templatedparameters": [],
+    }
+    if path == "main":
+        module["parameters"] = [
+            _module_parameter("action", ACTION_MODULES, ""),
+            {"name": "format", "type": ["json"], "submodules": {"json": "json"}},
+            {"name": "maxlag", "type": "integer"},
+        ]
+    elif path == "query":
+        module["parameters"] = [
+            _module_parameter(group, list(modules), "query+")
+            for group, modules in QUERY_MODULES.items()
+        ] + [
+            _module_parameter("generator", GENERATORS, "query+"),
+            {"name": "titles", "type": "string", "multi": True, "limit": 50},
+            {"name": "pageids", "type": "integer", "multi": True, "limit": 50},
+            {"name": "continue", "type": "string"},
+        ]
+    elif path in ACTION_MODULES:
+        if path in WRITE_MODULES:
+            module["mustbeposted"] = True
+    elif path.startswith("query+"):
+        name = module["name"]
+        group = next(
+            (group for group, modules in QUERY_MODULES.items() if name in modules),
+            None,
+        )
+        if group is None:
+            return None
+        module["group"] = group
+        module["prefix"] = QUERY_MODULES[group][name]
+        if name in GENERATORS:
+            module["generator"] = True
+        if name in LIMITED_MODULES:
+            module["parameters"].append(
+                {
+                    "name": "limit",
+                    "type": "limit",
+                    "default": 10,
+                    "max": 500,
+                    "highmax": 5000,
+                    "min": 1,
+                }
+            )
+        if group == "prop":
+            module["parameters"].append(
+                {
+                    "name": "prop",
+                    "type": [],
+                    "multi": True,
+                    "limit": 50,
+                    "lowlimit": 50,
+                    "highlimit": 500,
+                }
+            )
+        if name == "tokens":
+            module["parameters"].append(
+                {"name": "type", "type": ["csrf", "login"], "multi": True}
+            )
+    else:
+        return None
+    return module
+
+
+@dataclass
+class FakeWikiOptions:
+    # seconds every request takes to be answered
+    latency: float = 0.0
+    # chance of a request carrying `maxlag` being refused as lagged
+    maxlag_ratio: float = 0.0
+    # the replication lag reported when it is, which pywikibot waits out before retrying
+    maxlag_seconds: float = 0.5
+    # chance of an edit being refused as an edit conflict
+    conflict_ratio: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class FakePage:
+    title: str
+    pageid: int
+    revid: int
+    text: str
+    timestamp: str
+
+
+@dataclass
+class FakeFile:
+    data: bytes
+    sha1: str
+    timestamp: str
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeWiki:
+    """
+    A stand-in for the MediaWiki action API, answering just enough of it for pywikibot to log in, read pages and their
+    revisions and save them, and upload files. Pages and the latest version of every file are kept in memory, and
+    every request is counted by action (and every query by its modules), so runs can be measured by the requests they
+    make. Latency, maxlag errors and edit conflicts are injected as configured.
+    """
+
+    options: FakeWikiOptions
+    pages: dict[str, FakePage]
+    files: dict[str, FakeFile]
+    requests: Counter[str]
+    queries: Counter[str]
+
+    def __init__(self, options: FakeWikiOptions | None = None) -> None:
+        self.options = options if options is not None else FakeWikiOptions()
+        self.pages = {}
+        self.files = {}
+        self.requests = Counter()
+        self.queries = Counter()
+        self.maxlagged = 0
+        self.conflicts = 0
+        # there is only ever one client, so the session is the wiki's
+        self.logged_in = False
+        self._random = random.Random(self.options.seed)
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self.answer(_parse_form(urlsplit(self.path).query))
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                content_type = self.headers.get("Content-Type", "")
+                if content_type.startswith("multipart/form-data"):
+                    self.answer(*_parse_multipart(content_type, body))
+                else:
+                    self.answer(_parse_form(body.decode()))
+
+            def answer(
+                self, params: dict[str, str], files: dict[str, bytes] | None = None
+            ) -> None:
+                status, result = wiki.handle(params, files)
+                content = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                if "error" in result and result["error"]["code"] == "maxlag":
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # forgets every page and starts over with new options, staying logged in
+    def reset(self, options: FakeWikiOptions | None = None) -> None:
+        with self._lock:
+            self.options = options if options is not None else FakeWikiOptions()
+            self._random = random.Random(self.options.seed)
+            self.pages.clear()
+            self.files.clear()
+        self.reset_counts()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.queries.clear()
+            self.maxlagged = 0
+            self.conflicts = 0
+
+    @staticmethod
+    def normalize(title: str) -> str:
+        title = title.replace("_", " ").strip()
+        namespace, _, name = title.partition(":")
+        if name != "" and namespace in NAMESPACES.values():
+            return f"{namespace}:{name[:1].upper()}{name[1:]}"
+        return title[:1].upper() + title[1:]
+
+    # adds a page as if it had been created by someone else, returning it
+    def create_page(self, title: str, text: str) -> FakePage:
+        with self._lock:
+            return self._save(self.normalize(title), text)
+
+    # adds a file as if it had been uploaded by someone else, returning it
+    def create_file(self, name: str, data: bytes, text: str = "") -> FakeFile:
+        with self._lock:
+            return self._store_file(self.normalize(f"File:{name}"), data, text)
+
+    def _store_file(self, title: str, data: bytes, text: str) -> FakeFile:
+        # uploading a new version of a file adds a revision to its page, leaving the text as it was
+        page = self.pages.get(title)
+        page = self._save(title, page.text if page is not None else text)
+        file = FakeFile(data, hashlib.sha1(data).hexdigest(), page.timestamp)
+        self.files[title] = file
+        return file
+
+    def _save(self, title: str, text: str) -> FakePage:
+        page = self.pages.get(title)
+        if page is None:
+            page = FakePage(title, self._next_id, 0, text, _timestamp())
+            self.pages[title] = page
+            self._next_id += 1
+        page.revid = self._next_id
+        page.text = text
+        page.timestamp = _timestamp()
+        self._next_id += 1
+        return page
+
+    def handle(
+        self, params: dict[str, str], files: dict[str, bytes] | None = None
+    ) -> tuple[int, dict[str, Any]]:
+        if self.options.latency > 0:
+            time.sleep(self.options.latency)
+
+        action = params.get("action", "")
+        with self._lock:
+            self.requests[action] += 1
+            if action == "query":
+                for module in ("meta", "prop", "list", "generator"):
+                    if module in params:
+                        self.queries[f"{module}={params[module]}"] += 1
+
+            if "maxlag" in params and self._random.random() < self.options.maxlag_ratio:
+                self.maxlagged += 1
+                return 200, {
+                    "error": {
+                        "code": "maxlag",
+                        "info": f"Waiting for 127.0.0.1: {self.options.maxlag_seconds} seconds lagged",
+                        "lag": self.options.maxlag_seconds,
+                    }
+                }
+
+            if action == "query":
+                return 200, {"batchcomplete": True, "query": self._query(params)}
+            if action == "login":
+                return 200, self._login(params)
+            if action == "edit":
+                return 200, self._edit(params)
+            if action == "upload":
+                return 200, self._upload(params, files or {})
+            if action == "logout":
+                self.logged_in = False
+                return 200, {}
+            if action == "paraminfo":
+                return 200, self._paraminfo(params)
+        return 200, {
+            "error": {"code": "badvalue", "info": f"Unsupported action: {action}"}
+        }
+
+    def _query(self, params: dict[str, str]) -> dict[str, Any]:
+        query: dict[str, Any] = {}
+        meta = params.get("meta", "").split("|")
+        if "siteinfo" in meta:
+            siteinfo = self._siteinfo()
+            for prop in params.get("siprop", "general").split("|"):
+                # anything not modelled here, such as extensions or magic words, is empty
+                query[prop] = siteinfo.get(prop, [])
+        if "userinfo" in meta:
+            if self.logged_in:
+                query["userinfo"] = {
+                    "id": 1,
+                    "name": USERNAME,
+                    "groups": ["*", "user", "bot"],
+                    "rights": [
+                        "read",
+                        "edit",
+                        "createpage",
+                        "bot",
+                        "upload",
+                        "writeapi",
+                        "apihighlimits",
+                    ],
+                    "ratelimits": {},
+                    "messages": False,
+                }
+            else:
+                # as on a default MediaWiki install, anyone may edit, so pywikibot only logs in once it needs an
+                # edit token
+                query["userinfo"] = {
+                    "id": 0,
+                    "name": "127.0.0.1",
+                    "anon": True,
+                    "groups": ["*"],
+                    "rights": ["read", "edit", "createpage", "writeapi"],
+                    "ratelimits": {},
+                }
+        if "tokens" in meta:
+            query["tokens"] = {
+                # anonymous users are handed an empty csrf token
+                "csrftoken": CSRF_TOKEN if self.logged_in else "+\\",
+                "logintoken": LOGIN_TOKEN,
+            }
+
+        if "titles" in params or "pageids" in params:
+            query.update(self._pages(params))
+        return query
+
+    @staticmethod
+    def _paraminfo(params: dict[str, str]) -> dict[str, Any]:
+        modules = []
+        for path in params.get("modules", "").split("|"):
+            module = _paraminfo_module(path)
+            modules.append(
+                module if module is not None else {"name": path, "missing": True}
+            )
+        return {"paraminfo": {"modules": modules}}
+
+    def _siteinfo(self) -> dict[str, Any]:
+        return {
+            "general": {
+                "mainpage": "Main Page",
+                "base": f"http://{self.host}/wiki/Main_Page",
+                "sitename": "Fake Wiki",
+                "generator": "MediaWiki 1.41.0",
+                "phpversion": "8.1.0",
+                "dbtype": "sqlite",
+                "case": "first-letter",
+                "lang": "en",
+                "fallback": [],
+                "rtl": False,
+                "fallback8bitEncoding": "windows-1252",
+                "writeapi": True,
+                "timezone": "UTC",
+                "timeoffset": 0,
+                "articlepath": "/wiki/$1",
+                "scriptpath": "/w",
+                "script": "/w/index.php",
+                "server": f"http://{self.host}",
+                "servername": "127.0.0.1",
+                "wikiid": "fakewiki",
+                "time": _timestamp(),
+                "maxarticlesize": 2097152,
+                "maxuploadsize": 104857600,
+                "uploadsenabled": True,
+                "legaltitlechars": " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+",
+                "invalidusernamechars": "@:",
+                "thumblimits": {"0": 120, "1": 150, "2": 180},
+                "imagelimits": {"0": {"width": 320, "height": 240}},
+                "magiclinks": {"ISBN": False, "PMID": False, "RFC": False},
+            },
+            "namespaces": {
+                str(namespace_id): {
+                    "id": namespace_id,
+                    "case": "first-letter",
+                    "name": name,
+                    "subpages": namespace_id % 2 == 1 or namespace_id == 2,
+                    "canonical": name,
+                    "content": namespace_id in (0, 3000),
+                    "nonincludable": False,
+                }
+                for namespace_id, name in NAMESPACES.items()
+            },
+            "namespacealiases": [],
+            "fileextensions": [{"ext": ext} for ext in ("png", "gif", "jpg", "jpeg")],
+        }
+
+    def _pages(self, params: dict[str, str]) -> dict[str, Any]:
+        props = params.get("prop", "").split("|")
+        titles = params["titles"].split("|") if "titles" in params else []
+        if "pageids" in params:
+            pageids = {int(pageid) for pageid in params["pageids"].split("|")}
+            titles += [
+                page.title for page in self.pages.values() if page.pageid in pageids
+            ]
+
+        normalized = []
+        pages = []
+        for title in titles:
+            normalized_title = self.normalize(title)
+            if normalized_title != title:
+                normalized.append(
+                    {"fromencoded": False, "from": title, "to": normalized_title}
+                )
+
+            page = self.pages.get(normalized_title)
+            namespace = normalized_title.partition(":")[0]
+            namespace_id = next(
+                (
+                    namespace_id
+                    for namespace_id, name in NAMESPACES.items()
+                    if name == namespace and ":" in normalized_title
+                ),
+                0,
+            )
+            if page is None:
+                pages.append(
+                    {"ns": namespace_id, "title": normalized_title, "missing": True}
+                )
+                continue
+
+            entry: dict[str, Any] = {
+                "pageid": page.pageid,
+                "ns": namespace_id,
+                "title": page.title,
+            }
+            if "info" in props:
+                entry.update(
+                    {
+                        "contentmodel": "wikitext",
+                        "pagelanguage": "en",
+                        "touched": page.timestamp,
+                        "lastrevid": page.revid,
+                        "length": len(page.text),
+                    }
+                )
+            if "revisions" in props:
+                entry["revisions"] = [
+                    {
+                        "revid": page.revid,
+                        "parentid": 0,
+                        "user": USERNAME,
+                        "timestamp": page.timestamp,
+                        "comment": "",
+                        "slots": {
+                            "main": {
+                                "contentmodel": "wikitext",
+                                "contentformat": "text/x-wiki",
+                                "content": page.text,
+                                # where content is found with formatversion=1, which page preloading still uses
+                                "*": page.text,
+                            }
+                        },
+                    }
+                ]
+            if "templates" in props:
+                entry["templates"] = []
+            if "imageinfo" in props and normalized_title in self.files:
+                entry["imageinfo"] = [self._imageinfo(self.files[normalized_title])]
+            pages.append(entry)
+
+        result: dict[str, Any] = {"pages": pages}
+        if "indexpageids" in params:
+            result["pageids"] = [str(page.get("pageid", -1)) for page in pages]
+        if len(normalized) > 0:
+            result["normalized"] = normalized
+        return result
+
+    def _login(self, params: dict[str, str]) -> dict[str, Any]:
+        if params.get("lgtoken") != LOGIN_TOKEN:
+            return {"login": {"result": "NeedToken", "token": LOGIN_TOKEN}}
+        if (
+            params.get("lgname") != f"{USERNAME}@{BOT_PASSWORD_NAME}"
+            or params.get("lgpassword") != BOT_PASSWORD
+        ):
+            return {"login": {"result": "Failed", "reason": "Incorrect password"}}
+        self.logged_in = True
+        return {"login": {"result": "Success", "lguserid": 1, "lgusername": USERNAME}}
+
+    def _edit(self, params: dict[str, str]) -> dict[str, Any]:
+        if not self.logged_in or params.get("token") != CSRF_TOKEN:
+            return {"error": {"code": "badtoken", "info": "Invalid CSRF token."}}
+
+        title = self.normalize(params.get("title", ""))
+        if self._random.random() < self.options.conflict_ratio:
+            self.conflicts += 1
+            return {"error": {"code": "editconflict", "info": "Edit conflict."}}
+
+        page = self.pages.get(title)
+        if page is not None and "createonly" in params:
+            return {
+                "error": {
+                    "code": "articleexists",
+                    "info": "The article you tried to create has been created already.",
+                }
+            }
+        old_revid = page.revid if page is not None else 0
+        text = params.get("text", "")
+        if "appendtext" in params:
+            text = (page.text if page is not None else "") + params["appendtext"]
+        if page is not None and page.text == text:
+            return {
+                "edit": {
+                    "result": "Success",
+                    "pageid": page.pageid,
+                    "title": title,
+                    "nochange": True,
+                    "contentmodel": "wikitext",
+                }
+            }
+
+        page = self._save(title, text)
+        return {
+            "edit": {
+                "result": "Success",
+                "pageid": page.pageid,
+                "title": title,
+                "contentmodel": "wikitext",
+                "oldrevid": old_revid,
+                "newrevid": page.revid,
+                "newtimestamp": page.timestamp,
+            }
+        }
+
+    # warnings, such as for files which already exist, aren't modelled: every upload goes through as if they were ignored
+    def _upload(
+        self, params: dict[str, str], files: dict[str, bytes]
+    ) -> dict[str, Any]:
+        if not self.logged_in or params.get("token") != CSRF_TOKEN:
+            return {"error": {"code": "badtoken", "info": "Invalid CSRF token."}}
+        if "file" not in files or "filename" not in params:
+            return {
+                "error": {
+                    "code": "missingparam",
+                    "info": "One of the parameters filekey, file and url is required.",
+                }
+            }
+
+        title = self.normalize(f"File:{params['filename']}")
+        file = self._store_file(title, files["file"], params.get("text", ""))
+        return {
+            "upload": {
+                "result": "Success",
+                "filename": title.partition(":")[2],
+                "imageinfo": self._imageinfo(file),
+            }
+        }
+
+    @staticmethod
+    def _imageinfo(file: FakeFile) -> dict[str, Any]:
+        return {
+            "timestamp": file.timestamp,
+            "user": USERNAME,
+            "size": len(file.data),
+            "sha1": file.sha1,
+        }
+
+
+def _parse_form(body: str) -> dict[str, str]:
+    # boolean parameters are sent without a value
+    return {
+        key: values[0] for key, values in parse_qs(body, keep_blank_values=True).items()
+    }
+
+
+# splits a multipart/form-data body, as uploads are sent, into its parameters and its files
+def _parse_multipart(
+    content_type: str, body: bytes
+) -> tuple[dict[str, str], dict[str, bytes]]:
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    params: dict[str, str] = {}
+    files: dict[str, bytes] = {}
+    for part in message.iter_parts():
+        name = str(part.get_param("name", header="content-disposition"))
+        # single parts decode to bytes
+        payload = cast(bytes, part.get_payload(decode=True))
+        if part.get_filename() is not None:
+            files[name] = payload
+        else:
+            params[name] = payload.decode()
+    return params, files
+
+
+def write_pywikibot_config(path: str, wiki: FakeWiki, family: str = "fakewiki") -> None:
+    """
+    Writes a pywikibot configuration directory pointing at the fake wiki, logging in with a bot password. Point
+    `PYWIKIBOT_DIR` at it before pywikibot is first imported. The wiki's family can be named after another, such as
+    the `starcup` family stargazer's commands connect to.
+    """
+    os.makedirs(os.path.join(path, "families"), exist_ok=True)
+    with open(os.path.join(path, "families", f"{family}_family.py"), "w") as f:
+        f.write(
+            "from pywikibot import family\n"
+            "\n"
+            "\n"
+            "class Family(family.Family):\n"
+            f'    name = "{family}"\n'
+            f'    langs = {{"en": "{wiki.host}"}}\n'
+            "\n"
+            "    def protocol(self, code):\n"
+            '        return "http"\n'
+            "\n"
+            "    def scriptpath(self, code):\n"
+            '        return "/w"\n'
+        )
+    with open(os.path.join(path, "user-config.py"), "w") as f:
+        f.write(
+            f'family = "{family}"\n'
+            'mylang = "en"\n'
+            f'usernames["{family}"]["en"] = "{USERNAME}"\n'
+            'password_file = "user-password.py"\n'
+            # the wiki is local, so reads aren't spaced out and failed requests are retried right away; the delay
+            # between writes is left to whatever is being measured, as stargazer turns it off
+            "retry_wait = 0\n"
+            "minthrottle = 0\n"
+            "noisysleep = float('inf')\n"
+        )
+    with open(os.path.join(path, "user-password.py"), "w") as f:
+        f.write(
+            f'("{USERNAME}", BotPassword("{BOT_PASSWORD_NAME}", "{BOT_PASSWORD}"))\n'
+        )
+    # pywikibot refuses password files readable by anyone else
+    os.chmod(os.path.join(path, "user-password.py"), 0o600)
@@ -0,0 +1,211 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from stargazer.entity import EntityPrototype
+from stargazer.loader import load_prototypes
+from stargazer.segments import PAGE_SEGMENTS, PageSegmentStore, SegmentProcessor
+from stargazer.updaters import EntityUpdater
+
+
+class PhaseTimer:
+    def __init__(self, trace_memory: bool) -> None:
+        self.trace_memory = trace_memory
+        self.phases: dict[str, dict[str, Any]] = {}
+
+    @contextmanager
+    def phase(self, name: str, items: int) -> Iterator[None]:
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+
+        result: dict[str, Any] = {
+            "seconds": seconds,
+            "items": items,
+            "items_per_second": items / seconds if seconds > 0 else None,
+        }
+        if self.trace_memory:
+            # what the phase allocated and still holds on to, such as the prototypes it loaded
+            current, peak = tracemalloc.get_traced_memory()
+            result["retained_memory_bytes"] = current
+            result["peak_memory_bytes"] = peak
+            tracemalloc.stop()
+        self.phases[name] = result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    corpus_path: str,
+    options: CorpusOptions,
+    workers: int,
+    fast_yaml: bool,
+    stale_ratio: float,
+    trace_memory: bool,
+) -> dict[str, Any]:
+    timer = PhaseTimer(trace_memory)
+
+    files = generate_corpus(corpus_path, options)
+
+    with timer.phase("load", files):
+        registry = load_prototypes(corpus_path, workers=workers, fast_yaml=fast_yaml)
+    entities: dict[str, EntityPrototype] = registry.entities
+
+    with timer.phase("resolve", len(registry)):
+        registry.resolve()
+
+    with timer.phase("render", len(entities)):
+        segments = {
+            EntityUpdater.page_name(entity_id): (
+                EntityUpdater.generate_infobox(entity),
+                EntityUpdater.generate_categories(entity),
+            )
+            for entity_id, entity in entities.items()
+        }
+
+    # pretend a previous run stored every page, with some of them since gone stale
+    engine = create_engine("sqlite://")
+    PAGE_SEGMENTS.metadata.create_all(engine)
+    session = Session(engine)
+    seed_store = PageSegmentStore(session)
+    for index, (page_name, (infobox, categories)) in enumerate(segments.items()):
+        stale = index < len(segments) * stale_ratio
+        for segment_name, segment in (("Infobox", infobox), ("Categories", categories)):
+            processor = SegmentProcessor(
+                page_name,
+                segment_name,
+                segment + ("stale" if stale else ""),
+                seed_store,
+            )
+            processor.saved()
+    seed_store.flush()
+    session.commit()
+
+    with timer.phase("db_diff", len(segments)):
+        store = PageSegmentStore(session)
+        store.prefetch(segments.keys())
+        for page_name, (infobox, categories) in segments.items():
+            processors = [
+                SegmentProcessor(page_name, "Infobox", infobox, store),
+                SegmentProcessor(page_name, "Categories", categories, store),
+            ]
+            if any(processor.should_update() for processor in processors):
+                for processor in processors:
+                    processor.saved()
+        store.flush()
+        session.commit()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "corpus": asdict(options),
+        "files": files,
+        "workers": workers,
+        "fast_yaml": fast_yaml,
+        "stale_ratio": stale_ratio,
+        "phases": timer.phases,
+        # ru_maxrss is reported in kilobytes on linux and in bytes on macos
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        * (1 if sys.platform == "darwin" else 1024),
+    }
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    print(f"{'phase':<10} {'previous':>10} {'current':>10} {'change':>8}")
+    for name, phase in current["phases"].items():
+        if name not in previous["phases"]:
+            continue
+        before = previous["phases"][name]["seconds"]
+        after = phase["seconds"]
+        change = (after - before) / before * 100 if before > 0 else 0
+        print(f"{name:<10} {before:>9.3f}s {after:>9.3f}s {change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Time stargazer's phases against a synthetic prototype corpus",
+    )
+    defaults = CorpusOptions()
+    parser.add_argument("--entities", type=int, default=defaults.entities)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--components", type=int, default=defaults.components)
+    parser.add_argument("--tag-ratio", type=float, default=defaults.tag_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--fast-yaml", action="store_true")
+    parser.add_argument(
+        "--stale-ratio",
+        type=float,
+        default=0.1,
+        help="share of pages whose stored segment hashes are out of date",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="record the peak python memory use of every phase (slows every phase down)",
+    )
+    parser.add_argument(
+        "--corpus-path",
+        help="where to generate the corpus (default: a temporary directory)",
+    )
+    parser.add_argument("-o", "--output", help="file to write the results to as json")
+    parser.add_argument(
+        "--compare", help="results file of an earlier run to compare against"
+    )
+    args = parser.parse_args()
+
+    options = CorpusOptions(
+        entities=args.entities,
+        depth=args.depth,
+        fanout=args.fanout,
+        components=args.components,
+        tag_ratio=args.tag_ratio,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        results = run(
+            args.corpus_path or temp_path,
+            options,
+            args.workers,
+            args.fast_yaml,
+            args.stale_ratio,
+            args.trace_memory,
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), results)
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from benchmarks.fakewiki import FakeWiki, FakeWikiOptions, write_pywikibot_config
+from benchmarks.run import git_commit
+from stargazer.index import PrototypeIndex
+from stargazer.loader import load_prototypes
+from stargazer.report import RunReport
+from stargazer.segments import PAGE_SEGMENTS
+from stargazer.throttle import WriteScheduler, disable_write_delay
+from stargazer.updaters import EntityUpdater
+
+# runs this much slower than before are never a regression, as timings that short are mostly noise
+TIME_SLACK = 0.1
+
+# counters of the run report worth comparing between runs, next to the requests the wiki saw
+REPORT_COUNTERS = (
+    "api_requests",
+    "pages_updated",
+    "pages_unchanged",
+    "pages_skipped",
+    "pages_drifted",
+    "pages_failed",
+    "db_queries",
+)
+
+
+def run(
+    corpus_path: str,
+    config_path: str,
+    options: CorpusOptions,
+    wiki_options: FakeWikiOptions,
+    drift_ratio: float,
+    min_delay: float,
+) -> dict[str, Any]:
+    """
+    Synchronizes a synthetic corpus with a fake wiki three times: onto an empty wiki, again with nothing changed, and
+    once more after some pages were edited on the wiki by someone else. Every run is measured by its wall time and the
+    api requests it made.
+    """
+    generate_corpus(corpus_path, options)
+    registry = load_prototypes(corpus_path)
+    registry.resolve()
+    entities = registry.entities
+    index = PrototypeIndex(entities)
+
+    wiki = FakeWiki(wiki_options)
+    wiki.start()
+    write_pywikibot_config(config_path, wiki)
+    # pywikibot reads its configuration once, when first imported
+    os.environ["PYWIKIBOT_DIR"] = config_path
+    import pywikibot
+
+    engine = create_engine("sqlite://")
+    PAGE_SEGMENTS.metadata.create_all(engine)
+    session = Session(engine)
+
+    site = pywikibot.Site("en", "fakewiki")
+    disable_write_delay(site)
+    site.login()
+
+    def measure() -> dict[str, Any]:
+        report = RunReport()
+        report.watch_engine(engine)
+        report.watch_http(pywikibot.comms.http.session)
+        wiki.reset_counts()
+
+        updater = EntityUpdater(
+            session,
+            site,
+            "benchmark",
+            WriteScheduler(min_delay=min_delay, initial_delay=min_delay),
+            report,
+            entities=entities,
+            index=index,
+        )
+        start = time.perf_counter()
+        updater.run()
+        seconds = time.perf_counter() - start
+
+        # the http hook of every earlier run stays registered, so only the wiki's own count is exact
+        pywikibot.comms.http.session.hooks["response"].clear()
+        return {
+            "seconds": seconds,
+            "requests": sum(wiki.requests.values()),
+            "requests_by_action": dict(sorted(wiki.requests.items())),
+            "queries": dict(sorted(wiki.queries.items())),
+            "maxlagged": wiki.maxlagged,
+            "conflicts": wiki.conflicts,
+            "counters": {
+                counter: report.counters.get(counter, 0) for counter in REPORT_COUNTERS
+            },
+        }
+
+    runs = {"initial": measure(), "unchanged": measure()}
+
+    rng = random.Random(options.seed)
+    drifted = rng.sample(sorted(wiki.pages), k=int(len(wiki.pages) * drift_ratio))
+    for title in drifted:
+        wiki.create_page(title, wiki.pages[title].text + "\nEdited by hand.")
+    runs["drifted"] = measure()
+
+    wiki.stop()
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "corpus": asdict(options),
+        "wiki": asdict(wiki_options),
+        "entities": len(entities),
+        "drift_ratio": drift_ratio,
+        "runs": runs,
+    }
+
+
+# returns whether the current results are within budget of the previous ones
+def compare(
+    previous: dict[str, Any], current: dict[str, Any], time_tolerance: float
+) -> bool:
+    ok = True
+    print(
+        f"{'run':<10} {'requests':>9} {'previous':>9} {'seconds':>9} {'previous':>9} {'change':>8}"
+    )
+    for name, result in current["runs"].items():
+        if name not in previous["runs"]:
+            continue
+        before = previous["runs"][name]
+        change = (
+            (result["seconds"] - before["seconds"]) / before["seconds"] * 100
+            if before["seconds"] > 0
+            else 0
+        )
+        print(
+            f"{name:<10} {result['requests']:>9} {before['requests']:>9} "
+            f"{result['seconds']:>8.2f}s {before['seconds']:>8.2f}s {change:>+7.1f}%"
+        )
+
+        if result["requests"] > before["requests"]:
+            print(
+                f"  {name}: {result['requests'] - before['requests']} more api requests than before"
+            )
+            ok = False
+        if result["seconds"] > max(
+            before["seconds"] * (1 + time_tolerance), before["seconds"] + TIME_SLACK
+        ):
+            print(f"  {name}: slower than the {time_tolerance:.0%} tolerance")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.sync",
+        description="Measure the api requests and wall time of entity page syncs against a local fake wiki",
+    )
+    defaults = CorpusOptions(entities=200)
+    wiki_defaults = FakeWikiOptions()
+    parser.add_argument("--entities", type=int, default=defaults.entities)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--components", type=int, default=defaults.components)
+    parser.add_argument("--tag-ratio", type=float, default=defaults.tag_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=wiki_defaults.latency,
+        help="seconds the wiki takes to answer every request",
+    )
+    parser.add_argument(
+        "--maxlag-ratio",
+        type=float,
+        default=wiki_defaults.maxlag_ratio,
+        help="share of requests refused because of replication lag",
+    )
+    parser.add_argument(
+        "--maxlag-seconds",
+        type=float,
+        default=wiki_defaults.maxlag_seconds,
+        help="replication lag reported with each refusal",
+    )
+    parser.add_argument(
+        "--conflict-ratio",
+        type=float,
+        default=wiki_defaults.conflict_ratio,
+        help="share of edits refused as edit conflicts",
+    )
+    parser.add_argument(
+        "--drift-ratio",
+        type=float,
+        default=0.1,
+        help="share of pages edited on the wiki before the last run",
+    )
+    parser.add_argument(
+        "--min-delay",
+        type=float,
+        default=0.0,
+        help="shortest delay between page saves, in seconds",
+    )
+    parser.add_argument("-o", "--output", help="file to write the results to as json")
+    parser.add_argument(
+        "--compare", help="results file of an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with an error if any run makes more api requests than in the compared results, or is slower "
+        "beyond the time tolerance",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=0.5,
+        help="share by which a run may be slower than in the compared results",
+    )
+    args = parser.parse_args()
+
+    options = CorpusOptions(
+        entities=args.entities,
+        depth=args.depth,
+        fanout=args.fanout,
+        components=args.components,
+        tag_ratio=args.tag_ratio,
+        seed=args.seed,
+    )
+    wiki_options = FakeWikiOptions(
+        latency=args.latency,
+        maxlag_ratio=args.maxlag_ratio,
+        maxlag_seconds=args.maxlag_seconds,
+        conflict_ratio=args.conflict_ratio,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        results = run(
+            os.path.join(temp_path, "corpus"),
+            os.path.join(temp_path, "pywikibot"),
+            options,
+            wiki_options,
+            args.drift_ratio,
+            args.min_delay,
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            within_budget = compare(json.load(f), results, args.time_tolerance)
+        if args.check and not within_budget:
+            sys.exit(1)
@@ -0,0 +1,101 @@
+import logging
+import os
+import pickle
+import typing
+
+from .meta import PrototypeMeta
+
+log = logging.getLogger(__name__)
+
+# bump whenever the shape of parsed prototype data changes, which invalidates every existing cache file
+LOADER_VERSION = 4
+
+ParsedFile = list[tuple[dict[str, typing.Any], PrototypeMeta]]
+
+
+class ParseCache:
+    """
+    An on-disk cache of parsed prototype files, keyed by file path and validated by modification time and size.
+    """
+
+    path: str
+    entries: dict[str, tuple[int, int, ParsedFile]]
+    hits: int
+    misses: int
+
+    def __init__(self, path: str, rebuild: bool = False) -> None:
+        self.path = path
+        self.entries = {}
+        self._stats: dict[str, tuple[int, int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if rebuild or not os.path.exists(path):
+            return
+
+        try:
+            with open(path, "rb") as f:
+                version, entries = pickle.load(f)
+        except Exception as e:
+            log.warning(f"Discarding unreadable parse cache {path} ({e})")
+            return
+
+        if version != LOADER_VERSION:
+            log.info(
+                f"Discarding parse cache {path} from loader version {version} (current: {LOADER_VERSION})"
+            )
+            return
+
+        self.entries = entries
+
+    @staticmethod
+    def _stat(fpath: str) -> tuple[int, int]:
+        stat = os.stat(fpath)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, fpath: str) -> ParsedFile | None:
+        # the file is only stat'd here so that a file modified while being parsed is re-parsed on the next run
+        stat = ParseCache._stat(fpath)
+        self._stats[fpath] = stat
+
+        entry = self.entries.get(fpath)
+        if entry is not None and entry[:2] == stat:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        return None
+
+    def put(self, fpath: str, parsed: ParsedFile) -> None:
+        stat = self._stats.get(fpath)
+        if stat is None:
+            stat = ParseCache._stat(fpath)
+            self._stats[fpath] = stat
+        self.entries[fpath] = (*stat, parsed)
+
+    # forgets a file which no longer exists
+    def discard(self, fpath: str) -> None:
+        self.entries.pop(fpath, None)
+        self._stats.pop(fpath, None)
+
+    # writes the cache back to disk, dropping entries for files that were not looked up during this run
+    def save(self) -> None:
+        entries = {
+            fpath: entry
+            for fpath, entry in self.entries.items()
+            if fpath in self._stats
+        }
+
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first so an interrupted run never leaves a truncated cache behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump((LOADER_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+
+        log.debug(
+            f"Saved parse cache with {len(entries)} files ({self.hits} hits, {self.misses} misses)"
+        )
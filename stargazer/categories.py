@@ -0,0 +1,167 @@
+import os
+import typing
+from typing import Callable
+
+from ruamel.yaml import YAML
+
+from .entity import EntityPrototype
+
+DEFAULT_CATEGORY_RULES_PATH = os.path.join(os.path.dirname(__file__), "categories.yml")
+
+# a condition evaluated against an entity's component types and tags
+Predicate = Callable[[typing.Collection[str], typing.Collection[str]], bool]
+# the atoms (`("component", type)` or `("tag", tag)`) of which at least one must be present for a condition to hold,
+# or None if it may hold without any of them
+Triggers = set[tuple[str, str]] | None
+
+CONDITION_KEYS = ("component", "tag", "all", "any", "not")
+
+
+class CategoryRuleException(Exception):
+    pass
+
+
+def _compile_condition(condition: typing.Any) -> tuple[Predicate, Triggers]:
+    if not isinstance(condition, dict):
+        raise CategoryRuleException(f"Expected a condition mapping, got: {condition}")
+
+    keys = [key for key in CONDITION_KEYS if key in condition]
+    if len(keys) != 1:
+        raise CategoryRuleException(
+            f"A condition needs exactly one of {', '.join(CONDITION_KEYS)}: {condition}"
+        )
+    key = keys[0]
+    value = condition[key]
+
+    if key == "component":
+        component_type = str(value)
+        return (lambda components, tags: component_type in components), {
+            ("component", component_type)
+        }
+
+    if key == "tag":
+        tag = str(value)
+        return (lambda components, tags: tag in tags), {("tag", tag)}
+
+    if key == "not":
+        predicate, _ = _compile_condition(value)
+        return (lambda components, tags: not predicate(components, tags)), None
+
+    if not isinstance(value, list) or len(value) == 0:
+        raise CategoryRuleException(
+            f"`{key}` expects a list of conditions: {condition}"
+        )
+    compiled = [_compile_condition(child) for child in value]
+    predicates = [predicate for predicate, _ in compiled]
+
+    if key == "all":
+        # any one child's triggers will do, the smallest set is checked most rarely
+        child_triggers = [triggers for _, triggers in compiled if triggers is not None]
+        return (
+            lambda components, tags: all(p(components, tags) for p in predicates)
+        ), min(child_triggers, key=len, default=None)
+
+    # any
+    child_triggers = [triggers for _, triggers in compiled if triggers is not None]
+    any_triggers: Triggers = None
+    if len(child_triggers) == len(compiled):
+        any_triggers = set().union(*child_triggers)
+    return (
+        lambda components, tags: any(p(components, tags) for p in predicates)
+    ), any_triggers
+
+
+class CategoryRules:
+    """
+    A list of category rules compiled into lookup tables. Plain component and tag rules are found by looking up each of
+    an entity's component types and tags once, and compound rules are only evaluated when at least one of the
+    components or tags they depend on is present, so the cost of categorizing an entity barely grows with the number
+    of rules.
+    """
+
+    categories: list[str]
+    always: list[int]
+    component_rules: dict[str, list[int]]
+    tag_rules: dict[str, list[int]]
+    compound_rules: dict[int, Predicate]
+    # compound rules indexed by the atoms which trigger their evaluation
+    compound_triggers: dict[tuple[str, str], list[int]]
+    untriggered_rules: list[int]
+
+    def __init__(self, rules: list[dict[str, typing.Any]]) -> None:
+        self.categories = []
+        self.always = []
+        self.component_rules = {}
+        self.tag_rules = {}
+        self.compound_rules = {}
+        self.compound_triggers = {}
+        self.untriggered_rules = []
+
+        for index, rule in enumerate(rules):
+            if not isinstance(rule, dict) or "category" not in rule:
+                raise CategoryRuleException(f"Rule is missing a category: {rule}")
+            self.categories.append(str(rule["category"]))
+
+            condition = {key: value for key, value in rule.items() if key != "category"}
+            if len(condition) == 0:
+                self.always.append(index)
+            elif list(condition) == ["component"]:
+                self.component_rules.setdefault(str(condition["component"]), []).append(
+                    index
+                )
+            elif list(condition) == ["tag"]:
+                self.tag_rules.setdefault(str(condition["tag"]), []).append(index)
+            else:
+                predicate, triggers = _compile_condition(condition)
+                self.compound_rules[index] = predicate
+                if triggers is None:
+                    self.untriggered_rules.append(index)
+                else:
+                    for trigger in triggers:
+                        self.compound_triggers.setdefault(trigger, []).append(index)
+
+    @staticmethod
+    def load(path: str = DEFAULT_CATEGORY_RULES_PATH) -> "CategoryRules":
+        with open(path, "r") as f:
+            rules = YAML(typ="safe").load(f)
+        if rules is None:
+            rules = []
+        if not isinstance(rules, list):
+            raise CategoryRuleException(f"Expected a list of category rules in {path}")
+        return CategoryRules(rules)
+
+    # returns the categories of the entity, in the order their rules were declared
+    def match(self, entity: EntityPrototype) -> list[str]:
+        components = entity.components.keys()
+        tags = set(entity.tags())
+
+        matched = set(self.always)
+        candidates = set(self.untriggered_rules)
+        for component_type in components:
+            matched.update(self.component_rules.get(component_type, ()))
+            candidates.update(
+                self.compound_triggers.get(("component", component_type), ())
+            )
+        for tag in tags:
+            matched.update(self.tag_rules.get(tag, ()))
+            candidates.update(self.compound_triggers.get(("tag", tag), ()))
+
+        for index in candidates:
+            if self.compound_rules[index](components, tags):
+                matched.add(index)
+
+        categories: list[str] = []
+        for index in sorted(matched):
+            if self.categories[index] not in categories:
+                categories.append(self.categories[index])
+        return categories
+
+
+_default_rules: CategoryRules | None = None
+
+
+def default_category_rules() -> CategoryRules:
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = CategoryRules.load()
+    return _default_rules
@@ -0,0 +1,540 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import typing
+
+from .categories import DEFAULT_CATEGORY_RULES_PATH
+from .lists import DEFAULT_LIST_PAGES_PATH
+from .report import RunReport
+
+# pywikibot, sqlalchemy and the like are only imported by the commands that need them, so that commands working off the
+# local tree start quickly and run without a wiki configuration
+if typing.TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+    from .cache import ParseCache
+    from .entity import EntityPrototype
+    from .index import PrototypeIndex
+    from .loader import PrototypeRegistry
+    from .watch import PrototypeState
+
+log = logging.getLogger(__name__)
+
+COMMANDS = ("load", "plan", "sync", "watch")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="stargazer",
+        description="Automatic wiki synchronization of SS14 info",
+        epilog="Home: https://github.com/teamstarcup/stargazer",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    loading = argparse.ArgumentParser(add_help=False)
+    loading.add_argument("project_path", help="path to the root of the ss14 repository")
+    loading.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes used to parse prototypes (0 for one per CPU)",
+    )
+    loading.add_argument(
+        "--cache-path",
+        default=".stargazer-cache/prototypes.pickle",
+        help="file used to cache parsed prototypes between runs",
+    )
+    loading.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="parse every prototype file without reading or writing the cache",
+    )
+    loading.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="discard the existing cache and re-parse every prototype file",
+    )
+    loading.add_argument(
+        "--fast-yaml",
+        action="store_true",
+        help="parse prototypes with the libyaml-backed safe loader instead of ruamel",
+    )
+    loading.add_argument(
+        "--report", help="file to write a json report of phase timings and counters to"
+    )
+    loading.add_argument(
+        "--prometheus",
+        help="file to write the same report to in the prometheus textfile format",
+    )
+
+    # what to synchronize, shared by the commands comparing against the database
+    pages = argparse.ArgumentParser(add_help=False)
+    pages.add_argument(
+        "--since",
+        metavar="COMMIT",
+        help="only update entities declared in prototype files changed since this commit, and their descendants",
+    )
+    pages.add_argument(
+        "--categories",
+        default=DEFAULT_CATEGORY_RULES_PATH,
+        help="file of category rules for entity pages",
+    )
+    pages.add_argument(
+        "--lists",
+        default=DEFAULT_LIST_PAGES_PATH,
+        help="file of list pages to keep up to date",
+    )
+
+    syncing = argparse.ArgumentParser(add_help=False)
+    syncing.add_argument(
+        "edit_summary", help="edit summary given for every modified page"
+    )
+    syncing.add_argument(
+        "--min-delay",
+        type=float,
+        default=0.5,
+        help="shortest delay between page saves, in seconds",
+    )
+    syncing.add_argument(
+        "--max-delay",
+        type=float,
+        default=60.0,
+        help="longest delay between page saves, in seconds",
+    )
+    syncing.add_argument(
+        "--throttle-control",
+        default="throttle.ctrl",
+        help="file read at runtime to pause saving or fix the save rate",
+    )
+    syncing.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last interrupted run instead of diffing every page again",
+    )
+    syncing.add_argument(
+        "--commit-pages",
+        type=int,
+        default=50,
+        help="number of synchronized pages after which progress is committed to the database",
+    )
+    syncing.add_argument(
+        "--commit-seconds",
+        type=float,
+        default=30.0,
+        help="seconds after which progress is committed to the database regardless",
+    )
+    syncing.add_argument(
+        "--sprites",
+        action="store_true",
+        help="also upload the sprites of entities whose image changed since the last run",
+    )
+
+    commands.add_parser(
+        "load",
+        parents=[loading],
+        help="load and resolve every prototype, without touching the database or the wiki",
+    )
+
+    plan = commands.add_parser(
+        "plan",
+        parents=[loading, pages],
+        help="list the pages and segments a sync would update, using only the database",
+    )
+    plan.add_argument(
+        "-o",
+        "--output",
+        help="file to write the plan to as json, instead of printing it",
+    )
+
+    commands.add_parser(
+        "sync",
+        parents=[loading, pages, syncing],
+        help="synchronize every outdated page with the wiki",
+    )
+
+    watch = commands.add_parser(
+        "watch",
+        parents=[loading, pages, syncing],
+        help="synchronize, then keep synchronizing entities as their prototype files change",
+    )
+    watch.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll prototype files for changes instead of using inotify",
+    )
+    watch.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="seconds without further changes to wait for before synchronizing a burst of changes",
+    )
+
+    return parser
+
+
+def load(
+    args: argparse.Namespace, report: RunReport, keep_state: bool = False
+) -> tuple["PrototypeRegistry", "PrototypeState | None", "ParseCache | None"]:
+    from . import fastyaml
+    from .cache import ParseCache
+    from .loader import load_prototypes
+
+    # load prototypes of every type
+    log.info("Loading prototypes...")
+    if args.fast_yaml and not fastyaml.LIBYAML_AVAILABLE:
+        log.warning("libyaml is unavailable, falling back to the pure python loader")
+    cache = None
+    if not args.no_cache:
+        cache = ParseCache(args.cache_path, rebuild=args.rebuild_cache)
+    state = None
+    with report.phase("load"):
+        if keep_state:
+            from .watch import PrototypeState
+
+            # the parsed source of every prototype is kept around, to rebuild whichever of them change
+            state = PrototypeState(
+                args.project_path,
+                workers=args.workers,
+                cache=cache,
+                fast_yaml=args.fast_yaml,
+            )
+            registry = state.registry
+        else:
+            registry = load_prototypes(
+                args.project_path,
+                workers=args.workers,
+                cache=cache,
+                fast_yaml=args.fast_yaml,
+            )
+        if cache is not None:
+            cache.save()
+    log.info(
+        f"Loaded {len(registry)} prototypes, of which {len(registry.entities)} entity prototypes!"
+    )
+    report.count("prototypes_loaded", len(registry))
+    report.count("entities_loaded", len(registry.entities))
+    if cache is not None:
+        report.count("parse_cache_hits", cache.hits)
+        report.count("parse_cache_misses", cache.misses)
+
+    # resolve the inheritance of every type of prototype
+    log.info(f"Resolving prototype inheritance trees...")
+    with report.phase("resolve"):
+        registry.resolve()
+    log.info(f"Resolved prototype inheritances!")
+
+    return registry, state, cache
+
+
+# the entities to update, narrowed down by `--since`
+def select_entities(
+    args: argparse.Namespace, entities: dict[str, "EntityPrototype"]
+) -> dict[str, "EntityPrototype"]:
+    if args.since is None:
+        return entities
+
+    from .entity import affected_entities, with_ancestors
+    from .git import GitException, changed_files
+
+    try:
+        changed_file_paths = changed_files(
+            args.project_path, args.since, "Resources/Prototypes"
+        )
+        # entities moved to other parents or deleted since drop out of the lists of derived prototypes of their
+        # former parents, which only the old versions of the files still name
+        former = former_parents(
+            args.project_path, args.since, changed_file_paths, args.fast_yaml
+        )
+    except GitException as e:
+        log.error(e)
+        sys.exit(1)
+
+    affected = with_ancestors(
+        entities,
+        affected_entities(entities, changed_file_paths) | (former & entities.keys()),
+    )
+    log.info(
+        f"{len(changed_file_paths)} prototype files changed since {args.since}, affecting {len(affected)} entities"
+    )
+    return {entity_id: entities[entity_id] for entity_id in affected}
+
+
+def former_parents(
+    project_path: str, since: str, file_paths: set[str], fast_yaml: bool = False
+) -> set[str]:
+    """
+    Returns the ids of the parents of the entities declared in the given files as of the given commit.
+    """
+    from .git import file_at
+    from .loader import parse_prototypes
+    from .prototype import create_prototype
+
+    parents: set[str] = set()
+    for file_path in file_paths:
+        if not file_path.endswith(".yml"):
+            continue
+        content = file_at(project_path, since, file_path)
+        if content is None:
+            continue
+
+        try:
+            parsed = parse_prototypes(content, file_path, fast_yaml)
+        except Exception as e:
+            log.warning(f"Unable to parse {file_path} as of {since}: {e}")
+            continue
+
+        for obj, _ in parsed:
+            if obj["type"] == "entity":
+                parents.update(create_prototype(obj).parents)
+    return parents
+
+
+def open_session(report: RunReport) -> "Session":
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    load_dotenv()
+
+    db_host = os.environ.get("STARGAZER_DB_HOST")
+    db_port = os.environ.get("STARGAZER_DB_PORT")
+    db_user = os.environ.get("STARGAZER_DB_USER")
+    db_pass = os.environ.get("STARGAZER_DB_PASS")
+    db_name = os.environ.get("STARGAZER_DB_NAME")
+
+    # a full url (e.g. `sqlite:///stargazer.db`) takes precedence over the individual postgresql settings
+    db_url = os.environ.get(
+        "STARGAZER_DB_URL",
+        f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}",
+    )
+
+    engine = create_engine(db_url)
+    report.watch_engine(engine)
+    return Session(engine)
+
+
+def load_command(args: argparse.Namespace, report: RunReport) -> None:
+    load(args, report)
+
+
+def plan_command(args: argparse.Namespace, report: RunReport) -> None:
+    from .categories import CategoryRules
+    from .index import PrototypeIndex
+    from .lists import load_list_pages
+    from .plan import plan_pages
+
+    registry, _, _ = load(args, report)
+    with report.phase("index"):
+        index = PrototypeIndex(registry.entities)
+    entities = select_entities(args, registry.entities)
+
+    planned = plan_pages(
+        open_session(report),
+        entities,
+        registry.entities,
+        index,
+        load_list_pages(args.lists),
+        CategoryRules.load(args.categories),
+        report,
+    )
+    log.info(f"{len(planned)} pages would be updated")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(planned, f, indent=2, sort_keys=True)
+    else:
+        for page_name in sorted(planned):
+            print(f"{page_name}: {', '.join(planned[page_name])}")
+
+
+def sync_command(args: argparse.Namespace, report: RunReport) -> None:
+    import pywikibot
+
+    from .categories import CategoryRules
+    from .index import PrototypeIndex
+    from .lists import load_list_pages
+    from .rsi import RsiIndex
+    from .throttle import WriteScheduler, disable_write_delay
+    from .updaters import EntityUpdater, ListUpdater, SpriteUpdater
+
+    session = open_session(report)
+
+    report.watch_http(pywikibot.comms.http.session)
+    site: pywikibot.site.BaseSite = pywikibot.Site("en", "starcup")
+    # saves are paced by the write scheduler instead of pywikibot's fixed write delay
+    disable_write_delay(site, read_delay=2)
+    scheduler = WriteScheduler(
+        min_delay=args.min_delay,
+        max_delay=args.max_delay,
+        control_path=args.throttle_control,
+    )
+
+    def sync(
+        entities: dict[str, "EntityPrototype"],
+        all_entities: dict[str, "EntityPrototype"],
+        index: PrototypeIndex,
+        resume: bool = False,
+    ) -> None:
+        log.info(f"Updating entities...")
+        entity_updater = EntityUpdater(
+            session,
+            site,
+            args.edit_summary,
+            scheduler,
+            report,
+            entities=entities,
+            index=index,
+        )
+        entity_updater.category_rules = CategoryRules.load(args.categories)
+        entity_updater.resume = resume
+        entity_updater.commit_interval = args.commit_pages
+        entity_updater.commit_seconds = args.commit_seconds
+        entity_updater.run()
+
+        log.info(f"Updating list pages...")
+        list_updater = ListUpdater(
+            session,
+            site,
+            args.edit_summary,
+            scheduler,
+            report,
+            entities=all_entities,
+            index=index,
+        )
+        list_updater.list_pages = load_list_pages(args.lists)
+        list_updater.run()
+
+        if args.sprites:
+            # numpy and Pillow are only loaded by runs compositing sprites
+            from . import composite
+            from .composite import SpriteCompositor
+
+            log.info(f"Updating sprites...")
+            rsi_index = RsiIndex(
+                f"{args.project_path}/Resources/Textures",
+                (
+                    None
+                    if args.no_cache
+                    else os.path.join(os.path.dirname(args.cache_path), "rsi.pickle")
+                ),
+                rebuild=args.rebuild_cache,
+            )
+            compositor = None
+            if composite.COMPOSITING_AVAILABLE:
+                compositor = SpriteCompositor(
+                    f"{args.project_path}/Resources/Textures",
+                    os.path.join(os.path.dirname(args.cache_path), "composites"),
+                    rsi_index,
+                )
+            else:
+                log.warning(
+                    "numpy or Pillow is unavailable, skipping entities with layered sprites"
+                )
+            sprite_updater = SpriteUpdater(
+                session,
+                site,
+                args.edit_summary,
+                args.project_path,
+                scheduler,
+                report,
+                rsi_index=rsi_index,
+                compositor=compositor,
+            )
+            sprite_updater.prepare(entities=entities)
+            sprite_updater.run()
+
+    registry, state, cache = load(args, report, keep_state=args.command == "watch")
+
+    # list pages and derived prototypes are built from every entity, even when only some of them are updated
+    with report.phase("index"):
+        index = PrototypeIndex(registry.entities)
+
+    sync(
+        select_entities(args, registry.entities),
+        registry.entities,
+        index,
+        resume=args.resume,
+    )
+
+    if state is None:
+        return
+
+    from .entity import with_ancestors
+    from .watch import create_watcher, wait_for_changes
+
+    watcher = create_watcher(state.prototypes_path, poll=args.poll)
+    log.info(f"Watching {state.prototypes_path} for changes...")
+    # entities still to be updated, kept across failed syncs until one succeeds
+    pending: set[str] = set()
+    try:
+        while True:
+            changed_fpaths = wait_for_changes(watcher, args.debounce)
+            with report.phase("watch_resolve"):
+                pending |= state.update(changed_fpaths)
+                if cache is not None:
+                    cache.save()
+            report.count("watch_updates")
+
+            all_entities = state.registry.entities
+            # entities deleted since a failed sync have nothing left to update
+            pending &= all_entities.keys()
+            if len(pending) == 0:
+                continue
+
+            with report.phase("index"):
+                index = PrototypeIndex(all_entities)
+            # the ancestors of changed entities are updated too, for their lists of derived prototypes
+            affected = with_ancestors(all_entities, pending)
+            try:
+                sync(
+                    {entity_id: all_entities[entity_id] for entity_id in affected},
+                    all_entities,
+                    index,
+                )
+            except Exception:
+                # a watcher is meant to keep running through wiki and database outages, so the same entities are
+                # tried again along with the next batch of changes
+                log.exception(
+                    f"Failed to update {len(affected)} entities, retrying after the next change"
+                )
+                report.count("watch_failures")
+                session.rollback()
+                continue
+            pending.clear()
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
+    finally:
+        watcher.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    # runs from before there were subcommands gave just the project path and edit summary, which still means a sync
+    if len(argv) > 0 and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv = ["sync", *argv]
+
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level=logging.DEBUG,
+        stream=sys.stdout,
+    )
+
+    report = RunReport()
+    try:
+        if args.command == "load":
+            load_command(args, report)
+        elif args.command == "plan":
+            plan_command(args, report)
+        else:
+            sync_command(args, report)
+    finally:
+        if args.report is not None:
+            report.write_json(args.report)
+        if args.prometheus is not None:
+            report.write_prometheus(args.prometheus)
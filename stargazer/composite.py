@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import os
+import typing
+from dataclasses import dataclass
+
+from .rsi import RsiIndex
+
+try:
+    import numpy
+    from PIL import Image
+
+    COMPOSITING_AVAILABLE = True
+except ImportError:
+    COMPOSITING_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+# world units are converted to sprite pixels at the engine's scale
+PIXELS_PER_METER = 32
+
+# the named colors most used by prototypes, anything else has to be written in hex
+NAMED_COLORS = {
+    "white": "#FFFFFF",
+    "black": "#000000",
+    "red": "#FF0000",
+    "green": "#00FF00",
+    "blue": "#0000FF",
+    "yellow": "#FFFF00",
+    "orange": "#FFA500",
+    "purple": "#800080",
+    "cyan": "#00FFFF",
+    "magenta": "#FF00FF",
+    "gray": "#808080",
+    "grey": "#808080",
+    "brown": "#A52A2A",
+    "pink": "#FFC0CB",
+    "transparent": "#00000000",
+}
+
+Color = tuple[float, float, float, float]
+WHITE: Color = (1.0, 1.0, 1.0, 1.0)
+
+
+@dataclass(frozen=True, slots=True)
+class SpriteLayer:
+    # `Objects/Fun/toys.rsi/plushie.png` for a state, or the path of a plain texture, relative to the textures directory
+    path: str
+    color: Color = WHITE
+    # in pixels, with y pointing down
+    offset: tuple[int, int] = (0, 0)
+
+
+def parse_color(value: typing.Any) -> Color:
+    text = NAMED_COLORS.get(str(value).lower(), str(value))
+    digits = text.lstrip("#")
+    if not text.startswith("#") or len(digits) not in (6, 8):
+        raise ValueError(f"Unsupported color: {value}")
+    channels = [int(digits[i : i + 2], 16) / 255 for i in range(0, len(digits), 2)]
+    if len(channels) == 3:
+        channels.append(1.0)
+    return channels[0], channels[1], channels[2], channels[3]
+
+
+def _texture_path(path: typing.Any) -> str:
+    # prototypes refer to textures both relative to the textures directory and from the resources root
+    normalized = str(path).replace("\\", "/")
+    return normalized.removeprefix("/Textures/").lstrip("/")
+
+
+def layers_from_component(
+    sprite_component: typing.Mapping[str, typing.Any],
+) -> tuple[SpriteLayer, ...]:
+    """
+    Reads the visible layers of a sprite component, bottom first. Layers without an rsi of their own draw from the
+    component's rsi, and the component's color tints every layer on top of their own.
+    """
+    base_rsi = sprite_component.get("sprite")
+    try:
+        base_color = parse_color(sprite_component.get("color", "#FFFFFF"))
+    except ValueError as e:
+        log.warning(e)
+        base_color = WHITE
+
+    layers = []
+    for layer in sprite_component.get("layers") or []:
+        if not isinstance(layer, dict) or layer.get("visible", True) is False:
+            continue
+
+        if "texture" in layer:
+            path = _texture_path(layer["texture"])
+        elif "state" in layer and (layer.get("sprite") or base_rsi):
+            path = (
+                f'{_texture_path(layer.get("sprite") or base_rsi)}/{layer["state"]}.png'
+            )
+        else:
+            # layers only filled in at runtime, such as those mapped to visualizer keys
+            continue
+
+        try:
+            color = parse_color(layer.get("color", "#FFFFFF"))
+        except ValueError as e:
+            log.warning(e)
+            color = WHITE
+        color = (
+            color[0] * base_color[0],
+            color[1] * base_color[1],
+            color[2] * base_color[2],
+            color[3] * base_color[3],
+        )
+
+        offset = (0, 0)
+        raw_offset = layer.get("offset")
+        if isinstance(raw_offset, str) and "," in raw_offset:
+            x, y = (float(part) for part in raw_offset.split(",", 1))
+            offset = (round(x * PIXELS_PER_METER), round(-y * PIXELS_PER_METER))
+
+        layers.append(SpriteLayer(path, color, offset))
+    return tuple(layers)
+
+
+# names the composite by what it is made of rather than by the contents of its sources, so the file on the wiki
+# stays the same when a source sprite is redrawn
+def composite_file_id(layers: tuple[SpriteLayer, ...]) -> str:
+    digest = hashlib.sha1(repr(layers).encode()).hexdigest()[:12]
+    name = os.path.basename(os.path.dirname(layers[0].path)) or os.path.basename(
+        layers[0].path
+    )
+    return f"{name} (composite, {digest}).png"
+
+
+class SpriteCompositor:
+    """
+    Flattens layered sprites into single images, caching every composite under a hash of its layers and the contents
+    of their source images. Identical composites are only rendered once per run, and are reused across runs for as
+    long as none of their sources change.
+    """
+
+    textures_path: str
+    cache_path: str
+    rsi_index: RsiIndex
+    rendered: int
+    reused: int
+
+    def __init__(self, textures_path: str, cache_path: str, rsi_index: RsiIndex):
+        if not COMPOSITING_AVAILABLE:
+            raise Exception("Compositing sprites requires numpy and Pillow")
+
+        self.textures_path = textures_path
+        self.cache_path = cache_path
+        self.rsi_index = rsi_index
+        self.rendered = 0
+        self.reused = 0
+        self._source_hashes: dict[str, str | None] = {}
+        self._composites: dict[tuple[SpriteLayer, ...], str | None] = {}
+
+    def _source_hash(self, path: str) -> str | None:
+        if path not in self._source_hashes:
+            try:
+                with open(os.path.join(self.textures_path, path), "rb") as f:
+                    self._source_hashes[path] = hashlib.sha1(f.read()).hexdigest()
+            except OSError as e:
+                log.warning(f"Unable to read sprite layer {path} ({e})")
+                self._source_hashes[path] = None
+        return self._source_hashes[path]
+
+    # returns the path of the flattened image, or None if any of its layers is unreadable
+    def composite(self, layers: tuple[SpriteLayer, ...]) -> str | None:
+        if layers in self._composites:
+            return self._composites[layers]
+
+        key = hashlib.sha1(repr(layers).encode())
+        for layer in layers:
+            source_hash = self._source_hash(layer.path)
+            if source_hash is None:
+                self._composites[layers] = None
+                return None
+            key.update(source_hash.encode())
+
+        output_path = os.path.join(self.cache_path, f"{key.hexdigest()}.png")
+        if os.path.exists(output_path):
+            self.reused += 1
+        else:
+            try:
+                image = self._render(layers)
+            except (OSError, ValueError) as e:
+                log.warning(f"Unable to composite {layers[0].path} ({e})")
+                self._composites[layers] = None
+                return None
+
+            os.makedirs(self.cache_path, exist_ok=True)
+            temp_path = f"{output_path}.tmp"
+            image.save(temp_path, format="PNG")
+            os.replace(temp_path, output_path)
+            self.rendered += 1
+
+        self._composites[layers] = output_path
+        return output_path
+
+    # the first frame of the south facing direction of a state, or the whole of a plain texture
+    def _frame(self, path: str) -> "numpy.ndarray":
+        with Image.open(os.path.join(self.textures_path, path)) as source:
+            image = source.convert("RGBA")
+        if ".rsi/" in path:
+            meta = self.rsi_index.get(os.path.dirname(path))
+            if meta is not None:
+                image = image.crop((0, 0, meta.size[0], meta.size[1]))
+        return numpy.asarray(image, dtype=numpy.float32) / 255
+
+    def _render(self, layers: tuple[SpriteLayer, ...]) -> "Image.Image":
+        frames = [self._frame(layer.path) for layer in layers]
+
+        # every layer is centered on the sprite before being offset, the canvas covers all of them
+        positions = [
+            (
+                layer.offset[0] - frame.shape[1] // 2,
+                layer.offset[1] - frame.shape[0] // 2,
+            )
+            for layer, frame in zip(layers, frames)
+        ]
+        left = min(x for x, _ in positions)
+        top = min(y for _, y in positions)
+        width = max(x + frame.shape[1] for (x, _), frame in zip(positions, frames))
+        height = max(y + frame.shape[0] for (_, y), frame in zip(positions, frames))
+
+        # blend with premultiplied alpha, so each layer is a single multiply-add over the whole canvas
+        canvas = numpy.zeros((height - top, width - left, 4), dtype=numpy.float32)
+        for layer, frame, (x, y) in zip(layers, frames, positions):
+            source = frame * numpy.asarray(layer.color, dtype=numpy.float32)
+            source[..., :3] *= source[..., 3:]
+
+            region = canvas[
+                y - top : y - top + frame.shape[0], x - left : x - left + frame.shape[1]
+            ]
+            region *= 1 - source[..., 3:]
+            region += source
+
+        alpha = canvas[..., 3:]
+        numpy.divide(canvas[..., :3], alpha, out=canvas[..., :3], where=alpha > 0)
+        pixels = numpy.clip(canvas * 255 + 0.5, 0, 255).astype(numpy.uint8)
+        return Image.fromarray(pixels, "RGBA")
@@ -1,94 +1,99 @@
+import sys
 import typing
-from glob import glob
-from ruamel.yaml import YAML
-from .meta import PrototypeMeta
+from collections import ChainMap
+from .prototype import Prototype, register_prototype
 
 import logging
 
 log = logging.getLogger(__name__)
 
 
+# the plain dicts a component is made of, most specific first
+def _layers(
+    component: typing.Mapping[str, typing.Any],
+) -> list[typing.MutableMapping[str, typing.Any]]:
+    if isinstance(component, ChainMap):
+        return component.maps
+    return [typing.cast(dict[str, typing.Any], component)]
+
+
 class EntityPrototypeUnresolvedException(BaseException):
     pass
 
 
-class EntityPrototype:
-    id: str = ""
-    abstract: bool = False
-    parents: list[str]
-    type: str = "entity"
-    name: str = ""
-    description: str = ""
-    categories: list[str]
-    components: dict[str, dict]
-    meta: PrototypeMeta
-
-    _resolved = False
+def _intern_component(component: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    # field names repeat across thousands of prototypes, interning them leaves a single copy of each
+    return {
+        sys.intern(key) if type(key) is str else key: value
+        for key, value in component.items()
+    }
 
-    def __init__(self, d: dict):
-        self.parents = []
-        self.categories = []
-        self.components = {}
-        self.meta = PrototypeMeta()
 
-        for key, value in d.items():
-            if key == "parent":
-                key = "parents"
+@register_prototype("entity")
+class EntityPrototype(Prototype):
+    """
+    An entity prototype. Components inherited from parents are not copied, they are layered over the parent's own
+    component data, so a child only stores the fields it sets itself. Component data must therefore never be modified
+    in place.
+    """
 
-                # ensure list of strings when only one parent is present
-                if type(value) is str:
-                    value = [value]
+    __slots__ = ("name", "description", "suffix", "categories", "components")
 
-            if key == "components":
-                for component in value:
-                    component_type = component["type"]
-                    self.components[component_type] = component
-                continue
+    name: str
+    description: str
+    suffix: str
+    categories: list[str]
+    components: dict[str, typing.Mapping[str, typing.Any]]
 
+    def __init__(self, d: dict):
+        self.name = ""
+        self.description = ""
+        self.suffix = ""
+        self.categories = []
+        self.components = {}
+        super().__init__(d)
+        self.type = "entity"
+
+    def set_field(self, key: str, value: typing.Any) -> None:
+        if key == "components":
+            for component in value:
+                component_type = sys.intern(component["type"])
+                self.components[component_type] = _intern_component(component)
+        elif key in EntityPrototype.__slots__:
             setattr(self, key, value)
+        else:
+            super().set_field(key, value)
 
-    # resolve inheritance tree and copy over undefined attributes
-    def resolve(self, resolver: dict[str, typing.Any]) -> None:
-        if self._resolved:
+    # layer undefined attributes over those of a parent whose own inheritance has already been resolved
+    def inherit(self, parent_proto: Prototype) -> None:
+        super().inherit(parent_proto)
+        if not isinstance(parent_proto, EntityPrototype):
             return
 
-        parent_lookup_queue = list(self.parents)
-        for parent in parent_lookup_queue:
-            if parent not in resolver:
-                log.warning(f"Unable to find parent {parent} for entity {self.id}")
-                continue
-
-            # log.debug(f'Searching parent: {parent}')
-            parent_proto = resolver[parent]
-
-            # copy over unset properties from this parent
-            if self.name == "" and parent_proto.name is not None:
-                self.name = parent_proto.name
-            if self.description == "" and parent_proto.description is not None:
-                self.description = parent_proto.description
-
-            # copy over inherited components while generally preserving their order of declaration
-            for component_type, parent_component in parent_proto.components.items():
-                # copy over attributes only if they have not been set
-                if component_type in self.components:
-                    existing_component = self.components[component_type]
-
-                    # copy over inherited component fields
-                    for key, value in parent_component.items():
-                        if key in existing_component:
-                            continue
-                        existing_component[key] = value
-                else:
-                    # this component is new to us, copy it over directly
-                    self.components[parent_component["type"]] = parent_component
-
-            # search parent prototypes recursively
-            for super_parent in parent_proto.parents:
-                # log.debug(f'Appending parent {super_parent} from parent {parent}')
-                parent_lookup_queue.append(super_parent)
-
-        self._resolved = True
-        return
+        if self.name == "" and parent_proto.name is not None:
+            self.name = parent_proto.name
+        if self.description == "" and parent_proto.description is not None:
+            self.description = parent_proto.description
+
+        # share inherited components while generally preserving their order of declaration
+        for component_type, parent_component in parent_proto.components.items():
+            if component_type in self.components:
+                # fields already set win over the parent's, keep the chain flat so lookups never recurse
+                existing_component = self.components[component_type]
+                if existing_component is parent_component:
+                    continue
+                layers = _layers(existing_component)
+                # with several parents sharing an ancestor, its layers already came through the first of them
+                inherited = [
+                    layer
+                    for layer in _layers(parent_component)
+                    if not any(layer is existing for existing in layers)
+                ]
+                if len(inherited) > 0:
+                    self.components[component_type] = ChainMap(*layers, *inherited)
+            else:
+                # this component is new to us, it is shared as-is since component data is never modified
+                self.components[component_type] = parent_component
 
     """
     Returns a boolean if the entity prototype has the given component defined
@@ -136,51 +141,53 @@ class EntityPrototype:
         return ""
 
 
-class LineNumberNotFoundException(Exception):
-    pass
-
-
-def get_line_number_for_yaml_key_value(haystack: str, key: str, value: str) -> int:
-    for line_number, straw in enumerate(haystack.split("\n")):
-        # remove trailing comments and whitespace
-        straw = straw.split("#")[0].strip()
-        if straw.startswith(f"{key}:") and straw.endswith(f" {value}"):
-            return line_number + 1
-    raise LineNumberNotFoundException()
-
-
-def load_entities(base_path: str) -> dict[str, EntityPrototype]:
-    resources_path = f"{base_path}/Resources"
-
-    entities: dict[str, EntityPrototype] = {}
-    for fpath in glob(resources_path + "/Prototypes/**/*.yml", recursive=True):
-        with open(fpath, "rb") as f:
-            # decoded as utf-8-sig to cope with sporadic byte order-marks on files
-            content = f.read().decode("utf-8-sig")
-
-            objects: list[dict[str, typing.Any]] = YAML().load(content)
+def build_children_index(entities: dict[str, EntityPrototype]) -> dict[str, list[str]]:
+    children: dict[str, list[str]] = {}
+    for entity_id, entity in entities.items():
+        for parent in entity.parents:
+            children.setdefault(parent, []).append(entity_id)
+    return children
 
-            # check for empty file
-            if objects is None:
-                continue
 
-            for obj in objects:
-                if obj["type"] != "entity":
-                    continue
-
-                proto = EntityPrototype(obj)
-                proto.meta.file_path = fpath.replace(f"{base_path}/", "").replace(
-                    "\\", "/"
-                )
-                try:
-                    proto.meta.line_number = get_line_number_for_yaml_key_value(
-                        content, "id", proto.id
-                    )
-                except LineNumberNotFoundException:
-                    log.warning(
-                        f"Failed to find declaration line number for entity prototype {proto.id} in "
-                        f"file {proto.meta.file_path}"
-                    )
-                entities[proto.id] = proto
-
-    return entities
+def affected_entities(
+    entities: dict[str, EntityPrototype], changed_file_paths: set[str]
+) -> set[str]:
+    """
+    Returns the ids of the entities declared in any of the given files, along with all of their descendants, whose
+    inherited names, descriptions or components may have changed as a result.
+    """
+    children = build_children_index(entities)
+    affected = {
+        entity_id
+        for entity_id, entity in entities.items()
+        if entity.meta.file_path in changed_file_paths
+    }
+
+    queue = list(affected)
+    while len(queue) > 0:
+        for child in children.get(queue.pop(), []):
+            if child not in affected:
+                affected.add(child)
+                queue.append(child)
+
+    return affected
+
+
+def with_ancestors(
+    entities: dict[str, EntityPrototype], entity_ids: set[str]
+) -> set[str]:
+    """
+    Returns the given entity ids along with the ids of all of their ancestors, whose lists of derived prototypes may
+    have changed along with them.
+    """
+    found = set(entity_ids)
+    queue = list(entity_ids)
+    while len(queue) > 0:
+        entity_id = queue.pop()
+        if entity_id not in entities:
+            continue
+        for parent in entities[entity_id].parents:
+            if parent in entities and parent not in found:
+                found.add(parent)
+                queue.append(parent)
+    return found
@@ -0,0 +1,122 @@
+import re
+import typing
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as _SafeLoader
+
+    LIBYAML_AVAILABLE = True
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader  # type: ignore[assignment]
+
+    LIBYAML_AVAILABLE = False
+
+BOOL_TAG = "tag:yaml.org,2002:bool"
+INT_TAG = "tag:yaml.org,2002:int"
+FLOAT_TAG = "tag:yaml.org,2002:float"
+MERGE_TAG = "tag:yaml.org,2002:merge"
+VALUE_TAG = "tag:yaml.org,2002:value"
+
+
+class PrototypeLoader(_SafeLoader):
+    """
+    A safe (and, where libyaml is available, C-accelerated) loader which produces plain dicts and lists.
+
+    PyYAML implements YAML 1.1, whereas ruamel loads prototypes as YAML 1.2; the implicit resolvers for booleans,
+    integers and floats are replaced below so both loaders agree that `yes`, `on` or `1:20` are strings and that `010`
+    is ten.
+    """
+
+    pass
+
+
+# drop the YAML 1.1 resolvers for the types whose syntax differs in YAML 1.2, along with the one for the value key `=`,
+# which PyYAML resolves but has no constructor for, where ruamel leaves it a string
+PrototypeLoader.yaml_implicit_resolvers = {
+    first: [
+        (tag, regexp)
+        for tag, regexp in resolvers
+        if tag not in (BOOL_TAG, INT_TAG, FLOAT_TAG, VALUE_TAG)
+    ]
+    for first, resolvers in _SafeLoader.yaml_implicit_resolvers.items()
+}
+
+# the YAML 1.2 core schema, as implemented by ruamel
+PrototypeLoader.add_implicit_resolver(
+    BOOL_TAG,
+    re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"),
+    list("tTfF"),
+)
+PrototypeLoader.add_implicit_resolver(
+    INT_TAG,
+    re.compile(
+        r"""^(?:[-+]?0b[0-1_]+
+        |[-+]?0o?[0-7_]+
+        |[-+]?[0-9_]+
+        |[-+]?0x[0-9a-fA-F_]+)$""",
+        re.X,
+    ),
+    list("-+0123456789"),
+)
+PrototypeLoader.add_implicit_resolver(
+    FLOAT_TAG,
+    re.compile(
+        r"""^(?:
+         [-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+]?[0-9]+)?
+        |[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)
+        |[-+]?\.[0-9_]+(?:[eE][-+][0-9]+)?
+        |[-+]?\.(?:inf|Inf|INF)
+        |\.(?:nan|NaN|NAN))$""",
+        re.X,
+    ),
+    list("-+0123456789."),
+)
+
+
+def _construct_yaml12_int(loader: PrototypeLoader, node: yaml.ScalarNode) -> int:
+    value = str(loader.construct_scalar(node)).replace("_", "")
+
+    sign = 1
+    if value[0] == "-":
+        sign = -1
+    if value[0] in "+-":
+        value = value[1:]
+
+    if value.startswith("0b"):
+        return sign * int(value[2:], 2)
+    if value.startswith("0x"):
+        return sign * int(value[2:], 16)
+    if value.startswith("0o"):
+        return sign * int(value[2:], 8)
+    return sign * int(value)
+
+
+PrototypeLoader.add_constructor(INT_TAG, _construct_yaml12_int)
+
+
+# merge keys are resolved before mappings are constructed, so this only constructs a `<<` found anywhere else
+def _construct_merge_scalar(loader: PrototypeLoader, node: yaml.ScalarNode) -> str:
+    return str(loader.construct_scalar(node))
+
+
+PrototypeLoader.add_constructor(MERGE_TAG, _construct_merge_scalar)
+
+
+# SS14 uses local tags such as `!type:DamageTrigger` to select the concrete type of polymorphic data fields; stargazer
+# only needs the data itself, so tagged nodes are constructed as if they were untagged
+def _construct_local_tag(
+    loader: PrototypeLoader, tag_suffix: str, node: yaml.Node
+) -> typing.Any:
+    if isinstance(node, yaml.MappingNode):
+        return loader.construct_mapping(node, deep=True)
+    if isinstance(node, yaml.SequenceNode):
+        return loader.construct_sequence(node, deep=True)
+    return loader.construct_scalar(typing.cast(yaml.ScalarNode, node))
+
+
+PrototypeLoader.add_multi_constructor("!", _construct_local_tag)
+
+
+def load(content: str) -> typing.Any:
+    return yaml.load(content, Loader=PrototypeLoader)
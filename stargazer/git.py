@@ -0,0 +1,61 @@
+import subprocess
+
+
+class GitException(Exception):
+    pass
+
+
+def changed_files(repo_path: str, since: str, pathspec: str = ".") -> set[str]:
+    """
+    Returns the paths, relative to `repo_path`, of files which were added, modified or deleted since the given commit,
+    including uncommitted changes in the working tree.
+    """
+    try:
+        result = subprocess.run(
+            [
+                "git",
+                "-C",
+                repo_path,
+                "diff",
+                "--name-only",
+                "--no-renames",
+                "--relative",
+                since,
+                "--",
+                pathspec,
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None) or str(e)
+        raise GitException(f"Unable to list files changed since {since}: {stderr}")
+
+    return {line for line in result.stdout.splitlines() if line != ""}
+
+
+def file_at(repo_path: str, commit: str, path: str) -> str | None:
+    """
+    Returns the content of the file at `path`, relative to `repo_path`, as of the given commit, or None if it did not
+    exist then.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_path, "cat-file", "-e", f"{commit}:./{path}"],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            return None
+
+        result = subprocess.run(
+            ["git", "-C", repo_path, "show", f"{commit}:./{path}"],
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None) or str(e)
+        raise GitException(f"Unable to read {path} as of {commit}: {stderr}")
+
+    # decoded as utf-8-sig, like the files in the working tree
+    return result.stdout.decode("utf-8-sig")
@@ -0,0 +1,150 @@
+import typing
+
+from .entity import EntityPrototype
+
+QUERY_KEYS = ("component", "tag", "parent", "file", "all", "any", "not")
+
+
+class PrototypeQueryException(Exception):
+    pass
+
+
+class PrototypeIndex:
+    """
+    Inverted indexes over resolved entity prototypes, mapping component types (inherited ones included), tags, direct
+    parents and source files to the ids of the entities they belong to. Every lookup returns a frozenset, so lookups
+    combine with the usual set operators, e.g. `index.component("Food") & index.tag("Trash")`.
+    """
+
+    ids: frozenset[str]
+    components: dict[str, frozenset[str]]
+    tags: dict[str, frozenset[str]]
+    children: dict[str, frozenset[str]]
+    files: dict[str, frozenset[str]]
+    # every prototype inheriting from a prototype, directly or not
+    descendant_sets: dict[str, frozenset[str]]
+
+    def __init__(self, entities: dict[str, EntityPrototype]) -> None:
+        components: dict[str, set[str]] = {}
+        tags: dict[str, set[str]] = {}
+        children: dict[str, set[str]] = {}
+        files: dict[str, set[str]] = {}
+
+        for entity_id, entity in entities.items():
+            for component_type in entity.components:
+                components.setdefault(component_type, set()).add(entity_id)
+            for tag in entity.tags():
+                tags.setdefault(tag, set()).add(entity_id)
+            for parent in entity.parents:
+                children.setdefault(parent, set()).add(entity_id)
+            files.setdefault(entity.meta.file_path, set()).add(entity_id)
+
+        self.ids = frozenset(entities)
+        self.components = {key: frozenset(ids) for key, ids in components.items()}
+        self.tags = {key: frozenset(ids) for key, ids in tags.items()}
+        self.children = {key: frozenset(ids) for key, ids in children.items()}
+        self.files = {key: frozenset(ids) for key, ids in files.items()}
+        self.descendant_sets = self._build_descendants()
+
+    def _build_descendants(self) -> dict[str, frozenset[str]]:
+        """
+        Builds the descendants of every prototype bottom-up, from the subtrees of its children. A prototype with a
+        single child shares that child's subtree as its descendants, and one without any shares the empty set.
+        """
+        empty: frozenset[str] = frozenset()
+        subtrees: dict[str, frozenset[str]] = {}
+        descendants: dict[str, frozenset[str]] = {}
+
+        for root in self.children:
+            if root in descendants:
+                continue
+            # iterative post-order, so deep inheritance chains don't hit the recursion limit
+            stack = [(root, False)]
+            visiting = set()
+            while len(stack) > 0:
+                prototype_id, expanded = stack.pop()
+                if prototype_id in descendants:
+                    continue
+                children = self.children.get(prototype_id, empty)
+                if not expanded:
+                    visiting.add(prototype_id)
+                    stack.append((prototype_id, True))
+                    # a child still being visited is part of an inheritance cycle, which is left out
+                    stack.extend(
+                        (child, False)
+                        for child in children
+                        if child not in descendants and child not in visiting
+                    )
+                    continue
+
+                visiting.discard(prototype_id)
+                child_subtrees = [
+                    subtrees[child] for child in children if child in subtrees
+                ]
+                if len(child_subtrees) == 0:
+                    descendants[prototype_id] = empty
+                elif len(child_subtrees) == 1:
+                    descendants[prototype_id] = child_subtrees[0]
+                else:
+                    descendants[prototype_id] = child_subtrees[0].union(
+                        *child_subtrees[1:]
+                    )
+                subtrees[prototype_id] = descendants[prototype_id] | {prototype_id}
+
+        return descendants
+
+    def component(self, component_type: str) -> frozenset[str]:
+        return self.components.get(component_type, frozenset())
+
+    def tag(self, tag: str) -> frozenset[str]:
+        return self.tags.get(tag, frozenset())
+
+    # the entities listing the given prototype among their direct parents
+    def parent(self, parent_id: str) -> frozenset[str]:
+        return self.children.get(parent_id, frozenset())
+
+    # the entities inheriting from the given prototype, directly or through other entities
+    def descendants(self, parent_id: str) -> frozenset[str]:
+        return self.descendant_sets.get(parent_id, frozenset())
+
+    def file(self, file_path: str) -> frozenset[str]:
+        return self.files.get(file_path, frozenset())
+
+    def query(self, condition: typing.Any) -> frozenset[str]:
+        """
+        Evaluates a condition written like those of category rules, with `parent` and `file` on top of `component` and
+        `tag`, e.g. `{"all": [{"component": "Food"}, {"not": {"tag": "Trash"}}]}`.
+        """
+        if not isinstance(condition, dict):
+            raise PrototypeQueryException(
+                f"Expected a condition mapping, got: {condition}"
+            )
+
+        keys = [key for key in QUERY_KEYS if key in condition]
+        if len(keys) != 1:
+            raise PrototypeQueryException(
+                f"A condition needs exactly one of {', '.join(QUERY_KEYS)}: {condition}"
+            )
+        key = keys[0]
+        value = condition[key]
+
+        if key == "component":
+            return self.component(str(value))
+        if key == "tag":
+            return self.tag(str(value))
+        if key == "parent":
+            return self.parent(str(value))
+        if key == "file":
+            return self.file(str(value))
+        if key == "not":
+            return self.ids - self.query(value)
+
+        if not isinstance(value, list) or len(value) == 0:
+            raise PrototypeQueryException(
+                f"`{key}` expects a list of conditions: {condition}"
+            )
+        # start from the smallest set, so intersections only ever shrink it further
+        results = sorted((self.query(child) for child in value), key=len)
+        if key == "all":
+            return results[0].intersection(*results[1:])
+        return results[0].union(*results[1:])
@@ -0,0 +1,118 @@
+import logging
+from datetime import datetime, timezone
+from typing import cast
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from .models import SyncRun, SyncRunPage
+
+log = logging.getLogger(__name__)
+
+SYNC_RUNS = cast(sqlalchemy.Table, SyncRun.__table__)
+SYNC_RUN_PAGES = cast(sqlalchemy.Table, SyncRunPage.__table__)
+
+
+class RunJournal:
+    """
+    Records the pages a sync run plans to update and how each of them fared, so that an interrupted run can be resumed
+    without diffing every page again. Status changes are buffered and written by `flush`, in the same transaction as
+    the segment hashes of the pages involved, leaving the commit to the caller.
+    """
+
+    session: Session
+    chunk_size: int
+    run_id: int | None
+    pending: dict[str, str]
+
+    def __init__(self, session: Session, chunk_size: int = 500) -> None:
+        self.session = session
+        self.chunk_size = chunk_size
+        self.run_id = None
+        self.pending = {}
+
+    # starts a new run planning to update the given pages, mapped to the prototype each is generated from
+    def start(self, pages: dict[str, str]) -> None:
+        # a new run supersedes any interrupted one, whose remaining pages it diffs again anyway
+        self.session.execute(
+            sqlalchemy.update(SYNC_RUNS)
+            .where(SYNC_RUNS.c.finished_at.is_(None))
+            .values(finished_at=datetime.now(timezone.utc))
+        )
+        self.run_id = self.session.execute(
+            sqlalchemy.insert(SYNC_RUNS)
+            .values(started_at=datetime.now(timezone.utc))
+            .returning(SYNC_RUNS.c.id)
+        ).scalar_one()
+
+        rows = [
+            {
+                "run_id": self.run_id,
+                "page_name": page_name,
+                "prototype_id": prototype_id,
+                "status": "pending",
+            }
+            for page_name, prototype_id in pages.items()
+        ]
+        for i in range(0, len(rows), self.chunk_size):
+            self.session.execute(
+                sqlalchemy.insert(SYNC_RUN_PAGES), rows[i : i + self.chunk_size]
+            )
+        self.session.commit()
+
+    # picks up the most recent unfinished run, returning False if there is none
+    def resume(self) -> bool:
+        self.run_id = self.session.execute(
+            sqlalchemy.select(SYNC_RUNS.c.id)
+            .where(SYNC_RUNS.c.finished_at.is_(None))
+            .order_by(SYNC_RUNS.c.id.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        return self.run_id is not None
+
+    # the pages of the run which have yet to be updated successfully, mapped to their prototypes
+    def remaining(self) -> dict[str, str]:
+        statement = sqlalchemy.select(
+            SYNC_RUN_PAGES.c.page_name, SYNC_RUN_PAGES.c.prototype_id
+        ).where(
+            SYNC_RUN_PAGES.c.run_id == self.run_id,
+            SYNC_RUN_PAGES.c.status != "done",
+        )
+        return {
+            page_name: prototype_id
+            for page_name, prototype_id in self.session.execute(statement)
+        }
+
+    def mark(self, page_name: str, status: str) -> None:
+        self.pending[page_name] = status
+
+    def flush(self) -> None:
+        if self.run_id is None or len(self.pending) == 0:
+            return
+
+        rows = [
+            {"page": page_name, "new_status": status}
+            for page_name, status in self.pending.items()
+        ]
+        self.pending = {}
+
+        statement = (
+            sqlalchemy.update(SYNC_RUN_PAGES)
+            .where(
+                SYNC_RUN_PAGES.c.run_id == self.run_id,
+                SYNC_RUN_PAGES.c.page_name == sqlalchemy.bindparam("page"),
+            )
+            .values(status=sqlalchemy.bindparam("new_status"))
+        )
+        for i in range(0, len(rows), self.chunk_size):
+            self.session.connection().execute(statement, rows[i : i + self.chunk_size])
+
+    # marks the run as finished, after which it is never resumed
+    def finish(self) -> None:
+        if self.run_id is None:
+            return
+        self.session.execute(
+            sqlalchemy.update(SYNC_RUNS)
+            .where(SYNC_RUNS.c.id == self.run_id)
+            .values(finished_at=datetime.now(timezone.utc))
+        )
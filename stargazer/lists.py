@@ -0,0 +1,46 @@
+import os
+import typing
+from dataclasses import dataclass
+
+from ruamel.yaml import YAML
+
+DEFAULT_LIST_PAGES_PATH = os.path.join(os.path.dirname(__file__), "lists.yml")
+
+LIST_FORMATS = ("list", "table")
+
+
+class ListPageException(Exception):
+    pass
+
+
+@dataclass
+class ListPage:
+    page: str
+    query: dict[str, typing.Any]
+    format: str = "list"
+
+
+def load_list_pages(path: str = DEFAULT_LIST_PAGES_PATH) -> list[ListPage]:
+    with open(path, "r") as f:
+        definitions = YAML(typ="safe").load(f)
+    if definitions is None:
+        definitions = []
+    if not isinstance(definitions, list):
+        raise ListPageException(f"Expected a list of list pages in {path}")
+
+    list_pages = []
+    for definition in definitions:
+        if not isinstance(definition, dict) or "page" not in definition:
+            raise ListPageException(f"List page is missing a page: {definition}")
+        if not isinstance(definition.get("query"), dict):
+            raise ListPageException(f"List page is missing a query: {definition}")
+
+        list_format = str(definition.get("format", "list"))
+        if list_format not in LIST_FORMATS:
+            raise ListPageException(
+                f"Unknown list format {list_format}, expected one of {', '.join(LIST_FORMATS)}"
+            )
+        list_pages.append(
+            ListPage(str(definition["page"]), definition["query"], list_format)
+        )
+    return list_pages
@@ -0,0 +1,280 @@
+import logging
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from itertools import repeat
+
+from ruamel.yaml import YAML
+from ruamel.yaml.comments import TaggedScalar
+from ruamel.yaml.scalarbool import ScalarBoolean
+
+from . import fastyaml
+from .cache import ParseCache, ParsedFile
+from .entity import EntityPrototype
+from .meta import PrototypeMeta
+from .prototype import Prototype, create_prototype, resolve_prototypes
+
+log = logging.getLogger(__name__)
+
+
+def _strip_yaml_comment(line: str) -> str:
+    if line.lstrip().startswith("#"):
+        return ""
+    comment_index = line.find(" #")
+    if comment_index != -1:
+        line = line[:comment_index]
+    return line.rstrip()
+
+
+def index_source_positions(content: str) -> list[PrototypeMeta]:
+    """
+    Records the declaration lines of every top-level prototype in a file, and of every component inside it, in a
+    single pass over its lines. Returns one PrototypeMeta per top-level sequence item, in document order.
+    """
+    positions: list[PrototypeMeta] = []
+    current: PrototypeMeta | None = None
+
+    item_indent = -1  # indent of the dashes of the top-level sequence
+    key_indent = -1  # indent of the keys of the current prototype
+    component_indent = -1  # indent of the dashes of its `components` sequence
+    component_key_indent = -1  # indent of the keys of the current component
+    component_start = -1  # first line of the current component, until its type is found
+    in_components = False
+
+    for line_number, line in enumerate(content.split("\n"), start=1):
+        line = _strip_yaml_comment(line)
+        text = line.lstrip(" ")
+        if text == "":
+            continue
+        indent = len(line) - len(text)
+        is_item = text == "-" or text.startswith("- ")
+
+        if is_item and item_indent == -1:
+            item_indent = indent
+
+        if is_item and indent == item_indent:
+            current = PrototypeMeta()
+            positions.append(current)
+            in_components = False
+            component_indent = -1
+
+            # the first key of the prototype shares its line with the dash
+            text = text[1:].lstrip(" ")
+            indent = key_indent = len(line) - len(text)
+            if text == "":
+                continue
+        elif current is None:
+            continue
+        elif in_components:
+            if indent > key_indent or (is_item and indent == key_indent):
+                if is_item and component_indent in (-1, indent):
+                    component_indent = indent
+                    text = text[1:].lstrip(" ")
+                    component_key_indent = len(line) - len(text)
+                    component_start = line_number
+                elif indent != component_key_indent or component_start == -1:
+                    continue
+
+                if text.startswith("type:"):
+                    component_type = text[len("type:") :].strip()
+                    current.component_lines.setdefault(component_type, component_start)
+                    component_start = -1
+                continue
+            in_components = False
+
+        if indent == key_indent:
+            if text.startswith("id:"):
+                current.line_number = line_number
+            elif text == "components:":
+                in_components = True
+
+    return positions
+
+
+# converts ruamel's round-trip containers and scalar subclasses into plain python objects, which are far cheaper to
+# pickle into the parse cache and back out of worker processes, and match what the fast loader produces
+def _to_plain(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict):
+        return {_to_plain(k): _to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, TaggedScalar):
+        return _to_plain(value.value)
+    if isinstance(value, ScalarBoolean):
+        return bool(value)
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return value
+
+
+def parse_prototype_file(
+    base_path: str, fpath: str, fast_yaml: bool = False
+) -> ParsedFile:
+    # runs inside worker processes when loading in parallel, so this must stay a top-level function
+    file_path = fpath.replace(f"{base_path}/", "").replace("\\", "/")
+
+    with open(fpath, "rb") as f:
+        # decoded as utf-8-sig to cope with sporadic byte order-marks on files
+        content = f.read().decode("utf-8-sig")
+
+    return parse_prototypes(content, file_path, fast_yaml)
+
+
+# parses the prototypes of a file, given its content and its path relative to the project
+def parse_prototypes(
+    content: str, file_path: str, fast_yaml: bool = False
+) -> ParsedFile:
+    objects: list[dict[str, typing.Any]]
+    if fast_yaml:
+        objects = fastyaml.load(content)
+    else:
+        objects = YAML().load(content)
+
+    # check for empty file
+    if objects is None:
+        return []
+
+    # source positions line up with the parsed objects unless the file does not use a block sequence at its top level
+    positions = index_source_positions(content)
+    positional = len(positions) == len(objects)
+
+    parsed: ParsedFile = []
+    for index, obj in enumerate(objects):
+        if not isinstance(obj, dict) or "type" not in obj or "id" not in obj:
+            log.warning(f"Skipping malformed prototype #{index} in file {file_path}")
+            continue
+
+        meta = positions[index] if positional else PrototypeMeta()
+        meta.file_path = file_path
+        if meta.line_number == -1:
+            log.warning(
+                f"Failed to find declaration line number for {obj['type']} prototype {obj['id']} in "
+                f"file {file_path}"
+            )
+        parsed.append((obj if fast_yaml else _to_plain(obj), meta))
+
+    return parsed
+
+
+class PrototypeRegistry:
+    """
+    Every prototype of a prototype tree, grouped by type. Each type's prototypes only inherit from prototypes of the
+    same type.
+    """
+
+    prototypes: dict[str, dict[str, Prototype]]
+
+    def __init__(self) -> None:
+        self.prototypes = {}
+
+    def add(self, proto: Prototype) -> None:
+        prototypes = self.prototypes.setdefault(proto.type, {})
+        if proto.id in prototypes:
+            log.warning(
+                f"{proto.type} prototype {proto.id} from {proto.meta.file_path} overrides the declaration in "
+                f"{prototypes[proto.id].meta.file_path}"
+            )
+        prototypes[proto.id] = proto
+
+    def of_type(self, type_name: str) -> dict[str, Prototype]:
+        return self.prototypes.get(type_name, {})
+
+    @property
+    def entities(self) -> dict[str, EntityPrototype]:
+        return typing.cast(dict[str, EntityPrototype], self.of_type("entity"))
+
+    def resolve(self) -> None:
+        for prototypes in self.prototypes.values():
+            resolve_prototypes(prototypes)
+
+    def __len__(self) -> int:
+        return sum(len(prototypes) for prototypes in self.prototypes.values())
+
+
+def prototype_file_paths(base_path: str) -> list[str]:
+    return sorted(glob(f"{base_path}/Resources/Prototypes/**/*.yml", recursive=True))
+
+
+def parse_prototype_files(
+    base_path: str,
+    fpaths: list[str],
+    workers: int = 1,
+    cache: ParseCache | None = None,
+    fast_yaml: bool = False,
+) -> dict[str, ParsedFile]:
+    """
+    Parses prototype files across `workers` processes (0 for one per CPU). Files which are unchanged since they were
+    stored in `cache` are not parsed at all. `fast_yaml` parses with the libyaml-backed loader from
+    `stargazer.fastyaml` instead of ruamel.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    results: dict[str, ParsedFile] = {}
+    if cache is not None:
+        for fpath in fpaths:
+            cached = cache.get(fpath)
+            if cached is not None:
+                results[fpath] = cached
+
+    stale_fpaths = [fpath for fpath in fpaths if fpath not in results]
+    parsed_files: typing.Iterable[ParsedFile]
+    if workers > 1 and len(stale_fpaths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(stale_fpaths) // (workers * 4))
+            parsed_files = list(
+                executor.map(
+                    parse_prototype_file,
+                    repeat(base_path),
+                    stale_fpaths,
+                    repeat(fast_yaml),
+                    chunksize=chunksize,
+                )
+            )
+    else:
+        parsed_files = map(
+            parse_prototype_file, repeat(base_path), stale_fpaths, repeat(fast_yaml)
+        )
+
+    for fpath, parsed in zip(stale_fpaths, parsed_files):
+        results[fpath] = parsed
+        if cache is not None:
+            cache.put(fpath, parsed)
+
+    return results
+
+
+# files are always merged in sorted path order, so when an id is declared more than once the last declaration wins
+def build_registry(
+    fpaths: list[str], results: dict[str, ParsedFile]
+) -> PrototypeRegistry:
+    registry = PrototypeRegistry()
+    for fpath in fpaths:
+        for obj, meta in results[fpath]:
+            proto = create_prototype(obj)
+            proto.meta = meta
+            registry.add(proto)
+    return registry
+
+
+def load_prototypes(
+    base_path: str,
+    workers: int = 1,
+    cache: ParseCache | None = None,
+    fast_yaml: bool = False,
+) -> PrototypeRegistry:
+    """
+    Parses every prototype file once, filling a registry with prototypes of every type. See `parse_prototype_files`
+    for the parameters.
+    """
+    fpaths = prototype_file_paths(base_path)
+    return build_registry(
+        fpaths, parse_prototype_files(base_path, fpaths, workers, cache, fast_yaml)
+    )
@@ -1,11 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 """
 An object that tracks metadata for a Prototype.
 """
 
 
-@dataclass
+@dataclass(slots=True)
 class PrototypeMeta:
     file_path: str = ""
     line_number: int = -1
+    # declaration line of each component defined directly by this prototype
+    component_lines: dict[str, int] = field(default_factory=dict)
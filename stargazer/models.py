@@ -1,4 +1,6 @@
-from sqlalchemy import Column, String
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 
 Base: type = declarative_base()
@@ -12,3 +14,39 @@ class PageSegment(Base):
 
     def __repr__(self) -> str:
         return f"<PageSegment({self.page_name})>"
+
+
+class PageRevision(Base):
+    __tablename__ = "page_revisions"
+    page_name: Column[str] | str = Column(String, primary_key=True)
+    # id of the page's latest revision when stargazer last synchronized it
+    revision_id: Column[int] | int = Column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<PageRevision({self.page_name}, {self.revision_id})>"
+
+
+class SyncRun(Base):
+    __tablename__ = "sync_runs"
+    id: Column[int] | int = Column(Integer, primary_key=True, autoincrement=True)
+    started_at: Column[datetime] | datetime = Column(DateTime, nullable=False)
+    # left empty while the run is in progress, or if it was interrupted
+    finished_at: Column[datetime] | datetime | None = Column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<SyncRun({self.id})>"
+
+
+class SyncRunPage(Base):
+    __tablename__ = "sync_run_pages"
+    run_id: Column[int] | int = Column(
+        Integer, ForeignKey("sync_runs.id", ondelete="CASCADE"), primary_key=True
+    )
+    page_name: Column[str] | str = Column(String, primary_key=True)
+    # id of the prototype the page is generated from
+    prototype_id: Column[str] | str = Column(String, nullable=False)
+    # one of `pending`, `done` or `failed`
+    status: Column[str] | str = Column(String, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SyncRunPage({self.run_id}, {self.page_name}, {self.status})>"
@@ -0,0 +1,60 @@
+from sqlalchemy.orm import Session
+
+from .categories import CategoryRules
+from .entity import EntityPrototype
+from .index import PrototypeIndex
+from .lists import ListPage
+from .report import RunReport
+from .segments import PageSegmentStore, SegmentProcessor
+from .updaters import EntityUpdater, ListUpdater
+
+
+def plan_pages(
+    session: Session,
+    entities: dict[str, EntityPrototype],
+    all_entities: dict[str, EntityPrototype],
+    index: PrototypeIndex,
+    list_pages: list[ListPage],
+    category_rules: CategoryRules | None = None,
+    report: RunReport | None = None,
+) -> dict[str, list[str]]:
+    """
+    Returns the pages a sync would update, mapped to the names of their outdated segments, by comparing generated
+    segments against the hashes in the database alone. Pages edited on the wiki since they were last synchronized are
+    not found this way, as that takes a query to the wiki.
+    """
+    if report is None:
+        report = RunReport()
+
+    lists = ListUpdater.generate_lists(list_pages, index, all_entities, report)
+    page_names = {
+        entity_id: EntityUpdater.page_name(entity_id) for entity_id in entities
+    }
+
+    store = PageSegmentStore(session)
+    with report.phase("diff"):
+        store.prefetch([*page_names.values(), *lists])
+
+        # which segments an entity page has depends on those it had before
+        segments = {
+            page_names[entity_id]: EntityUpdater.generate_segments(
+                entity, category_rules, index, store
+            )
+            for entity_id, entity in entities.items()
+        }
+        for page_name, segment in lists.items():
+            segments[page_name] = {"List": segment}
+
+        planned = {}
+        for page_name, page_segments in segments.items():
+            report.count("pages_checked")
+            outdated = [
+                segment_name
+                for segment_name, segment in page_segments.items()
+                if SegmentProcessor(
+                    page_name, segment_name, segment, store, report
+                ).should_update()
+            ]
+            if len(outdated) > 0:
+                planned[page_name] = outdated
+    return planned
@@ -0,0 +1,217 @@
+import logging
+import sys
+import typing
+from collections import deque
+
+from .meta import PrototypeMeta
+
+log = logging.getLogger(__name__)
+
+
+class Prototype:
+    """
+    A prototype of any type. Fields without a slot of their own are kept in `data`, and inherited from parents
+    wherever a prototype doesn't set them itself. Types with fields worth modelling subclass this and register
+    themselves with `register_prototype`.
+    """
+
+    __slots__ = ("id", "type", "abstract", "parents", "meta", "data", "_resolved")
+
+    id: str
+    type: str
+    abstract: bool
+    parents: list[str]
+    meta: PrototypeMeta
+    data: dict[str, typing.Any]
+    _resolved: bool
+
+    def __init__(self, d: dict):
+        self.id = ""
+        self.type = ""
+        self.abstract = False
+        self.parents = []
+        self.meta = PrototypeMeta()
+        self.data = {}
+        self._resolved = False
+
+        for key, value in d.items():
+            if key == "parent":
+                # ensure list of strings when only one parent is present
+                if type(value) is str:
+                    value = [value]
+                self.parents = [sys.intern(parent) for parent in value]
+            elif key == "id":
+                self.id = sys.intern(value)
+            elif key == "type":
+                self.type = sys.intern(value)
+            elif key == "abstract":
+                self.abstract = bool(value)
+            else:
+                self.set_field(key, value)
+
+    def set_field(self, key: str, value: typing.Any) -> None:
+        self.data[sys.intern(key)] = value
+
+    # copy over undefined fields from a parent whose own inheritance has already been resolved
+    def inherit(self, parent_proto: "Prototype") -> None:
+        for key, value in parent_proto.data.items():
+            if key not in self.data:
+                self.data[key] = value
+
+
+PROTOTYPE_CLASSES: dict[str, type[Prototype]] = {}
+
+P = typing.TypeVar("P", bound=Prototype)
+
+
+def register_prototype(type_name: str) -> typing.Callable[[type[P]], type[P]]:
+    def register(cls: type[P]) -> type[P]:
+        PROTOTYPE_CLASSES[type_name] = cls
+        return cls
+
+    return register
+
+
+def create_prototype(d: dict) -> Prototype:
+    return PROTOTYPE_CLASSES.get(d["type"], Prototype)(d)
+
+
+@register_prototype("reagent")
+class ReagentPrototype(Prototype):
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        return str(self.data.get("name", ""))
+
+    @property
+    def description(self) -> str:
+        return str(self.data.get("desc", ""))
+
+    @property
+    def physical_description(self) -> str:
+        return str(self.data.get("physicalDesc", ""))
+
+
+@register_prototype("reaction")
+class ReactionPrototype(Prototype):
+    __slots__ = ()
+
+    # reagent ids mapped to the amount consumed or produced
+    @property
+    def reactants(self) -> dict[str, typing.Any]:
+        return dict(self.data.get("reactants") or {})
+
+    @property
+    def products(self) -> dict[str, typing.Any]:
+        return dict(self.data.get("products") or {})
+
+
+@register_prototype("latheRecipe")
+class LatheRecipePrototype(Prototype):
+    __slots__ = ()
+
+    # the id of the entity prototype produced
+    @property
+    def result(self) -> str:
+        return str(self.data.get("result", ""))
+
+    @property
+    def materials(self) -> dict[str, typing.Any]:
+        return dict(self.data.get("materials") or {})
+
+
+@register_prototype("technology")
+class TechnologyPrototype(Prototype):
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        return str(self.data.get("name", ""))
+
+    @property
+    def tier(self) -> int:
+        return int(self.data.get("tier", 1))
+
+    # ids of the lathe recipes unlocked
+    @property
+    def recipe_unlocks(self) -> list[str]:
+        return list(self.data.get("recipeUnlocks") or [])
+
+
+def resolve_prototypes(
+    prototypes: typing.Mapping[str, Prototype],
+    only: typing.Collection[str] | None = None,
+) -> None:
+    """
+    Resolves the inheritance of every prototype of a single type, visiting parents before their children so that
+    each prototype is resolved exactly once, from its already-resolved parents.
+
+    A prototype's own values always win. Beyond that, parents take precedence in the order they are listed, and each
+    parent contributes everything it inherited itself, so with `parent: [A, B]` any value available through A (or
+    any of A's ancestors) wins over one from B.
+
+    Missing parents are skipped and inheritance cycles are broken, both with one diagnostic each.
+
+    Given `only`, just those prototypes are resolved, and every other prototype must already be resolved.
+    """
+    targets = prototypes.keys() if only is None else only
+    children: dict[str, list[str]] = {}
+    pending_parents: dict[str, int] = {}
+    missing_parents: dict[str, list[str]] = {}
+
+    for prototype_id in targets:
+        pending_parents[prototype_id] = 0
+        for parent in prototypes[prototype_id].parents:
+            if parent not in prototypes:
+                missing_parents.setdefault(parent, []).append(prototype_id)
+                continue
+            if parent not in targets:
+                # already resolved
+                continue
+            children.setdefault(parent, []).append(prototype_id)
+            pending_parents[prototype_id] += 1
+
+    for parent, prototype_ids in missing_parents.items():
+        log.warning(
+            f"Unable to find parent {parent} for prototypes: {', '.join(prototype_ids)}"
+        )
+
+    ready = deque(
+        prototype_id for prototype_id, count in pending_parents.items() if count == 0
+    )
+
+    def drain() -> None:
+        while len(ready) > 0:
+            prototype_id = ready.popleft()
+            prototype = prototypes[prototype_id]
+            for parent in prototype.parents:
+                if parent in prototypes and prototypes[parent]._resolved:
+                    prototype.inherit(prototypes[parent])
+            prototype._resolved = True
+
+            for child in children.get(prototype_id, []):
+                pending_parents[child] -= 1
+                if pending_parents[child] == 0:
+                    ready.append(child)
+
+    drain()
+
+    # whatever remains is either part of a cycle or descends from one
+    unresolved = sorted(
+        prototype_id
+        for prototype_id in targets
+        if not prototypes[prototype_id]._resolved
+    )
+    if len(unresolved) > 0:
+        log.error(
+            f"Inheritance cycle detected, affected prototypes: {', '.join(unresolved)}"
+        )
+
+    # break each cycle at its first member, which then only inherits from the parents resolved so far
+    for prototype_id in unresolved:
+        if prototypes[prototype_id]._resolved:
+            continue
+        pending_parents[prototype_id] = 0
+        ready.append(prototype_id)
+        drain()
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Iterator
+
+# imported by every command, including those that never touch the database
+if TYPE_CHECKING:
+    import sqlalchemy
+
+# upper bounds, in seconds, of the buckets of every latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    counts: list[int]
+    sum: float
+    count: int
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(LATENCY_BUCKETS)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        buckets = {
+            str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts)
+        }
+        buckets["+Inf"] = self.counts[-1]
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class RunReport:
+    """
+    Collects phase durations, counters and latency histograms over a run, to be written out as a JSON report and
+    optionally as a Prometheus textfile.
+    """
+
+    started_at: datetime
+    phases: dict[str, float]
+    counters: dict[str, int]
+    histograms: dict[str, Histogram]
+
+    def __init__(self) -> None:
+        self.started_at = datetime.now(timezone.utc)
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+
+    # time spent in a phase accumulates, so a phase may be entered more than once
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        self.histograms[name].observe(seconds)
+
+    def watch_engine(self, engine: "sqlalchemy.Engine") -> None:
+        import sqlalchemy
+
+        def before_cursor_execute(*args: Any) -> None:
+            self.count("db_queries")
+
+        sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+    # counts every http request made through a `requests` session, such as the one pywikibot uses for the api
+    def watch_http(self, session: Any) -> None:
+        def on_response(response: Any, *args: Any, **kwargs: Any) -> None:
+            self.count("api_requests")
+            self.observe("api_request_seconds", response.elapsed.total_seconds())
+
+        session.hooks["response"].append(on_response)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "phases": self.phases,
+            "counters": self.counters,
+            "histograms": {
+                name: histogram.to_dict() for name, histogram in self.histograms.items()
+            },
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_prometheus(self, path: str) -> None:
+        lines = [
+            "# HELP stargazer_phase_duration_seconds Time spent in each phase of the last run.",
+            "# TYPE stargazer_phase_duration_seconds gauge",
+        ]
+        for name, seconds in self.phases.items():
+            lines.append(
+                f'stargazer_phase_duration_seconds{{phase="{name}"}} {seconds}'
+            )
+
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE stargazer_{name} gauge")
+            lines.append(f"stargazer_{name} {value}")
+
+        for name, histogram in self.histograms.items():
+            lines.append(f"# TYPE stargazer_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'stargazer_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'stargazer_{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"stargazer_{name}_sum {histogram.sum}")
+            lines.append(f"stargazer_{name}_count {histogram.count}")
+
+        lines.append("# TYPE stargazer_last_run_timestamp_seconds gauge")
+        lines.append(f"stargazer_last_run_timestamp_seconds {time.time()}")
+
+        # node_exporter may read the file at any moment, so it is replaced atomically
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
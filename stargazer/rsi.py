@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import pickle
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+# bump whenever the shape of RsiMeta changes, which invalidates every existing index file
+RSI_INDEX_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class RsiMeta:
+    license: str
+    copyright: str
+    # width and height of a single frame
+    size: tuple[int, int]
+    states: frozenset[str]
+
+
+def split_sprite_path(sprite_path: str) -> tuple[str, str]:
+    # split `Objects/Fun/toys.rsi/plushie.png` into `Objects/Fun/toys.rsi` and `plushie`
+    rsi_path, file_name = os.path.split(sprite_path.replace("\\", "/"))
+    return rsi_path, os.path.splitext(file_name)[0]
+
+
+def _read_meta(meta_path: str) -> RsiMeta:
+    # a number of meta.json files in the wild start with a byte order mark
+    with open(meta_path, "r", encoding="utf-8-sig") as f:
+        meta = json.load(f)
+
+    size = meta.get("size") or {}
+    return RsiMeta(
+        license=str(meta.get("license") or ""),
+        copyright=str(meta.get("copyright") or ""),
+        size=(int(size.get("x", 32)), int(size.get("y", 32))),
+        states=frozenset(str(state["name"]) for state in meta.get("states") or []),
+    )
+
+
+class RsiIndex:
+    """
+    An index of the `meta.json` of every RSI looked up, so each one is read at most once per run no matter how many of
+    its states are used. Optionally persisted to disk, with entries validated by the modification time and size of
+    their `meta.json`.
+    """
+
+    textures_path: str
+    path: str | None
+    entries: dict[str, tuple[int, int, RsiMeta | None]]
+
+    def __init__(
+        self, textures_path: str, path: str | None = None, rebuild: bool = False
+    ) -> None:
+        self.textures_path = textures_path
+        self.path = path
+        self.entries = {}
+        self._checked: dict[str, RsiMeta | None] = {}
+
+        if path is None or rebuild or not os.path.exists(path):
+            return
+
+        try:
+            with open(path, "rb") as f:
+                version, entries = pickle.load(f)
+        except Exception as e:
+            log.warning(f"Discarding unreadable rsi index {path} ({e})")
+            return
+
+        if version != RSI_INDEX_VERSION:
+            log.info(f"Discarding rsi index {path} from version {version}")
+            return
+
+        self.entries = entries
+
+    # returns the metadata of the rsi, or None if it doesn't exist or its meta.json is unreadable
+    def get(self, rsi_path: str) -> RsiMeta | None:
+        if rsi_path in self._checked:
+            return self._checked[rsi_path]
+
+        meta_path = os.path.join(self.textures_path, rsi_path, "meta.json")
+        try:
+            stat = os.stat(meta_path)
+        except OSError:
+            self._checked[rsi_path] = None
+            return None
+
+        entry = self.entries.get(rsi_path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            meta = entry[2]
+        else:
+            try:
+                meta = _read_meta(meta_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning(f"Unable to read rsi metadata {meta_path} ({e})")
+                meta = None
+            self.entries[rsi_path] = (stat.st_mtime_ns, stat.st_size, meta)
+
+        self._checked[rsi_path] = meta
+        return meta
+
+    def has_state(self, sprite_path: str) -> bool:
+        rsi_path, state = split_sprite_path(sprite_path)
+        meta = self.get(rsi_path)
+        return meta is not None and state in meta.states
+
+    # writes the index back to disk, dropping entries for rsis that were not looked up during this run
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        entries = {
+            rsi_path: entry
+            for rsi_path, entry in self.entries.items()
+            if rsi_path in self._checked
+        }
+
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(
+                (RSI_INDEX_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temp_path, self.path)
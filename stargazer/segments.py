@@ -1,85 +1,281 @@
-from typing import cast
+import re
+import typing
+from dataclasses import dataclass
+from typing import Iterable, cast
 from hashlib import sha256
 
-import pywikibot
 import sqlalchemy
-from sqlalchemy import ColumnElement
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
-from .models import PageSegment
+from .models import PageRevision, PageSegment
+from .report import RunReport
+
+if typing.TYPE_CHECKING:
+    import pywikibot
 
 AUTO_GENERATED_SEGMENT_HEADER = "<!-- Begin auto-generated segment: {} -->"
 AUTO_GENERATED_SEGMENT_FOOTER = "<!-- End auto-generated segment -->"
 
+# matches both markers, capturing the name of the segment a header begins
+SEGMENT_MARKER = re.compile(
+    r"<!-- (?:Begin auto-generated segment: (.*?)|End auto-generated segment) -->"
+)
+
+PAGE_SEGMENTS = cast(sqlalchemy.Table, PageSegment.__table__)
+PAGE_REVISIONS = cast(sqlalchemy.Table, PageRevision.__table__)
+
+
+class PageSegmentException(Exception):
+    pass
+
+
+@dataclass
+class SegmentSpan:
+    name: str
+    # from the first character of the header to just past the footer
+    start: int
+    end: int
+
+
+def parse_segments(text: str) -> dict[str, SegmentSpan]:
+    """
+    Finds every auto-generated segment on a page in a single pass over its text. Raises a PageSegmentException
+    listing every problem found if any marker is unmatched, nested or the segment it begins is declared twice, as
+    any of those leave it unclear which text a segment covers.
+    """
+    segments: dict[str, SegmentSpan] = {}
+    problems: list[str] = []
+    open_name: str | None = None
+    open_start = -1
+
+    for match in SEGMENT_MARKER.finditer(text):
+        name = match.group(1)
+        if name is not None:
+            if open_name is not None:
+                problems.append(
+                    f"segment {name} begins inside segment {open_name} at offset {match.start()}"
+                )
+            open_name = name
+            open_start = match.start()
+            continue
+
+        if open_name is None:
+            problems.append(
+                f"segment end without a beginning at offset {match.start()}"
+            )
+            continue
+        if open_name in segments:
+            problems.append(f"segment {open_name} is declared more than once")
+        else:
+            segments[open_name] = SegmentSpan(open_name, open_start, match.end())
+        open_name = None
+
+    if open_name is not None:
+        problems.append(f"segment {open_name} is never ended")
+
+    if len(problems) > 0:
+        raise PageSegmentException(", ".join(problems))
+    return segments
+
+
+def splice_segments(text: str, new_segments: dict[str, str]) -> str:
+    """
+    Replaces every given segment of the page in one splice, appending those which are not on the page yet in the
+    given order, each on a line of its own. An empty page is started with the first segment, separated from the rest
+    by blank lines.
+    """
+    if len(text) == 0:
+        first, *rest = new_segments.values()
+        return first + "\n" * 4 + "\n".join(rest)
+
+    spans = sorted(
+        (span for span in parse_segments(text).values() if span.name in new_segments),
+        key=lambda span: span.start,
+    )
+
+    parts = []
+    position = 0
+    for span in spans:
+        parts.append(text[position : span.start])
+        parts.append(new_segments[span.name])
+        position = span.end
+    parts.append(text[position:])
+
+    present = {span.name for span in spans}
+    for name, segment in new_segments.items():
+        if name in present:
+            continue
+        # the wiki strips trailing newlines from pages, so a segment would otherwise start on the last line
+        if not parts[-1].endswith("\n"):
+            parts.append("\n")
+        parts.append(segment)
+    return "".join(parts)
+
+
+class PageSegmentStore:
+    """
+    An in-memory view of the `page_segments` and `page_revisions` tables. Rows are loaded up front in a few chunked
+    queries, and changes are written back in batched upserts rather than one ORM object at a time.
+    """
+
+    session: Session
+    chunk_size: int
+    hashes: dict[tuple[str, str], str]
+    pending: dict[tuple[str, str], str]
+    revisions: dict[str, int]
+    pending_revisions: dict[str, int]
+
+    def __init__(self, session: Session, chunk_size: int = 500) -> None:
+        self.session = session
+        self.chunk_size = chunk_size
+        self.hashes = {}
+        self.pending = {}
+        self.revisions = {}
+        self.pending_revisions = {}
+
+    def prefetch(self, page_names: Iterable[str]) -> None:
+        page_names = list(page_names)
+        for i in range(0, len(page_names), self.chunk_size):
+            chunk = page_names[i : i + self.chunk_size]
+            statement = sqlalchemy.select(
+                PAGE_SEGMENTS.c.page_name,
+                PAGE_SEGMENTS.c.segment_name,
+                PAGE_SEGMENTS.c.segment_hash,
+            ).where(PAGE_SEGMENTS.c.page_name.in_(chunk))
+            for page_name, segment_name, segment_hash in self.session.execute(
+                statement
+            ):
+                self.hashes[(page_name, segment_name)] = segment_hash
+
+            revision_statement = sqlalchemy.select(
+                PAGE_REVISIONS.c.page_name, PAGE_REVISIONS.c.revision_id
+            ).where(PAGE_REVISIONS.c.page_name.in_(chunk))
+            for page_name, revision_id in self.session.execute(revision_statement):
+                self.revisions[page_name] = revision_id
+
+    def get(self, page_name: str, segment_name: str) -> str | None:
+        return self.hashes.get((page_name, segment_name))
+
+    def set(self, page_name: str, segment_name: str, segment_hash: str) -> None:
+        self.hashes[(page_name, segment_name)] = segment_hash
+        self.pending[(page_name, segment_name)] = segment_hash
+
+    def get_revision(self, page_name: str) -> int | None:
+        return self.revisions.get(page_name)
+
+    def set_revision(self, page_name: str, revision_id: int) -> None:
+        self.revisions[page_name] = revision_id
+        self.pending_revisions[page_name] = revision_id
+
+    # writes pending changes to the session, leaving the commit to the caller
+    def flush(self) -> None:
+        self._upsert(
+            PAGE_SEGMENTS,
+            PageSegment,
+            [
+                {
+                    "page_name": page_name,
+                    "segment_name": segment_name,
+                    "segment_hash": h,
+                }
+                for (page_name, segment_name), h in self.pending.items()
+            ],
+            ["page_name", "segment_name"],
+        )
+        self.pending = {}
+
+        self._upsert(
+            PAGE_REVISIONS,
+            PageRevision,
+            [
+                {"page_name": page_name, "revision_id": revision_id}
+                for page_name, revision_id in self.pending_revisions.items()
+            ],
+            ["page_name"],
+        )
+        self.pending_revisions = {}
+
+    def _upsert(
+        self,
+        table: sqlalchemy.Table,
+        model: type,
+        rows: list[dict[str, typing.Any]],
+        index_elements: list[str],
+    ) -> None:
+        dialect = self.session.get_bind().dialect.name
+        for i in range(0, len(rows), self.chunk_size):
+            chunk = rows[i : i + self.chunk_size]
+            statement: postgresql.Insert | sqlite.Insert
+            if dialect == "postgresql":
+                statement = postgresql.insert(table).values(chunk)
+            elif dialect == "sqlite":
+                statement = sqlite.insert(table).values(chunk)
+            else:
+                for row in chunk:
+                    self.session.merge(model(**row))
+                continue
+
+            self.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={
+                        column: statement.excluded[column]
+                        for column in chunk[0]
+                        if column not in index_elements
+                    },
+                )
+            )
+
 
 class SegmentProcessor:
     page_name: str
     segment_name: str
     new_segment: str
     new_hash: str
-    session: Session
-    page_segment: PageSegment | None
+    store: PageSegmentStore
 
     def __init__(
-        self, page_name: str, segment_name: str, new_segment: str, session: Session
+        self,
+        page_name: str,
+        segment_name: str,
+        new_segment: str,
+        store: PageSegmentStore,
+        report: RunReport | None = None,
     ) -> None:
         self.page_name = page_name
         self.segment_name = segment_name
         self.new_segment = new_segment
         self.new_hash = sha256(self.new_segment.encode("utf-8")).hexdigest()
-        self.session = session
-
-        statement = sqlalchemy.select(PageSegment).where(
-            sqlalchemy.and_(
-                cast(ColumnElement[bool], PageSegment.page_name == self.page_name),
-                cast(
-                    ColumnElement[bool], PageSegment.segment_name == self.segment_name
-                ),
-            )
-        )
-        self.page_segment: PageSegment = self.session.scalar(statement)
+        self.store = store
+        self.report = report if report is not None else RunReport()
 
     def should_update(self) -> bool:
-        return cast(
-            bool,
-            self.page_segment is None
-            or self.page_segment.segment_hash != self.new_hash,
-        )
+        outdated = self.store.get(self.page_name, self.segment_name) != self.new_hash
+        self.report.count("segments_checked")
+        if outdated:
+            self.report.count("segments_outdated")
+        return outdated
+
+    def saved(self) -> None:
+        self.store.set(self.page_name, self.segment_name, self.new_hash)
+        self.report.count("segments_saved")
 
     """
-    Replace the segment on the page and track the new segment state in the database.
+    Replaces the segments of every processor on the page at once. The new segment states are only tracked once `saved`
+    is called on each, after the page has actually been saved.
     """
 
-    def process(self, page: pywikibot.Page) -> None:
-        if len(page.text) == 0:
-            new_page_text = self.new_segment + "\n"
-            new_page_text += "\n"
-            new_page_text += "\n"
-            new_page_text += "\n"
-            page.text = new_page_text
-        else:
-            try:
-                page.text = SegmentProcessor.replace_segment(
-                    page.text, self.segment_name, self.new_segment
-                )
-            except ValueError:
-                page.text += self.new_segment
-
-        if self.page_segment is None:
-            self.page_segment = PageSegment()
-            self.page_segment.page_name = self.page_name
-            self.page_segment.segment_name = self.segment_name
-            self.page_segment.segment_hash = self.new_hash
-            self.session.add(self.page_segment)
-        else:
-            self.page_segment.segment_hash = self.new_hash
-
-        return
+    @staticmethod
+    def process_all(
+        page: "pywikibot.Page", processors: list["SegmentProcessor"]
+    ) -> None:
+        page.text = SegmentProcessor.splice_all(page.text, processors)
 
+    # replaces the segments of every processor in the given text
     @staticmethod
-    def replace_segment(haystack: str, name: str, new_segment: str) -> str:
-        start_index = haystack.index(AUTO_GENERATED_SEGMENT_HEADER.format(name))
-        end_index = haystack.index(AUTO_GENERATED_SEGMENT_FOOTER, start_index)
-        end_index += len(AUTO_GENERATED_SEGMENT_FOOTER)
-        old_segment = haystack[start_index:end_index]
-        return haystack.replace(old_segment, new_segment)
+    def splice_all(text: str, processors: list["SegmentProcessor"]) -> str:
+        return splice_segments(
+            text,
+            {processor.segment_name: processor.new_segment for processor in processors},
+        )
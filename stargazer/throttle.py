@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+import typing
+from typing import Callable
+
+if typing.TYPE_CHECKING:
+    import pywikibot
+
+log = logging.getLogger(__name__)
+
+
+class WriteScheduler:
+    """
+    Paces page saves according to how the wiki is coping. The delay between saves shrinks while saves complete
+    quickly, and grows when they slow down or the server reports replication lag or asks us to retry later, always
+    staying between `min_delay` and `max_delay` seconds.
+
+    The scheduler can also be steered at runtime through a control file, which is re-read whenever it changes:
+
+        pause       stop saving until this line is removed
+        delay 5     wait exactly 5 seconds between saves
+        rate 20     save at most 20 pages per minute
+
+    An empty (or missing) control file leaves the delay up to the scheduler.
+    """
+
+    min_delay: float
+    max_delay: float
+    delay: float
+    # saves slower than this are taken as a sign that the wiki is under load
+    target_latency: float
+    control_path: str | None
+    paused: bool
+    fixed_delay: float | None
+
+    def __init__(
+        self,
+        min_delay: float = 0.5,
+        max_delay: float = 60.0,
+        initial_delay: float = 2.0,
+        target_latency: float = 1.0,
+        control_path: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min(max(initial_delay, min_delay), max_delay)
+        self.target_latency = target_latency
+        self.control_path = control_path
+        self.paused = False
+        self.fixed_delay = None
+
+        self.clock = clock
+        self._sleep = sleep
+        self._last_write: float | None = None
+        self._control_mtime: int | None = None
+
+    def _clamp(self, delay: float) -> float:
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def read_control(self) -> None:
+        if self.control_path is None:
+            return
+
+        try:
+            mtime = os.stat(self.control_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+
+        paused = False
+        fixed_delay = None
+        if mtime is not None:
+            with open(self.control_path, "r") as f:
+                for line in f:
+                    command = line.split("#")[0].split()
+                    if len(command) == 0:
+                        continue
+
+                    try:
+                        if command[0] == "pause":
+                            paused = True
+                        elif command[0] == "delay":
+                            fixed_delay = float(command[1])
+                        elif command[0] == "rate":
+                            fixed_delay = 60.0 / float(command[1])
+                        else:
+                            raise ValueError()
+                    except (ValueError, IndexError, ZeroDivisionError):
+                        log.warning(
+                            f"Ignoring invalid throttle control line: {line.strip()}"
+                        )
+
+        if paused != self.paused:
+            log.info("Saving paused" if paused else "Saving resumed")
+        if fixed_delay != self.fixed_delay:
+            if fixed_delay is None:
+                log.info("Save delay is adaptive again")
+            else:
+                log.info(f"Save delay fixed at {fixed_delay:.2f}s")
+
+        self.paused = paused
+        self.fixed_delay = fixed_delay
+
+    def current_delay(self) -> float:
+        return self.fixed_delay if self.fixed_delay is not None else self.delay
+
+    # blocks until the next save may be made
+    def wait(self, poll_interval: float = 5.0) -> None:
+        self.read_control()
+        while self.paused:
+            self._sleep(poll_interval)
+            self.read_control()
+
+        if self._last_write is not None:
+            remaining = self._last_write + self.current_delay() - self.clock()
+            if remaining > 0:
+                self._sleep(remaining)
+
+    def record_success(self, latency: float) -> None:
+        self._last_write = self.clock()
+
+        if latency > self.target_latency:
+            # give the wiki as long to recover as the save took, at least
+            self.delay = self._clamp(max(self.delay * 1.5, latency))
+        else:
+            self.delay = self._clamp(self.delay * 0.9)
+
+    def record_lag(
+        self, lag: float | None = None, retry_after: float | None = None
+    ) -> None:
+        self._last_write = self.clock()
+        self.delay = self._clamp(max(self.delay * 2, lag or 0, retry_after or 0))
+        log.warning(f"Wiki is lagging, save delay increased to {self.delay:.2f}s")
+
+
+def disable_write_delay(site: "pywikibot.site.BaseSite", read_delay: float = 0) -> None:
+    """
+    Turns off pywikibot's own fixed delay between writes to `site`, leaving saves to be paced by a WriteScheduler.
+    Reads are still spaced at least `read_delay` seconds apart.
+    """
+    import pywikibot
+
+    # set_delays treats a write delay of 0 as unset and falls back to put_throttle, 10 seconds by default
+    pywikibot.config.put_throttle = 0
+    site.throttle.set_delays(delay=read_delay, writedelay=0)
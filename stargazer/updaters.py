@@ -1,59 +1,386 @@
+import hashlib
 import logging
 import os.path
-from typing import cast
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, cast
 
-import pywikibot
 from sqlalchemy.orm import Session
 
+from .categories import CategoryRules, default_category_rules
 from .entity import EntityPrototype
-from .segments import SegmentProcessor
+from .index import PrototypeIndex, PrototypeQueryException
+from .journal import RunJournal
+from .lists import ListPage, load_list_pages
+from .report import RunReport
+from .rsi import RsiIndex, RsiMeta, split_sprite_path
+from .segments import (
+    AUTO_GENERATED_SEGMENT_FOOTER,
+    AUTO_GENERATED_SEGMENT_HEADER,
+    PageSegmentStore,
+    SegmentProcessor,
+)
+from .throttle import WriteScheduler
+
+# pywikibot takes a while to import and reads its user config when it does, so it is only imported once a page is
+# actually fetched or saved, leaving everything else here usable offline. numpy and Pillow are likewise only imported
+# along with the compositor, by runs updating sprites.
+if typing.TYPE_CHECKING:
+    import pywikibot
+
+    from .composite import SpriteCompositor, SpriteLayer
 
 log = logging.getLogger(__name__)
 
-
-AUTO_GENERATED_SEGMENT_HEADER = "<!-- Begin auto-generated segment: {} -->"
-AUTO_GENERATED_SEGMENT_FOOTER = "<!-- End auto-generated segment -->"
+# most prototypes listed in a "Derived" segment, beyond which the rest are only counted
+DERIVED_LIST_LIMIT = 100
 
 
 class Updater:
     def __init__(
-        self, session: Session, site: pywikibot.site.BaseSite, edit_summary: str
+        self,
+        session: Session,
+        site: "pywikibot.site.BaseSite",
+        edit_summary: str,
+        scheduler: WriteScheduler | None = None,
+        report: RunReport | None = None,
     ):
         self.session = session
         self.site = site
         self.edit_summary = edit_summary
-        pass
+        self.scheduler = scheduler if scheduler is not None else WriteScheduler()
+        self.report = report if report is not None else RunReport()
+        # number of titles whose properties are queried per request
+        self.query_batch_size = 50
+
+    """
+    Performs a write once the scheduler allows it, and reports back how the wiki coped. pywikibot already waits out
+    maxlag and Retry-After responses internally before retrying, which shows up here as a slow write. Once it gives
+    up, the lag and the Retry-After header of the wiki's last response are handed to the scheduler instead.
+    """
+
+    def paced(self, write: Callable[[], typing.Any]) -> None:
+        from pywikibot.exceptions import APIError, MaxlagTimeoutError, ServerError
+
+        with self.report.phase("throttle"):
+            self.scheduler.wait()
+
+        start = self.scheduler.clock()
+        try:
+            with self.report.phase("save"):
+                write()
+        except (MaxlagTimeoutError, ServerError):
+            self.scheduler.record_lag(retry_after=self.retry_after())
+            raise
+        except APIError as e:
+            if e.code in ("maxlag", "ratelimited"):
+                lag = e.other.get("lag")
+                self.scheduler.record_lag(
+                    lag=float(lag) if lag is not None else None,
+                    retry_after=self.retry_after(),
+                )
+            raise
+        latency = self.scheduler.clock() - start
+        self.scheduler.record_success(latency)
+        self.report.observe("page_save_seconds", latency)
+
+    # pywikibot keeps the Retry-After header of the latest response on the site's throttle, 0 when there was none
+    def retry_after(self) -> float | None:
+        return float(getattr(self.site.throttle, "retry_after", 0)) or None
+
+    def save(self, page: "pywikibot.Page", summary: str) -> None:
+        self.paced(lambda: page.put(page.text, summary))
+
+    """
+    Creates a page the wiki reported as missing with the given text, without fetching it again. A missing page can't
+    carry {{bots}} exclusions, so pywikibot's check for them, which loads the page when its text is set, is skipped.
+    The text is appended rather than set, as pywikibot otherwise loads the latest revision of the page to detect edit
+    conflicts, which `createonly` already does for a page that should not exist.
+    """
+
+    def create(self, page: "pywikibot.Page", text: str, summary: str) -> None:
+        self.paced(
+            lambda: self.site.editpage(
+                page, summary=summary, appendtext=text, createonly=True
+            )
+        )
+
+    # queries properties of many pages in batches, yielding each page under the title it was requested by
+    def query_pages(
+        self, titles: list[str], **params: typing.Any
+    ) -> Iterator[tuple[str, dict[str, typing.Any]]]:
+        for i in range(0, len(titles), self.query_batch_size):
+            batch = titles[i : i + self.query_batch_size]
+            request = self.site.simple_request(action="query", titles=batch, **params)
+            query = request.submit().get("query", {})
+
+            # map titles normalized by the wiki back to the ones we asked for
+            requested_titles = {
+                normalized["to"]: normalized["from"]
+                for normalized in query.get("normalized", [])
+            }
+
+            pages = query.get("pages", [])
+            if isinstance(pages, dict):
+                pages = pages.values()
+            for page in pages:
+                yield requested_titles.get(page["title"], page["title"]), page
+
+    """
+    Returns the pages whose latest revision is not the one stargazer left them at, i.e. which were edited or deleted
+    by someone else since. Pages stargazer has not recorded a revision for yet are left out. Only page info is
+    queried, no page text.
+    """
+
+    def drifted_pages(
+        self, page_names: Iterable[str], store: PageSegmentStore
+    ) -> set[str]:
+        known = [
+            page_name
+            for page_name in page_names
+            if store.get_revision(page_name) is not None
+        ]
+
+        drifted = set()
+        with self.report.phase("drift"):
+            for page_name, page in self.query_pages(known, prop="info"):
+                if page.get("lastrevid") != store.get_revision(page_name):
+                    drifted.add(page_name)
+        self.report.count("pages_drifted", len(drifted))
+        return drifted
+
+    """
+    Splices the processors' segments into the page and saves it if that changed anything, then tracks the new segment
+    states along with the revision the page was left at.
+    """
+
+    def sync_page(
+        self,
+        page: "pywikibot.Page",
+        processors: list[SegmentProcessor],
+        store: PageSegmentStore,
+    ) -> None:
+        summary = f"stargazer: {self.edit_summary}"
+        if not page.exists():
+            # the text is built up locally, as setting `page.text` would fetch the missing page all over again
+            self.create(page, SegmentProcessor.splice_all("", processors), summary)
+            self.report.count("pages_updated")
+        else:
+            original_text = page.text
+            SegmentProcessor.process_all(page, processors)
+            if page.text != original_text:
+                self.save(page, summary)
+                self.report.count("pages_updated")
+            else:
+                self.report.count("pages_unchanged")
+
+        for processor in processors:
+            processor.saved()
+        store.set_revision(processors[0].page_name, page.latest_revision_id)
+
+
+def _sha1_file(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError as e:
+        log.warning(f"Unable to read sprite {path} ({e})")
+        return None
 
 
 class SpriteUpdater(Updater):
+    def __init__(
+        self,
+        session: Session,
+        site: "pywikibot.site.BaseSite",
+        edit_summary: str,
+        project_path: str,
+        scheduler: WriteScheduler | None = None,
+        report: RunReport | None = None,
+        rsi_index: RsiIndex | None = None,
+        compositor: "SpriteCompositor | None" = None,
+    ):
+        super().__init__(session, site, edit_summary, scheduler, report)
+        self.textures_path = f"{project_path}/Resources/Textures"
+        self.rsi_index = (
+            rsi_index if rsi_index is not None else RsiIndex(self.textures_path)
+        )
+        # layered sprites are only uploaded when there is a compositor to flatten them
+        self.compositor = compositor
+        # sprite paths, relative to the textures directory, mapped to the name of their file on the wiki
+        self.sprites: dict[str, str] = {}
+        # names of the files of layered sprites on the wiki, mapped to their layers
+        self.composites: dict[str, tuple["SpriteLayer", ...]] = {}
+
+        # number of threads reading and hashing sprites
+        self.hash_workers = 8
+        # number of uploads between writes of their hashes to the database
+        self.commit_interval = 50
+
     def prepare(self, **kwargs: dict[str, EntityPrototype]) -> None:
         entities: dict[str, EntityPrototype] = kwargs["entities"]
 
-        # check for sprite for each entity
-        self.sprites: list[tuple[str, str]] = []
-
+        # check for sprite for each entity, entities sharing a sprite share its upload
         for entity in entities.values():
             sprite_path = entity.sprite_path()
-            if sprite_path == "":
+            if sprite_path == "" and self.compositor is not None:
+                sprite_path = self.prepare_layers(entity)
+            if sprite_path == "" or sprite_path in self.sprites:
                 continue
 
             try:
-                self.sprites.append(
-                    (sprite_path, SpriteUpdater.file_id_from_path(sprite_path))
-                )
+                file_id = SpriteUpdater.file_id_from_path(sprite_path)
             except Exception as e:
                 log.warning(e)
                 continue
 
-        # calculate hash for sprite png
+            if not self.rsi_index.has_state(sprite_path):
+                log.warning(
+                    f"Sprite {sprite_path} of {entity.id} is not a state of an existing rsi"
+                )
+                continue
+            self.sprites[sprite_path] = file_id
+
         return
 
+    # registers the entity's layered sprite as a composite, or returns its path if it comes down to a single sprite
+    def prepare_layers(self, entity: EntityPrototype) -> str:
+        from .composite import SpriteLayer, composite_file_id, layers_from_component
+
+        if "Sprite" not in entity.components:
+            return ""
+
+        layers = tuple(
+            layer
+            for layer in layers_from_component(entity.components["Sprite"])
+            if ".rsi/" not in layer.path or self.rsi_index.has_state(layer.path)
+        )
+        if len(layers) == 0:
+            return ""
+        if len(layers) == 1 and layers[0] == SpriteLayer(layers[0].path):
+            return layers[0].path
+
+        self.composites.setdefault(composite_file_id(layers), layers)
+        return ""
+
+    @staticmethod
+    def page_name(file_id: str) -> str:
+        return f"File:{file_id}"
+
+    def summary(self, file_id: str) -> str:
+        if file_id in self.composites:
+            layers = self.composites[file_id]
+            return SpriteUpdater.generate_summary(
+                ", ".join(layer.path for layer in layers),
+                *[
+                    self.rsi_index.get(split_sprite_path(layer.path)[0])
+                    for layer in layers
+                ],
+            )
+
+        path = self._sprite_paths[file_id]
+        return SpriteUpdater.generate_summary(
+            path, self.rsi_index.get(split_sprite_path(path)[0])
+        )
+
+    # fetches the sha1 of the current version of each file on the wiki, leaving out files which do not exist yet
+    def remote_hashes(self, page_names: list[str]) -> dict[str, str]:
+        hashes: dict[str, str] = {}
+        for page_name, page in self.query_pages(
+            page_names, prop="imageinfo", iiprop="sha1"
+        ):
+            image_info = page.get("imageinfo")
+            if image_info:
+                hashes[page_name] = image_info[0]["sha1"]
+        return hashes
+
     def run(self) -> None:
-        # if hash does not match database for sprite,
-        # ... upload/update sprite on wiki
-        # ... update version hash in db
-        # else, continue loop
-        pass
+        import pywikibot
+
+        self._sprite_paths = {file_id: path for path, file_id in self.sprites.items()}
+
+        # the local image of every file to keep up to date on the wiki
+        files = {
+            file_id: f"{self.textures_path}/{path}"
+            for file_id, path in self._sprite_paths.items()
+        }
+        if self.compositor is not None:
+            with self.report.phase("sprite_composite"):
+                for file_id, layers in self.composites.items():
+                    output_path = self.compositor.composite(layers)
+                    if output_path is not None:
+                        files[file_id] = output_path
+            self.report.count("composites_rendered", self.compositor.rendered)
+            self.report.count("composites_reused", self.compositor.reused)
+
+        # hash every sprite in parallel, file reads dominate and hashlib releases the GIL
+        file_ids = list(files)
+        with self.report.phase("sprite_hash"):
+            with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                local_hashes = dict(
+                    zip(file_ids, executor.map(_sha1_file, files.values()))
+                )
+        self.report.count("sprites_hashed", len(file_ids))
+
+        store = PageSegmentStore(self.session)
+        page_names = {file_id: SpriteUpdater.page_name(file_id) for file_id in files}
+        store.prefetch(page_names.values())
+
+        # only files whose hash differs from the one stored after the last upload are checked against the wiki
+        changed = [
+            file_id
+            for file_id, local_hash in local_hashes.items()
+            if local_hash is not None
+            and store.get(page_names[file_id], "Image") != local_hash
+        ]
+        log.info(f"{len(changed)} of {len(file_ids)} sprites have changed")
+
+        with self.report.phase("sprite_query"):
+            remote = self.remote_hashes([page_names[file_id] for file_id in changed])
+
+        uploaded = 0
+        try:
+            for file_id in changed:
+                page_name = page_names[file_id]
+                local_hash = cast(str, local_hashes[file_id])
+
+                if remote.get(page_name) == local_hash:
+                    # the wiki already has this exact file, e.g. uploaded by hand or by a run whose state was lost
+                    store.set(page_name, "Image", local_hash)
+                    self.report.count("sprites_unchanged")
+                    continue
+
+                try:
+                    log.debug(f"Uploading {page_name}...")
+                    file_page = pywikibot.FilePage(self.site, page_name)
+
+                    def upload() -> None:
+                        # pywikibot reports some refusals, such as uploads being disabled, by returning False
+                        if not file_page.upload(
+                            files[file_id],
+                            comment=f"stargazer: {self.edit_summary}",
+                            text=self.summary(file_id),
+                            ignore_warnings=True,
+                        ):
+                            raise Exception("upload refused by the wiki")
+
+                    self.paced(upload)
+                    store.set(page_name, "Image", local_hash)
+
+                    uploaded += 1
+                    self.report.count("sprites_uploaded")
+                    if uploaded % self.commit_interval == 0:
+                        store.flush()
+                        self.session.commit()
+                except Exception as e:
+                    log.error(f"Failed to upload sprite: {file_id} ({e}) skipping...")
+                    self.report.count("sprites_failed")
+                    continue
+        finally:
+            store.flush()
+            self.session.commit()
+            self.rsi_index.save()
 
     @staticmethod
     def file_id_from_path(path: str) -> str:
@@ -73,22 +400,23 @@ class SpriteUpdater(Updater):
         return file_id
 
     @staticmethod
-    def generate_summary(path: str) -> str:
+    def generate_summary(path: str, *metas: RsiMeta | None) -> str:
+        # composites list the license and attribution of each distinct source once
+        licenses = list(dict.fromkeys(m.license for m in metas if m is not None))
+        copyrights = list(dict.fromkeys(m.copyright for m in metas if m is not None))
+
         summary = ""
-        summary += "<!-- Begin auto-generated segment: File summary -->" + os.linesep
+        summary += AUTO_GENERATED_SEGMENT_HEADER.format("File summary") + os.linesep
         summary += f"File path: {path}" + os.linesep
 
-        # load rsi meta.json
-        # ...
-
-        summary += f"License: " + os.linesep
+        summary += f"License: {', '.join(licenses)}" + os.linesep
 
-        summary += f"Attribution: " + os.linesep
+        summary += f"Attribution: {'; '.join(copyrights)}" + os.linesep
 
         # link to github commit ...
         # summary += f'Source: ' + os.linesep
 
-        summary += "<!-- End auto-generated segment -->" + os.linesep
+        summary += AUTO_GENERATED_SEGMENT_FOOTER + os.linesep
         return summary
 
 
@@ -96,56 +424,184 @@ class EntityUpdater(Updater):
     def __init__(
         self,
         session: Session,
-        site: pywikibot.site.BaseSite,
+        site: "pywikibot.site.BaseSite",
         edit_summary: str,
-        **kwargs: dict[str, EntityPrototype],
+        scheduler: WriteScheduler | None = None,
+        report: RunReport | None = None,
+        **kwargs: typing.Any,
     ):
-        super().__init__(session, site, edit_summary)
+        super().__init__(session, site, edit_summary, scheduler, report)
         self.entities: dict[str, EntityPrototype] = cast(
             dict[str, EntityPrototype], kwargs.get("entities")
         )
         if self.entities is None:
             raise Exception("No entities provided")
+        # derived prototypes are looked up in an index of every entity, built here unless one is provided
+        index = cast(PrototypeIndex | None, kwargs.get("index"))
+        self.index = index if index is not None else PrototypeIndex(self.entities)
+
+        # saved pages are written to the database in groups, committed after this many pages or seconds
+        self.commit_interval = 50
+        self.commit_seconds = 30.0
+        # continue the last interrupted run from its journal, rather than diffing every page again
+        self.resume = False
+        self.category_rules = default_category_rules()
+        # number of pages whose text is fetched per request, None for the most the wiki allows (at least 50)
+        self.preload_batch_size: int | None = None
 
-    def run(self) -> None:
-        for entity_id, entity in self.entities.items():
-            # capitalize the first letter or pywikibot will throw a fit (InconsistentTitleError)
-            normalized_entity_id = entity_id[0].upper() + entity_id[1:]
-            page_name = f"Entity:{normalized_entity_id}"
-            infobox_segment = EntityUpdater.generate_infobox(entity)
-            infobox_processor = SegmentProcessor(
-                page_name, "Infobox", infobox_segment, self.session
-            )
-            category_segment = EntityUpdater.generate_categories(entity)
-            category_processor = SegmentProcessor(
-                page_name, "Categories", category_segment, self.session
+    @staticmethod
+    def page_name(entity_id: str) -> str:
+        # capitalize the first letter or pywikibot will throw a fit (InconsistentTitleError)
+        normalized_entity_id = entity_id[0].upper() + entity_id[1:]
+        return f"Entity:{normalized_entity_id}"
+
+    """
+    Returns the text of every segment of an entity's page, by segment name. Only entities with derived prototypes get
+    a "Derived" segment, which is emptied rather than removed once they have none left, so given the `store` of
+    segment states, pages which had such a segment before keep it.
+    """
+
+    @staticmethod
+    def generate_segments(
+        entity: EntityPrototype,
+        rules: CategoryRules | None = None,
+        index: PrototypeIndex | None = None,
+        store: PageSegmentStore | None = None,
+    ) -> dict[str, str]:
+        segments = {
+            "Infobox": EntityUpdater.generate_infobox(entity),
+            "Categories": EntityUpdater.generate_categories(entity, rules),
+        }
+        if index is not None and (
+            len(index.descendants(entity.id)) > 0
+            or (
+                store is not None
+                and store.get(EntityUpdater.page_name(entity.id), "Derived") is not None
             )
+        ):
+            segments["Derived"] = EntityUpdater.generate_derived(entity, index)
+        return segments
+
+    def processors(
+        self, entity: EntityPrototype, page_name: str, store: PageSegmentStore
+    ) -> list[SegmentProcessor]:
+        return [
+            SegmentProcessor(page_name, segment_name, segment, store, self.report)
+            for segment_name, segment in EntityUpdater.generate_segments(
+                entity, self.category_rules, self.index, store
+            ).items()
+        ]
+
+    # finds every page with outdated segments before touching the wiki, so their text can be fetched in batches
+    def plan(
+        self, store: PageSegmentStore
+    ) -> dict[str, tuple[str, list[SegmentProcessor]]]:
+        page_names = {
+            entity_id: EntityUpdater.page_name(entity_id) for entity_id in self.entities
+        }
+
+        pending: dict[str, tuple[str, list[SegmentProcessor]]] = {}
+        up_to_date: dict[str, tuple[str, list[SegmentProcessor]]] = {}
+        with self.report.phase("diff"):
+            store.prefetch(page_names.values())
+
+            for entity_id, entity in self.entities.items():
+                page_name = page_names[entity_id]
+                processors = self.processors(entity, page_name, store)
+                self.report.count("pages_checked")
+                if any([processor.should_update() for processor in processors]):
+                    pending[page_name] = (entity_id, processors)
+                else:
+                    up_to_date[page_name] = (entity_id, processors)
+
+        # pages edited by someone else are synchronized again, as their segments may no longer match ours
+        for page_name in self.drifted_pages(up_to_date, store):
+            pending[page_name] = up_to_date.pop(page_name)
+        self.report.count("pages_skipped", len(up_to_date))
+
+        log.info(f"{len(pending)} of {len(page_names)} entity pages need updating")
+        return pending
 
-            try:
-                should_update = (
-                    infobox_processor.should_update()
-                    or category_processor.should_update()
-                )
-                if should_update:
-                    log.debug(f"Updating {page_name}...")
-                    page = pywikibot.Page(self.site, page_name)
-                    infobox_processor.process(page)
-                    category_processor.process(page)
-                    page.put(page.text, f"stargazer: {self.edit_summary}")
-                    self.session.commit()
-            except Exception as e:
-                log.error(
-                    f"Failed to update page for entity: {entity_id} ({e}) skipping..."
+    def run(self) -> None:
+        import pywikibot
+
+        store = PageSegmentStore(self.session)
+        journal = RunJournal(self.session)
+
+        pending: dict[str, tuple[str, list[SegmentProcessor]]] = {}
+        if self.resume and journal.resume():
+            # the pages left over were already found to be outdated, only their segments are generated again
+            remaining = journal.remaining()
+            store.prefetch(remaining)
+            for page_name, entity_id in remaining.items():
+                if entity_id not in self.entities:
+                    log.warning(f"Entity {entity_id} of {page_name} no longer exists")
+                    continue
+                pending[page_name] = (
+                    entity_id,
+                    self.processors(self.entities[entity_id], page_name, store),
                 )
-                continue
+            log.info(f"Resuming run {journal.run_id} with {len(pending)} pages left")
+        else:
+            if self.resume:
+                log.info("No interrupted run to resume, starting a new one")
+            pending = self.plan(store)
+            journal.start(
+                {page_name: entity_id for page_name, (entity_id, _) in pending.items()}
+            )
 
-    @staticmethod
-    def replace_segment(haystack: str, name: str, new_segment: str) -> str:
-        start_index = haystack.index(AUTO_GENERATED_SEGMENT_HEADER.format(name))
-        end_index = haystack.index(AUTO_GENERATED_SEGMENT_FOOTER, start_index)
-        end_index += len(AUTO_GENERATED_SEGMENT_FOOTER)
-        old_segment = haystack[start_index:end_index]
-        return haystack.replace(old_segment, new_segment)
+        # preloaded pages are matched back up by their normalized title
+        pages = [pywikibot.Page(self.site, page_name) for page_name in pending]
+        pending = {
+            page.title(): pending[page_name] for page, page_name in zip(pages, pending)
+        }
+
+        def commit() -> None:
+            with self.report.phase("db_write"):
+                store.flush()
+                journal.flush()
+                self.session.commit()
+
+        synced = 0
+        last_commit = time.monotonic()
+        try:
+            # templates are preloaded too, as pywikibot checks them for {{bots}} exclusions before every edit
+            preloaded = iter(
+                self.site.preloadpages(
+                    pages, groupsize=self.preload_batch_size, templates=True
+                )
+            )
+            while True:
+                with self.report.phase("fetch"):
+                    page = next(preloaded, None)
+                if page is None:
+                    break
+
+                entity_id, processors = pending[page.title()]
+                try:
+                    log.debug(f"Updating {page.title()}...")
+                    self.sync_page(page, processors, store)
+                    journal.mark(processors[0].page_name, "done")
+                except Exception as e:
+                    log.error(
+                        f"Failed to update page for entity: {entity_id} ({e}) skipping..."
+                    )
+                    self.report.count("pages_failed")
+                    journal.mark(processors[0].page_name, "failed")
+
+                # group commits, each covering the segment hashes and journal entries of the pages since the last
+                synced += 1
+                if (
+                    synced % self.commit_interval == 0
+                    or time.monotonic() - last_commit >= self.commit_seconds
+                ):
+                    commit()
+                    last_commit = time.monotonic()
+
+            journal.finish()
+        finally:
+            # pages saved since the last group must be tracked even if the run is interrupted
+            commit()
 
     @staticmethod
     def generate_infobox(entity: EntityPrototype) -> str:
@@ -170,37 +626,168 @@ class EntityUpdater(Updater):
             src_string += f"#L{entity.meta.line_number}"
         output += f"|source = {{{{SourceLink|{src_string}}}}}" + os.linesep
 
+        # link each component defined by this prototype to its exact declaration, inherited ones are on parent pages
+        component_links = [
+            f"{{{{SourceLink|{entity.meta.file_path}#L{line_number}|{component_type}}}}}"
+            for component_type, line_number in entity.meta.component_lines.items()
+        ]
+        if len(component_links) > 0:
+            output += f"|components = {', '.join(component_links)}" + os.linesep
+
         output += "}}" + os.linesep
         output += AUTO_GENERATED_SEGMENT_FOOTER
 
         return output
 
     @staticmethod
-    def generate_categories(entity: EntityPrototype) -> str:
+    def generate_categories(
+        entity: EntityPrototype, rules: CategoryRules | None = None
+    ) -> str:
+        if rules is None:
+            rules = default_category_rules()
+
         output = AUTO_GENERATED_SEGMENT_HEADER.format("Categories") + os.linesep
+        for category in rules.match(entity):
+            output += f"[[Category:{category}]]" + os.linesep
+        output += AUTO_GENERATED_SEGMENT_FOOTER
+        return output
 
-        output += "[[Category:Entities]]" + os.linesep
+    @staticmethod
+    def generate_derived(
+        entity: EntityPrototype, index: PrototypeIndex, limit: int = DERIVED_LIST_LIMIT
+    ) -> str:
+        output = AUTO_GENERATED_SEGMENT_HEADER.format("Derived") + os.linesep
+
+        # the segment is left empty on pages whose derived prototypes have all been removed
+        descendants = index.descendants(entity.id)
+        if len(descendants) > 0:
+            children = sorted(index.parent(entity.id))
+            output += "== Derived prototypes ==" + os.linesep
+            output += (
+                f"{len(descendants)} prototypes inherit from {entity.id}, {len(children)} of them directly:"
+                + os.linesep
+            )
 
-        if entity.has_component("Item"):
-            output += "[[Category:Items]]" + os.linesep
+            # only direct children are listed, and only so many of them, to keep the pages of base prototypes small
+            for child in children[:limit]:
+                output += f"* [[{EntityUpdater.page_name(child)}|{child}]]"
+                child_descendants = len(index.descendants(child))
+                if child_descendants > 0:
+                    output += f" ({child_descendants} derived)"
+                output += os.linesep
+            if len(children) > limit:
+                output += f"* ... and {len(children) - limit} more" + os.linesep
 
-        if entity.has_component("Mail"):
-            output += "[[Category:Mail]]" + os.linesep
+        output += AUTO_GENERATED_SEGMENT_FOOTER
+        return output
 
-        if entity.has_component("Food"):
-            output += "[[Category:Food]]" + os.linesep
 
-        if entity.has_component("Cartridge"):
-            output += "[[Category:Cartridges]]" + os.linesep
+class ListUpdater(Updater):
+    def __init__(
+        self,
+        session: Session,
+        site: "pywikibot.site.BaseSite",
+        edit_summary: str,
+        scheduler: WriteScheduler | None = None,
+        report: RunReport | None = None,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(session, site, edit_summary, scheduler, report)
+        self.entities: dict[str, EntityPrototype] = cast(
+            dict[str, EntityPrototype], kwargs.get("entities")
+        )
+        if self.entities is None:
+            raise Exception("No entities provided")
+        # lookups are answered by an index of every entity, built here unless one is provided
+        index = cast(PrototypeIndex | None, kwargs.get("index"))
+        self.index = index if index is not None else PrototypeIndex(self.entities)
 
-        if entity.has_component("Clothing"):
-            output += "[[Category:Clothing]]" + os.linesep
+        self.list_pages = load_list_pages()
 
-        if entity.has_tag("Figurine"):
-            output += "[[Category:Figurines]]" + os.linesep
+    # the text of the list segment of every list page, leaving out those whose query is invalid
+    @staticmethod
+    def generate_lists(
+        list_pages: list[ListPage],
+        index: PrototypeIndex,
+        entities: dict[str, EntityPrototype],
+        report: RunReport,
+    ) -> dict[str, str]:
+        lists = {}
+        for list_page in list_pages:
+            try:
+                entity_ids = index.query(list_page.query)
+            except PrototypeQueryException as e:
+                log.error(f"Invalid query for list page: {list_page.page} ({e})")
+                report.count("pages_failed")
+                continue
+
+            lists[list_page.page] = ListUpdater.generate_list(
+                list_page,
+                [
+                    entities[entity_id]
+                    for entity_id in entity_ids
+                    if not entities[entity_id].abstract
+                ],
+            )
+        return lists
 
-        if entity.has_tag("Trash"):
-            output += "[[Category:Trash]]" + os.linesep
+    def run(self) -> None:
+        import pywikibot
+
+        lists = ListUpdater.generate_lists(
+            self.list_pages, self.index, self.entities, self.report
+        )
+        store = PageSegmentStore(self.session)
+        store.prefetch(lists)
+
+        pending: list[SegmentProcessor] = []
+        up_to_date: dict[str, SegmentProcessor] = {}
+        for page_name, segment in lists.items():
+            processor = SegmentProcessor(page_name, "List", segment, store, self.report)
+            self.report.count("pages_checked")
+            if processor.should_update():
+                pending.append(processor)
+            else:
+                up_to_date[page_name] = processor
+
+        for page_name in self.drifted_pages(up_to_date, store):
+            pending.append(up_to_date.pop(page_name))
+        self.report.count("pages_skipped", len(up_to_date))
+
+        try:
+            for processor in pending:
+                try:
+                    log.debug(f"Updating {processor.page_name}...")
+                    page = pywikibot.Page(self.site, processor.page_name)
+                    self.sync_page(page, [processor], store)
+                except Exception as e:
+                    log.error(
+                        f"Failed to update list page: {processor.page_name} ({e}) skipping..."
+                    )
+                    self.report.count("pages_failed")
+                    continue
+        finally:
+            store.flush()
+            self.session.commit()
 
+    @staticmethod
+    def generate_list(list_page: ListPage, entities: list[EntityPrototype]) -> str:
+        entities = sorted(entities, key=lambda entity: (entity.name.lower(), entity.id))
+
+        output = AUTO_GENERATED_SEGMENT_HEADER.format("List") + os.linesep
+        if list_page.format == "table":
+            output += '{| class="wikitable sortable"' + os.linesep
+            output += "! Entity !! Name !! Description" + os.linesep
+            for entity in entities:
+                # a pipe would end the cell early
+                description = entity.description.replace("|", "{{!}}")
+                output += "|-" + os.linesep
+                output += f"| [[{EntityUpdater.page_name(entity.id)}|{entity.id}]] || {entity.name} || {description}"
+                output += os.linesep
+            output += "|}" + os.linesep
+        else:
+            for entity in entities:
+                output += f"* [[{EntityUpdater.page_name(entity.id)}|{entity.name or entity.id}]]"
+                output += os.linesep
         output += AUTO_GENERATED_SEGMENT_FOOTER
         return output
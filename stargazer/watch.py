@@ -0,0 +1,422 @@
+import bisect
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+import typing
+
+from .cache import ParseCache, ParsedFile
+from .loader import (
+    PrototypeRegistry,
+    build_registry,
+    parse_prototype_files,
+    prototype_file_paths,
+)
+from .prototype import create_prototype, resolve_prototypes
+
+log = logging.getLogger(__name__)
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _prototype_files_under(path: str) -> set[str]:
+    return {
+        os.path.join(directory, file_name)
+        for directory, _, file_names in os.walk(path)
+        for file_name in file_names
+        if file_name.endswith(".yml")
+    }
+
+
+class Watcher(typing.Protocol):
+    # returns the prototype files changed within `timeout` seconds (forever if None), empty if none were
+    def wait(self, timeout: float | None) -> set[str]: ...
+
+    def close(self) -> None: ...
+
+
+class InotifyWatcher:
+    """
+    Watches a directory tree for changed prototype files with inotify, adding watches for directories created after
+    the fact. Raises OSError where inotify is unavailable.
+    """
+
+    path: str
+    watches: dict[int, str]
+
+    def __init__(self, path: str) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+        self.path = path
+        self.watches = {}
+        self._watch_tree(path)
+
+    # returns the prototype files already inside the tree, which may have been created before the watch was added
+    def _watch_tree(self, path: str) -> set[str]:
+        found: set[str] = set()
+        for directory, _, file_names in os.walk(path):
+            wd = self._add_watch(
+                self.fd, os.fsencode(directory), WATCH_MASK | IN_ONLYDIR
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                log.warning(
+                    f"Unable to watch {directory} ({os.strerror(errno)}), changes to it will be missed"
+                )
+                continue
+            self.watches[wd] = directory
+            found.update(
+                os.path.join(directory, file_name)
+                for file_name in file_names
+                if file_name.endswith(".yml")
+            )
+        return found
+
+    def _read(self) -> set[str]:
+        changed: set[str] = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                name = os.fsdecode(
+                    buffer[
+                        offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length
+                    ]
+                ).rstrip("\0")
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    log.warning("Missed file events, checking every prototype file")
+                    changed.update(_prototype_files_under(self.path))
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+
+                directory = self.watches.get(wd)
+                if directory is None or name == "":
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    # a directory moved or created in brings along whatever was put inside it in the meantime
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self._watch_tree(path))
+                    elif mask & IN_MOVED_FROM:
+                        # stands for every file under the directory, see PrototypeState.update
+                        changed.add(os.path.join(path, ""))
+                        prefix = os.path.join(path, "")
+                        for moved in [
+                            moved
+                            for moved, watched in self.watches.items()
+                            if watched == path or watched.startswith(prefix)
+                        ]:
+                            self.watches.pop(moved)
+                elif name.endswith(".yml"):
+                    changed.add(path)
+
+    def wait(self, timeout: float | None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if len(readable) == 0:
+                return set()
+            changed = self._read()
+            # events about files which aren't prototypes don't count as changes
+            if len(changed) > 0 or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Watches a directory tree for changed prototype files by comparing the modification time and size of every file
+    every `interval` seconds, for platforms or filesystems without inotify.
+    """
+
+    path: str
+    interval: float
+    snapshot: dict[str, tuple[int, int]]
+
+    def __init__(self, path: str, interval: float = 2.0) -> None:
+        self.path = path
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for fpath in _prototype_files_under(self.path):
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                continue
+            snapshot[fpath] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: float | None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+
+            snapshot = self._scan()
+            changed = {
+                fpath
+                for fpath in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(fpath) != self.snapshot.get(fpath)
+            }
+            self.snapshot = snapshot
+            if len(changed) > 0 or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(path: str, poll: bool = False) -> Watcher:
+    if not poll:
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            log.warning(f"Unable to use inotify ({e}), polling for changes instead")
+    return PollingWatcher(path)
+
+
+def wait_for_changes(watcher: Watcher, debounce: float) -> set[str]:
+    """
+    Blocks until prototype files change, then keeps collecting changes until none have been made for `debounce`
+    seconds, so that a burst of saves (a git checkout, an editor writing several files) is handled as one.
+    """
+    changed = watcher.wait(None)
+    while True:
+        more = watcher.wait(debounce)
+        if len(more) == 0:
+            return changed
+        changed |= more
+
+
+PrototypeKey = tuple[str, str]
+
+
+class PrototypeState:
+    """
+    A resolved prototype tree kept in memory between updates. Changed files are parsed again, and only the prototypes
+    they declare and their descendants are rebuilt from their parsed source and resolved again, on top of the
+    rest of the tree.
+    """
+
+    base_path: str
+    cache: ParseCache | None
+    fast_yaml: bool
+    fpaths: list[str]
+    results: dict[str, ParsedFile]
+    registry: PrototypeRegistry
+    # every file declaring a prototype, in merge order, so the last one is the declaration in effect
+    declared_in: dict[PrototypeKey, list[str]]
+    # the ids of the prototypes listing a prototype among their parents, per type
+    children: dict[str, dict[str, set[str]]]
+
+    def __init__(
+        self,
+        base_path: str,
+        workers: int = 1,
+        cache: ParseCache | None = None,
+        fast_yaml: bool = False,
+    ) -> None:
+        self.base_path = base_path
+        self.cache = cache
+        self.fast_yaml = fast_yaml
+        self.fpaths = prototype_file_paths(base_path)
+        self.results = parse_prototype_files(
+            base_path, self.fpaths, workers, cache, fast_yaml
+        )
+        self.registry = build_registry(self.fpaths, self.results)
+
+        self.declared_in = {}
+        for fpath in self.fpaths:
+            for obj, _ in self.results[fpath]:
+                self.declared_in.setdefault((obj["type"], obj["id"]), []).append(fpath)
+
+        self.children = {}
+        for type_name, prototypes in self.registry.prototypes.items():
+            for prototype_id, proto in prototypes.items():
+                for parent in proto.parents:
+                    self.children.setdefault(type_name, {}).setdefault(
+                        parent, set()
+                    ).add(prototype_id)
+
+    @property
+    def prototypes_path(self) -> str:
+        return f"{self.base_path}/Resources/Prototypes"
+
+    def _reparse(self, changed_fpaths: set[str]) -> set[PrototypeKey]:
+        # a directory moved away is reported as its path with a trailing separator, standing for every file under it
+        expanded: set[str] = set()
+        for fpath in changed_fpaths:
+            if fpath.endswith(os.sep):
+                expanded.update(f for f in self.results if f.startswith(fpath))
+            else:
+                expanded.add(fpath)
+
+        existing = sorted(fpath for fpath in expanded if os.path.exists(fpath))
+        try:
+            parsed = parse_prototype_files(
+                self.base_path, existing, cache=self.cache, fast_yaml=self.fast_yaml
+            )
+        except Exception as e:
+            # most likely a file caught halfway through being written, which is parsed again once it's saved
+            log.error(
+                f"Unable to parse changed prototypes ({e}), keeping the previous state"
+            )
+            return set()
+
+        touched: set[PrototypeKey] = set()
+        for fpath in sorted(expanded):
+            old = self.results.get(fpath)
+            new = parsed.get(fpath)
+            # files saved without changes are common, and leave everything as it was
+            if old == new:
+                continue
+
+            for obj, _ in old or []:
+                key = (obj["type"], obj["id"])
+                touched.add(key)
+                self.declared_in[key].remove(fpath)
+            for obj, _ in new or []:
+                key = (obj["type"], obj["id"])
+                touched.add(key)
+                bisect.insort(self.declared_in.setdefault(key, []), fpath)
+
+            if new is None:
+                del self.results[fpath]
+                self.fpaths.remove(fpath)
+                if self.cache is not None:
+                    self.cache.discard(fpath)
+            else:
+                if old is None:
+                    bisect.insort(self.fpaths, fpath)
+                self.results[fpath] = new
+        return touched
+
+    def _descendants(self, keys: set[PrototypeKey]) -> set[PrototypeKey]:
+        found = set(keys)
+        queue = list(keys)
+        while len(queue) > 0:
+            type_name, prototype_id = queue.pop()
+            for child in self.children.get(type_name, {}).get(prototype_id, ()):
+                if (type_name, child) not in found:
+                    found.add((type_name, child))
+                    queue.append((type_name, child))
+        return found
+
+    # returns the parents the prototype no longer has
+    def _rebuild(self, key: PrototypeKey) -> list[str]:
+        type_name, prototype_id = key
+        prototypes = self.registry.prototypes.setdefault(type_name, {})
+        children = self.children.setdefault(type_name, {})
+
+        old = prototypes.pop(prototype_id, None)
+        old_parents = old.parents if old is not None else []
+        for parent in old_parents:
+            children.get(parent, set()).discard(prototype_id)
+
+        fpaths = self.declared_in.get(key)
+        if not fpaths:
+            self.declared_in.pop(key, None)
+            return old_parents
+
+        # resolving fills in inherited fields in place, so every rebuilt prototype starts over from its parsed source
+        for obj, meta in self.results[fpaths[-1]]:
+            if obj["type"] == type_name and obj["id"] == prototype_id:
+                proto = create_prototype(obj)
+                proto.meta = meta
+                prototypes[prototype_id] = proto
+                for parent in proto.parents:
+                    children.setdefault(parent, set()).add(prototype_id)
+                return [parent for parent in old_parents if parent not in proto.parents]
+        return old_parents
+
+    def update(self, changed_fpaths: set[str]) -> set[str]:
+        """
+        Applies changes to the given prototype files, returning the ids of the entities that changed, either directly
+        or through what they inherit, as well as the entities that lost any of them as children. Entities that were
+        removed are not included.
+        """
+        touched = self._reparse(changed_fpaths)
+        if len(touched) == 0:
+            return set()
+
+        # only rebuilt prototypes change their parents, so the descendants found beforehand are all there is
+        affected = self._descendants(touched)
+        former_parents: set[PrototypeKey] = set()
+        for key in affected:
+            former_parents.update((key[0], parent) for parent in self._rebuild(key))
+
+        by_type: dict[str, set[str]] = {}
+        for type_name, prototype_id in affected:
+            if prototype_id in self.registry.of_type(type_name):
+                by_type.setdefault(type_name, set()).add(prototype_id)
+        for type_name, prototype_ids in by_type.items():
+            resolve_prototypes(self.registry.of_type(type_name), only=prototype_ids)
+
+        log.info(
+            f"{len(changed_fpaths)} prototype files changed, {len(touched)} prototypes declared in them and "
+            f"{len(affected) - len(touched)} of their descendants were resolved again"
+        )
+        return by_type.get("entity", set()) | {
+            prototype_id
+            for type_name, prototype_id in former_parents
+            if type_name == "entity" and prototype_id in self.registry.entities
+        }
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import typing
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.fakewiki import FakeWiki, write_pywikibot_config
+from stargazer.segments import PAGE_SEGMENTS
+
+if typing.TYPE_CHECKING:
+    import pywikibot
+
+# pywikibot reads its configuration once, when first imported, so every test shares a single fake wiki, configured
+# before any test gets to import pywikibot
+WIKI = FakeWiki()
+_config_path = tempfile.TemporaryDirectory()
+write_pywikibot_config(_config_path.name, WIKI)
+os.environ["PYWIKIBOT_DIR"] = _config_path.name
+
+
+@pytest.fixture(scope="session")
+def site() -> typing.Iterator["pywikibot.site.BaseSite"]:
+    import pywikibot
+
+    from stargazer.throttle import disable_write_delay
+
+    WIKI.start()
+    site = pywikibot.Site("en", "fakewiki")
+    disable_write_delay(site)
+    site.login()
+    yield site
+    WIKI.stop()
+
+
+# the fake wiki behind `site`, emptied for every test
+@pytest.fixture
+def wiki(site: "pywikibot.site.BaseSite") -> FakeWiki:
+    WIKI.reset()
+    return WIKI
+
+
+@pytest.fixture
+def session() -> typing.Iterator[Session]:
+    engine = create_engine("sqlite://")
+    PAGE_SEGMENTS.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+# the textures directory of a project rooted at `tmp_path`
+@pytest.fixture
+def textures_path(tmp_path: Path) -> Path:
+    path = tmp_path / "Resources" / "Textures"
+    path.mkdir(parents=True)
+    return path
+
+
+# writes an rsi to the textures directory, with the given image of each of its states
+@pytest.fixture
+def write_rsi(textures_path: Path) -> typing.Callable[..., None]:
+    def write(
+        rsi_path: str,
+        states: dict[str, bytes],
+        size: tuple[int, int] = (32, 32),
+        license: str = "CC-BY-SA-3.0",
+        copyright: str = "Drawn for the tests",
+    ) -> None:
+        path = textures_path / rsi_path
+        path.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "version": 1,
+            "license": license,
+            "copyright": copyright,
+            "size": {"x": size[0], "y": size[1]},
+            "states": [{"name": state} for state in states],
+        }
+        (path / "meta.json").write_text(json.dumps(meta))
+        for state, image in states.items():
+            (path / f"{state}.png").write_bytes(image)
+
+    return write
@@ -0,0 +1,144 @@
+import argparse
+import os
+import subprocess
+import sys
+import typing
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from benchmarks.fakewiki import FakeWiki, write_pywikibot_config
+from stargazer.cli import select_entities
+from stargazer.git import file_at
+from stargazer.loader import load_prototypes
+from stargazer.segments import PAGE_SEGMENTS
+
+PROTOTYPES = "Resources/Prototypes"
+
+BASE = """- type: entity
+  id: Base
+  abstract: true
+
+- type: entity
+  id: Machine
+  parent: Base
+
+- type: entity
+  id: Tool
+  parent: Base
+"""
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), *args], capture_output=True, check=True, text=True
+    ).stdout
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    (tmp_path / PROTOTYPES).mkdir(parents=True)
+    (tmp_path / PROTOTYPES / "base.yml").write_text(BASE)
+    (tmp_path / PROTOTYPES / "lathe.yml").write_text(
+        "- type: entity\n  id: Lathe\n  parent: Machine\n"
+    )
+    (tmp_path / PROTOTYPES / "wrench.yml").write_text(
+        "- type: entity\n  id: Wrench\n  parent: Tool\n"
+    )
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", ".")
+    git(
+        tmp_path,
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "-q",
+        "-m",
+        "prototypes",
+    )
+    return tmp_path
+
+
+def selected(project: Path) -> set[str]:
+    registry = load_prototypes(str(project))
+    registry.resolve()
+    args = argparse.Namespace(project_path=str(project), since="HEAD", fast_yaml=False)
+    return set(select_entities(args, registry.entities))
+
+
+def test_unchanged_project_selects_nothing(project: Path) -> None:
+    assert selected(project) == set()
+
+
+def test_former_parents_of_moved_entities_are_selected(project: Path) -> None:
+    (project / PROTOTYPES / "lathe.yml").write_text(
+        "- type: entity\n  id: Lathe\n  parent: Tool\n"
+    )
+    # Machine no longer has Lathe to list among its derived prototypes
+    assert selected(project) == {"Lathe", "Tool", "Machine", "Base"}
+
+
+def test_former_parents_of_deleted_entities_are_selected(project: Path) -> None:
+    (project / PROTOTYPES / "wrench.yml").unlink()
+    assert selected(project) == {"Tool", "Base"}
+
+
+def test_file_at(project: Path) -> None:
+    content = file_at(str(project), "HEAD", f"{PROTOTYPES}/wrench.yml")
+    assert content is not None and "id: Wrench" in content
+    assert file_at(str(project), "HEAD", f"{PROTOTYPES}/missing.yml") is None
+
+
+# runs a command in a fresh interpreter, returning the top-level packages it imported
+def imported_packages(argv: list[str], env: dict[str, str]) -> set[str]:
+    script = (
+        "import sys\n"
+        "from stargazer import throttle\n"
+        "from stargazer.cli import main\n"
+        # the wiki is local, so reads need not be spaced out by the 2 seconds sync leaves between them
+        "disable_write_delay = throttle.disable_write_delay\n"
+        "throttle.disable_write_delay = lambda site, read_delay=0: disable_write_delay(site)\n"
+        f"main({argv!r})\n"
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        check=True,
+        text=True,
+        cwd=Path(__file__).parent.parent,
+        env={**os.environ, **env},
+    )
+    return set(result.stdout.splitlines()[-1].split())
+
+
+@pytest.mark.parametrize("command", ["load", "plan", "sync"])
+def test_commands_without_sprites_leave_out_the_compositor(
+    tmp_path: Path, wiki: FakeWiki, command: str
+) -> None:
+    generate_corpus(str(tmp_path / "project"), CorpusOptions(entities=10))
+    # sync connects to the starcup family, here the fake wiki
+    write_pywikibot_config(str(tmp_path / "pywikibot"), wiki, family="starcup")
+    PAGE_SEGMENTS.metadata.create_all(create_engine(f"sqlite:///{tmp_path}/db"))
+
+    argv = [command, str(tmp_path / "project"), "--no-cache"]
+    if command == "sync":
+        (tmp_path / "throttle.ctrl").write_text("delay 0\n")
+        argv += ["test", f"--throttle-control={tmp_path}/throttle.ctrl"]
+    packages = imported_packages(
+        argv,
+        {
+            "PYWIKIBOT_DIR": str(tmp_path / "pywikibot"),
+            "STARGAZER_DB_URL": f"sqlite:///{tmp_path}/db",
+        },
+    )
+
+    assert "stargazer" in packages
+    assert "numpy" not in packages
+    assert "PIL" not in packages
+    if command == "sync":
+        assert sum(title.startswith("Entity:") for title in wiki.pages) == 10
@@ -0,0 +1,147 @@
+import io
+import typing
+from pathlib import Path
+
+import pytest
+
+from stargazer.composite import (
+    COMPOSITING_AVAILABLE,
+    SpriteCompositor,
+    SpriteLayer,
+    layers_from_component,
+)
+from stargazer.rsi import RsiIndex
+
+pytestmark = pytest.mark.skipif(
+    not COMPOSITING_AVAILABLE, reason="requires numpy and Pillow"
+)
+
+Pixel = tuple[int, int, int, int]
+CLEAR: Pixel = (0, 0, 0, 0)
+RED: Pixel = (255, 0, 0, 255)
+GREEN: Pixel = (0, 255, 0, 255)
+HALF_WHITE: Pixel = (255, 255, 255, 128)
+
+
+def png(rows: list[list[Pixel]]) -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGBA", (len(rows[0]), len(rows)))
+    for y, row in enumerate(rows):
+        for x, pixel in enumerate(row):
+            image.putpixel((x, y), pixel)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def pixels(path: str) -> list[list[Pixel]]:
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return [
+            [typing.cast(Pixel, image.getpixel((x, y))) for x in range(image.width)]
+            for y in range(image.height)
+        ]
+
+
+@pytest.fixture
+def compositor(
+    tmp_path: Path, textures_path: Path, write_rsi: typing.Callable[..., None]
+) -> SpriteCompositor:
+    write_rsi(
+        "Objects/thing.rsi",
+        {
+            # two frames side by side, of which only the first is drawn
+            "base": png([[RED, RED, GREEN, GREEN], [RED, RED, GREEN, GREEN]]),
+            "dot": png([[HALF_WHITE, CLEAR], [CLEAR, CLEAR]]),
+        },
+        size=(2, 2),
+    )
+    return SpriteCompositor(
+        str(textures_path),
+        str(tmp_path / "composites"),
+        RsiIndex(str(textures_path)),
+    )
+
+
+def test_layers_are_blended_at_their_offsets(compositor: SpriteCompositor) -> None:
+    layers = (
+        SpriteLayer("Objects/thing.rsi/base.png"),
+        # tinted blue, and moved a pixel right and down
+        SpriteLayer("Objects/thing.rsi/dot.png", (0.0, 0.0, 1.0, 1.0), (1, 1)),
+    )
+    output_path = compositor.composite(layers)
+    assert output_path is not None
+
+    # both 2x2 layers are centered before being offset, so the canvas grows to 3x3 to hold the second one. Where the
+    # dot covers the base, blue at an opacity of a = 128/255 is laid over red: red is left with 255 * (1 - a) = 127,
+    # blue gets 255 * a = 128, and the base keeps the pixel opaque.
+    assert pixels(output_path) == [
+        [RED, RED, CLEAR],
+        [RED, (127, 0, 128, 255), CLEAR],
+        [CLEAR, CLEAR, CLEAR],
+    ]
+
+
+def test_translucent_pixels_keep_their_color(compositor: SpriteCompositor) -> None:
+    # over nothing, a translucent layer is neither darkened nor made more opaque by blending
+    output_path = compositor.composite(
+        (SpriteLayer("Objects/thing.rsi/dot.png", (0.0, 1.0, 0.0, 0.5)),)
+    )
+    assert output_path is not None
+    assert pixels(output_path)[0][0] == (0, 255, 0, 64)
+
+
+def test_composites_are_cached_by_their_sources(
+    tmp_path: Path, textures_path: Path, compositor: SpriteCompositor
+) -> None:
+    layers = (
+        SpriteLayer("Objects/thing.rsi/base.png"),
+        SpriteLayer("Objects/thing.rsi/dot.png"),
+    )
+    output_path = compositor.composite(layers)
+    assert compositor.composite(layers) == output_path
+    assert compositor.rendered == 1
+
+    # a later run reuses the composite until one of its sources is redrawn
+    rsi_index = RsiIndex(str(textures_path))
+    later = SpriteCompositor(
+        str(textures_path), str(tmp_path / "composites"), rsi_index
+    )
+    assert later.composite(layers) == output_path
+    assert (later.rendered, later.reused) == (0, 1)
+
+    (textures_path / "Objects/thing.rsi/dot.png").write_bytes(
+        png([[CLEAR, CLEAR], [CLEAR, HALF_WHITE]])
+    )
+    redrawn = SpriteCompositor(
+        str(textures_path), str(tmp_path / "composites"), rsi_index
+    )
+    assert redrawn.composite(layers) != output_path
+    assert redrawn.rendered == 1
+
+    assert compositor.composite((SpriteLayer("Objects/thing.rsi/none.png"),)) is None
+
+
+def test_layers_from_component() -> None:
+    layers = layers_from_component(
+        {
+            "sprite": "Objects/thing.rsi",
+            "color": "#FF000080",
+            "layers": [
+                {"state": "base"},
+                {"state": "dot", "color": "blue", "offset": "0.5,0.25"},
+                {"texture": "/Textures/Objects/plain.png"},
+                {"state": "hidden", "visible": False},
+                {"map": ["enum.SomeVisuals.Layer"]},
+            ],
+        }
+    )
+    half = 128 / 255
+    assert layers == (
+        SpriteLayer("Objects/thing.rsi/base.png", (1.0, 0.0, 0.0, half)),
+        # offsets are given in meters with y pointing up, and turned into pixels with y pointing down
+        SpriteLayer("Objects/thing.rsi/dot.png", (0.0, 0.0, 0.0, half), (16, -8)),
+        SpriteLayer("Objects/plain.png", (1.0, 0.0, 0.0, half)),
+    )
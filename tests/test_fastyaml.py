@@ -0,0 +1,163 @@
+import os
+import typing
+
+import pytest
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from stargazer.entity import EntityPrototype
+from stargazer.loader import load_prototypes
+
+# the syntax the corpus generator doesn't produce: anchors and aliases, merge keys, tagged scalars, and scalars which
+# resolve differently under YAML 1.1 and 1.2 or to types without a constructor in PyYAML
+EDGE_CASES = """\
+- type: entity
+  id: EdgeBase
+  abstract: true
+  components:
+  - type: Damageable
+    damage: &damage
+      types:
+        Blunt: 5
+        Heat: 2.5
+  - type: Trigger
+    behavior: !type:DamageTrigger
+      damage: 10
+    threshold: !type:Constant 5
+    actions:
+    - !type:PlaySoundBehavior
+      sound: /Audio/Effects/break.ogg
+    - !type:DoActsBehavior {acts: [Destruction]}
+
+- type: entity
+  id: EdgeChild
+  parent: EdgeBase
+  name: edge child
+  description: "quoted: with a colon" # comment
+  components:
+  - type: Damageable
+    damage: *damage
+  - type: Stack
+    <<: &stack
+      count: 1
+      max: 30
+    count: 5
+  - type: Scalars
+    strings: [yes, no, on, off, y, n, 1:20, 0b, 1e, "010", =, <<]
+    operator: =
+    numbers: [010, 0o17, 0x1F, 0b101, 1_000, -7, +3, .5, 1.5e3, -.inf, .inf]
+    empty: [~, null, ""]
+    booleans: [true, False, TRUE]
+
+- type: entity
+  id: EdgeGrandchild
+  parent: [EdgeChild, EdgeBase]
+  components:
+  - type: Stack
+    <<: *stack
+  - type: Sprite
+    sprite: Objects/edge.rsi
+    state: icon
+"""
+
+
+def entity_dict(entity: EntityPrototype) -> dict[str, typing.Any]:
+    return {
+        "id": entity.id,
+        "parents": entity.parents,
+        "abstract": entity.abstract,
+        "name": entity.name,
+        "description": entity.description,
+        "suffix": entity.suffix,
+        "categories": entity.categories,
+        "data": entity.data,
+        "components": {
+            component_type: dict(component)
+            for component_type, component in entity.components.items()
+        },
+        "file_path": entity.meta.file_path,
+        "line_number": entity.meta.line_number,
+        "component_lines": entity.meta.component_lines,
+    }
+
+
+def resolved_entities(
+    base_path: str, fast_yaml: bool
+) -> dict[str, dict[str, typing.Any]]:
+    registry = load_prototypes(base_path, fast_yaml=fast_yaml)
+    registry.resolve()
+    return {
+        entity_id: entity_dict(entity)
+        for entity_id, entity in registry.entities.items()
+    }
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        CorpusOptions(entities=500),
+        CorpusOptions(entities=300, tag_ratio=0.5, multi_parent_ratio=0.3, seed=1),
+    ],
+)
+def test_loaders_agree(tmp_path: typing.Any, options: CorpusOptions) -> None:
+    base_path = str(tmp_path)
+    generate_corpus(base_path, options)
+    with open(os.path.join(base_path, "Resources", "Prototypes", "edge.yml"), "w") as f:
+        f.write(EDGE_CASES)
+
+    ruamel_entities = resolved_entities(base_path, fast_yaml=False)
+    fast_entities = resolved_entities(base_path, fast_yaml=True)
+
+    assert len(ruamel_entities) == options.entities + 3
+    assert fast_entities.keys() == ruamel_entities.keys()
+    for entity_id, entity in ruamel_entities.items():
+        assert fast_entities[entity_id] == entity, entity_id
+
+
+def test_edge_cases(tmp_path: typing.Any) -> None:
+    os.makedirs(os.path.join(tmp_path, "Resources", "Prototypes"))
+    with open(os.path.join(tmp_path, "Resources", "Prototypes", "edge.yml"), "w") as f:
+        f.write(EDGE_CASES)
+
+    for fast_yaml in (False, True):
+        entities = resolved_entities(str(tmp_path), fast_yaml)
+        child = entities["EdgeChild"]["components"]
+        assert child["Damageable"]["damage"] == {"types": {"Blunt": 5, "Heat": 2.5}}
+        assert child["Stack"] == {"type": "Stack", "count": 5, "max": 30}
+        assert child["Trigger"]["behavior"] == {"damage": 10}
+        assert child["Trigger"]["threshold"] == "5"
+        assert child["Trigger"]["actions"][1] == {"acts": ["Destruction"]}
+        assert child["Scalars"]["strings"] == [
+            "yes",
+            "no",
+            "on",
+            "off",
+            "y",
+            "n",
+            "1:20",
+            "0b",
+            "1e",
+            "010",
+            "=",
+            "<<",
+        ]
+        assert child["Scalars"]["operator"] == "="
+        assert child["Scalars"]["numbers"] == [
+            10,
+            15,
+            31,
+            5,
+            1000,
+            -7,
+            3,
+            0.5,
+            1500.0,
+            float("-inf"),
+            float("inf"),
+        ]
+        assert child["Scalars"]["empty"] == [None, None, ""]
+        assert child["Scalars"]["booleans"] == [True, False, True]
+        assert entities["EdgeGrandchild"]["components"]["Stack"] == {
+            "type": "Stack",
+            "count": 1,
+            "max": 30,
+        }
@@ -0,0 +1,142 @@
+import copy
+import typing
+from collections import ChainMap
+
+from stargazer.entity import EntityPrototype
+from stargazer.prototype import Prototype, create_prototype, resolve_prototypes
+
+# Child inherits from Left and Right, which both inherit from Base
+DIAMOND: list[dict[str, typing.Any]] = [
+    # children are listed before their parents, so resolving can't rely on declaration order
+    {
+        "type": "entity",
+        "id": "Child",
+        "parent": ["Left", "Right"],
+        "components": [{"type": "Shared", "own": "child"}],
+    },
+    {
+        "type": "entity",
+        "id": "Left",
+        "parent": "Base",
+        "price": 10,
+        "components": [{"type": "Shared", "x": "left"}],
+    },
+    {
+        "type": "entity",
+        "id": "Right",
+        "parent": "Base",
+        "name": "right",
+        "description": "from the right",
+        "price": 20,
+        "weight": 2,
+        "components": [
+            {"type": "Shared", "x": "right", "y": "right", "z": "right"},
+            {"type": "RightOnly", "value": 1},
+        ],
+    },
+    {
+        "type": "entity",
+        "id": "Base",
+        "name": "base",
+        "components": [
+            {"type": "Shared", "x": "base", "y": "base"},
+            {"type": "BaseOnly", "nested": {"value": 1}},
+        ],
+    },
+]
+
+
+def resolve(objects: list[dict[str, typing.Any]]) -> dict[str, EntityPrototype]:
+    prototypes = {}
+    for obj in objects:
+        prototype = create_prototype(obj)
+        prototypes[prototype.id] = typing.cast(EntityPrototype, prototype)
+    resolve_prototypes(prototypes)
+    return prototypes
+
+
+def test_diamond_component_precedence() -> None:
+    entities = resolve(DIAMOND)
+    child = entities["Child"]
+
+    # the child's own fields win, then everything available through Left (Base included), and only then Right
+    assert dict(child.components["Shared"]) == {
+        "type": "Shared",
+        "own": "child",
+        "x": "left",
+        "y": "base",
+        "z": "right",
+    }
+    assert dict(child.components["RightOnly"]) == {"type": "RightOnly", "value": 1}
+    assert dict(child.components["BaseOnly"]) == {
+        "type": "BaseOnly",
+        "nested": {"value": 1},
+    }
+    assert list(child.components) == ["Shared", "BaseOnly", "RightOnly"]
+
+
+def test_diamond_field_precedence() -> None:
+    entities = resolve(DIAMOND)
+    child = entities["Child"]
+
+    assert child.name == "base"
+    assert child.description == "from the right"
+    assert child.data == {"price": 10, "weight": 2}
+    assert entities["Right"].name == "right"
+
+
+def test_diamond_generic_prototypes() -> None:
+    objects: list[dict[str, typing.Any]] = [
+        {"type": "synthetic", "id": "Child", "parent": ["Left", "Right"]},
+        {"type": "synthetic", "id": "Left", "parent": "Base", "a": "left"},
+        {"type": "synthetic", "id": "Right", "parent": "Base", "a": "right"},
+        {"type": "synthetic", "id": "Base", "a": "base", "b": "base"},
+    ]
+    prototypes: dict[str, Prototype] = {}
+    for obj in objects:
+        prototype = create_prototype(obj)
+        prototypes[prototype.id] = prototype
+    resolve_prototypes(prototypes)
+
+    assert prototypes["Child"].data == {"a": "left", "b": "base"}
+    assert prototypes["Right"].data == {"a": "right", "b": "base"}
+
+
+def test_parents_are_not_mutated() -> None:
+    objects = copy.deepcopy(DIAMOND)
+    entities = resolve(objects)
+
+    # neither the parsed objects nor any parent's own component data changes when children inherit from them
+    assert objects == DIAMOND
+    for obj in DIAMOND:
+        entity = entities[obj["id"]]
+        for declared in obj["components"]:
+            component = entity.components[declared["type"]]
+            assert {key: component[key] for key in declared} == declared, entity.id
+
+    assert dict(entities["Left"].components["Shared"]) == {
+        "type": "Shared",
+        "x": "left",
+        "y": "base",
+    }
+    assert dict(entities["Base"].components["Shared"]) == {
+        "type": "Shared",
+        "x": "base",
+        "y": "base",
+    }
+    assert "RightOnly" not in entities["Left"].components
+
+    # inherited components are shared with the parent instead of being copied
+    assert (
+        entities["Child"].components["BaseOnly"]
+        is entities["Base"].components["BaseOnly"]
+    )
+
+
+def test_shared_ancestor_layers_are_not_repeated() -> None:
+    entities = resolve(DIAMOND)
+    shared = typing.cast(ChainMap, entities["Child"].components["Shared"])
+
+    # Base's layer is inherited through both Left and Right, but only needs looking up once
+    assert len(shared.maps) == 4
+    assert len({id(layer) for layer in shared.maps}) == 4
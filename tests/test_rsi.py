@@ -0,0 +1,127 @@
+import json
+import os
+import pickle
+import typing
+from pathlib import Path
+
+import pytest
+
+from stargazer import rsi
+from stargazer.rsi import RSI_INDEX_VERSION, RsiIndex, RsiMeta
+
+
+@pytest.fixture
+def reads(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    # the meta.json files read from disk, in order
+    paths: list[str] = []
+    read_meta = rsi._read_meta
+
+    def counting_read_meta(meta_path: str) -> RsiMeta:
+        paths.append(meta_path)
+        return read_meta(meta_path)
+
+    monkeypatch.setattr(rsi, "_read_meta", counting_read_meta)
+    return paths
+
+
+def test_unchanged_rsis_are_not_read_again(
+    tmp_path: Path,
+    textures_path: Path,
+    write_rsi: typing.Callable[..., None],
+    reads: list[str],
+) -> None:
+    write_rsi("Objects/thing.rsi", {"icon": b"", "broken": b""}, size=(32, 48))
+    index_path = str(tmp_path / "rsi.pickle")
+
+    index = RsiIndex(str(textures_path), index_path)
+    meta = index.get("Objects/thing.rsi")
+    assert meta == RsiMeta(
+        "CC-BY-SA-3.0", "Drawn for the tests", (32, 48), frozenset({"icon", "broken"})
+    )
+    # every state of an rsi is answered by its single read
+    assert index.has_state("Objects/thing.rsi/icon.png")
+    assert index.has_state("Objects/thing.rsi/broken.png")
+    assert not index.has_state("Objects/thing.rsi/missing.png")
+    assert len(reads) == 1
+    index.save()
+
+    index = RsiIndex(str(textures_path), index_path)
+    assert index.get("Objects/thing.rsi") == meta
+    assert len(reads) == 1
+
+
+def test_edited_rsis_are_read_again(
+    tmp_path: Path,
+    textures_path: Path,
+    write_rsi: typing.Callable[..., None],
+    reads: list[str],
+) -> None:
+    write_rsi("Objects/thing.rsi", {"icon": b""})
+    meta_path = textures_path / "Objects/thing.rsi/meta.json"
+    index_path = str(tmp_path / "rsi.pickle")
+
+    index = RsiIndex(str(textures_path), index_path)
+    assert index.get("Objects/thing.rsi") is not None
+    index.save()
+
+    # an edit keeping the size of the file is still told apart by its modification time
+    meta = json.loads(meta_path.read_text())
+    meta["license"] = "CC-BY-SA-4.0"
+    meta_path.write_text(json.dumps(meta))
+    stat = os.stat(meta_path)
+    os.utime(meta_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    index = RsiIndex(str(textures_path), index_path)
+    edited = index.get("Objects/thing.rsi")
+    assert edited is not None and edited.license == "CC-BY-SA-4.0"
+    assert len(reads) == 2
+    index.save()
+
+    write_rsi("Objects/thing.rsi", {"icon": b"", "open": b""})
+    index = RsiIndex(str(textures_path), index_path)
+    assert index.has_state("Objects/thing.rsi/open.png")
+    assert len(reads) == 3
+
+
+def test_stale_entries_and_index_versions_are_discarded(
+    tmp_path: Path,
+    textures_path: Path,
+    write_rsi: typing.Callable[..., None],
+    reads: list[str],
+) -> None:
+    write_rsi("Objects/thing.rsi", {"icon": b""})
+    write_rsi("Objects/other.rsi", {"icon": b""})
+    index_path = str(tmp_path / "rsi.pickle")
+
+    index = RsiIndex(str(textures_path), index_path)
+    index.get("Objects/thing.rsi")
+    index.get("Objects/other.rsi")
+    index.save()
+
+    # rsis no longer looked up are dropped from the index
+    index = RsiIndex(str(textures_path), index_path)
+    index.get("Objects/thing.rsi")
+    index.save()
+    assert set(RsiIndex(str(textures_path), index_path).entries) == {
+        "Objects/thing.rsi"
+    }
+
+    with open(index_path, "rb") as f:
+        _, entries = pickle.load(f)
+    with open(index_path, "wb") as f:
+        pickle.dump((RSI_INDEX_VERSION + 1, entries), f)
+    assert RsiIndex(str(textures_path), index_path).entries == {}
+    assert RsiIndex(str(textures_path), index_path, rebuild=True).entries == {}
+    assert len(reads) == 2
+
+
+def test_missing_and_unreadable_rsis(
+    textures_path: Path, write_rsi: typing.Callable[..., None]
+) -> None:
+    write_rsi("Objects/broken.rsi", {"icon": b""})
+    (textures_path / "Objects/broken.rsi/meta.json").write_text("{")
+
+    index = RsiIndex(str(textures_path))
+    assert index.get("Objects/missing.rsi") is None
+    assert index.get("Objects/broken.rsi") is None
+    assert not index.has_state("Objects/broken.rsi/icon.png")
@@ -0,0 +1,60 @@
+import pytest
+
+from stargazer.segments import (
+    AUTO_GENERATED_SEGMENT_FOOTER,
+    AUTO_GENERATED_SEGMENT_HEADER,
+    PageSegmentException,
+    parse_segments,
+    splice_segments,
+)
+
+
+def segment(name: str, body: str) -> str:
+    return f"{AUTO_GENERATED_SEGMENT_HEADER.format(name)}\n{body}\n{AUTO_GENERATED_SEGMENT_FOOTER}"
+
+
+INFOBOX = segment("Infobox", "{{Infobox}}")
+CATEGORIES = segment("Categories", "[[Category:Entities]]")
+DERIVED = segment("Derived", "== Derived prototypes ==")
+
+
+def test_empty_page_is_started_with_every_segment() -> None:
+    text = splice_segments(
+        "", {"Infobox": INFOBOX, "Categories": CATEGORIES, "Derived": DERIVED}
+    )
+    assert text == f"{INFOBOX}\n\n\n\n{CATEGORIES}\n{DERIVED}"
+    assert list(parse_segments(text)) == ["Infobox", "Categories", "Derived"]
+
+
+def test_segments_are_replaced_in_place() -> None:
+    text = f"Intro\n{INFOBOX}\n\nWritten by hand.\n\n{CATEGORIES}"
+    infobox = segment("Infobox", "{{Infobox|new}}")
+    categories = segment("Categories", "")
+
+    assert (
+        splice_segments(text, {"Infobox": infobox, "Categories": categories})
+        == f"Intro\n{infobox}\n\nWritten by hand.\n\n{categories}"
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        f"{INFOBOX}\n\n\n\n{CATEGORIES}",
+        f"{INFOBOX}\n\n\n\n{CATEGORIES}\n\nWritten by hand.",
+        f"{INFOBOX}\n\n\n\n{CATEGORIES}\n",
+    ],
+)
+def test_new_segments_are_appended_on_a_line_of_their_own(text: str) -> None:
+    spliced = splice_segments(
+        text, {"Infobox": INFOBOX, "Categories": CATEGORIES, "Derived": DERIVED}
+    )
+    separator = "" if text.endswith("\n") else "\n"
+    assert spliced == text + separator + DERIVED
+
+
+def test_unmatched_markers_are_reported() -> None:
+    with pytest.raises(PageSegmentException):
+        parse_segments(
+            f"{INFOBOX}\n{AUTO_GENERATED_SEGMENT_HEADER.format('Categories')}"
+        )
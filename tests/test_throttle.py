@@ -0,0 +1,261 @@
+import time
+import typing
+
+import pytest
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from benchmarks.fakewiki import FakeWiki, FakeWikiOptions
+from stargazer.index import PrototypeIndex
+from stargazer.loader import load_prototypes
+from stargazer.report import LATENCY_BUCKETS, RunReport
+from stargazer.throttle import WriteScheduler
+from stargazer.updaters import EntityUpdater
+
+if typing.TYPE_CHECKING:
+    import pywikibot
+    from sqlalchemy.orm import Session
+
+
+class SimulatedClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class SimulatedWiki:
+    """
+    A wiki whose replica falls `save_cost` seconds further behind with every save, and catches up in real time. Saves
+    slow down as the lag builds up, and are refused outright once it exceeds `maxlag`.
+    """
+
+    def __init__(
+        self, clock: SimulatedClock, save_cost: float, maxlag: float = 5.0
+    ) -> None:
+        self.clock = clock
+        self.save_cost = save_cost
+        self.maxlag = maxlag
+        self.lag = 0.0
+        self.refused = 0
+        self.max_lag_seen = 0.0
+        self._updated = 0.0
+
+    def save(self) -> float | None:
+        self.lag = max(0.0, self.lag - (self.clock.now - self._updated))
+        self._updated = self.clock.now
+        self.max_lag_seen = max(self.max_lag_seen, self.lag)
+        if self.lag > self.maxlag:
+            self.refused += 1
+            return self.lag
+
+        self.clock.now += 0.1 + self.lag * 0.1
+        self.lag += self.save_cost
+        return None
+
+
+def run_saves(
+    scheduler: WriteScheduler, clock: SimulatedClock, wiki: SimulatedWiki, count: int
+) -> list[float]:
+    delays = []
+    saved = 0
+    while saved < count:
+        scheduler.wait()
+        start = clock()
+        lag = wiki.save()
+        if lag is not None:
+            scheduler.record_lag(lag=lag)
+            continue
+        scheduler.record_success(clock() - start)
+        delays.append(scheduler.current_delay())
+        saved += 1
+    return delays
+
+
+def test_idle_wiki_is_saved_to_at_the_minimum_delay() -> None:
+    clock = SimulatedClock()
+    scheduler = WriteScheduler(min_delay=0.5, clock=clock, sleep=clock.sleep)
+    wiki = SimulatedWiki(clock, save_cost=0.0)
+
+    delays = run_saves(scheduler, clock, wiki, 100)
+
+    assert delays[-1] == 0.5
+    assert wiki.refused == 0
+    # the initial 2 second delay decays within a few dozen saves
+    assert clock.now < 100 * 0.6 + 15
+
+
+def test_lagging_wiki_is_backed_off_from() -> None:
+    def run(
+        max_delay: float, target_latency: float = 1.0
+    ) -> tuple[SimulatedClock, SimulatedWiki, list[float]]:
+        clock = SimulatedClock()
+        scheduler = WriteScheduler(
+            min_delay=0.5,
+            max_delay=max_delay,
+            target_latency=target_latency,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        wiki = SimulatedWiki(clock, save_cost=1.5)
+        return clock, wiki, run_saves(scheduler, clock, wiki, 300)
+
+    # the replica can only keep up with a save every 1.5 seconds, which the scheduler settles around before the wiki
+    # starts refusing saves, where saving at a fixed pace would have most of them refused
+    clock, wiki, delays = run(max_delay=60, target_latency=0.5)
+    fixed_clock, fixed_wiki, _ = run(max_delay=0.5)
+
+    assert sum(delays[-100:]) / 100 > 1.0
+    assert wiki.refused < 10
+    assert fixed_wiki.refused > 100
+    assert clock.now < fixed_clock.now * 1.1
+
+
+def test_lag_and_retry_after_are_waited_out() -> None:
+    clock = SimulatedClock()
+    scheduler = WriteScheduler(
+        min_delay=0.5, max_delay=30, clock=clock, sleep=clock.sleep
+    )
+
+    scheduler.record_lag(lag=8)
+    assert scheduler.current_delay() == 8
+    scheduler.record_lag(retry_after=25)
+    assert scheduler.current_delay() == 25
+    scheduler.record_lag(lag=100)
+    assert scheduler.current_delay() == 30
+
+    scheduler.wait()
+    assert clock.sleeps == [30]
+
+
+def test_control_file(tmp_path: typing.Any) -> None:
+    clock = SimulatedClock()
+    control_path = tmp_path / "throttle.ctrl"
+    control_path.write_text("")
+    scheduler = WriteScheduler(
+        min_delay=0.5,
+        initial_delay=1.0,
+        control_path=str(control_path),
+        clock=clock,
+        sleep=clock.sleep,
+    )
+    scheduler.record_success(0.1)
+    assert scheduler.current_delay() == 0.9
+
+    control_path.write_text("rate 20 # per minute\n")
+    scheduler.read_control()
+    assert scheduler.current_delay() == 3.0
+
+    control_path.write_text("delay 5\nbogus\n")
+    scheduler.read_control()
+    assert scheduler.current_delay() == 5.0
+
+    # pausing holds saves back until the line is removed again
+    control_path.write_text("pause\n")
+    polls = 0
+
+    def sleep(seconds: float) -> None:
+        nonlocal polls
+        polls += 1
+        clock.sleep(seconds)
+        if polls == 3:
+            control_path.write_text("")
+
+    scheduler._sleep = sleep
+    scheduler.wait(poll_interval=5.0)
+    assert polls == 3
+    assert not scheduler.paused
+    assert scheduler.current_delay() == 0.9
+
+
+@pytest.fixture
+def entities(tmp_path: typing.Any) -> dict[str, typing.Any]:
+    generate_corpus(str(tmp_path), CorpusOptions(entities=20))
+    registry = load_prototypes(str(tmp_path))
+    registry.resolve()
+    return registry.entities
+
+
+def test_saves_are_paced_by_the_scheduler_alone(
+    site: "pywikibot.site.BaseSite",
+    wiki: FakeWiki,
+    session: "Session",
+    entities: dict[str, typing.Any],
+) -> None:
+    scheduler = WriteScheduler(min_delay=0.05, initial_delay=0.05)
+    updater = EntityUpdater(
+        session,
+        site,
+        "test",
+        scheduler,
+        entities=entities,
+        index=PrototypeIndex(entities),
+    )
+
+    start = time.monotonic()
+    updater.run()
+    seconds = time.monotonic() - start
+
+    assert wiki.requests["edit"] == 20
+    # pywikibot's own write delay (10 seconds by default) no longer applies, only the scheduler's
+    assert site.throttle.writedelay <= site.throttle.mindelay
+    assert 19 * 0.05 <= seconds < 10
+
+
+def test_maxlag_responses_back_off(
+    site: "pywikibot.site.BaseSite",
+    wiki: FakeWiki,
+    session: "Session",
+    entities: dict[str, typing.Any],
+) -> None:
+    wiki.reset(FakeWikiOptions(maxlag_ratio=0.1, maxlag_seconds=0.1))
+    scheduler = WriteScheduler(min_delay=0, initial_delay=0, target_latency=0.5)
+    report = RunReport()
+    updater = EntityUpdater(
+        session,
+        site,
+        "test",
+        scheduler,
+        report,
+        entities=entities,
+        index=PrototypeIndex(entities),
+    )
+    updater.run()
+
+    # pywikibot waits out lagged responses itself and retries them, which the scheduler sees as slow saves
+    assert wiki.maxlagged > 0
+    assert report.counters["pages_updated"] == 20
+    assert len(wiki.pages) == 20
+    saves = report.histograms["page_save_seconds"]
+    assert sum(saves.counts[LATENCY_BUCKETS.index(0.5) + 1 :]) > 0
+    assert scheduler.delay > 0
+
+
+# pywikibot gives up on lagged writes with a timeout, or with the error itself when it repeats unchanged
+@pytest.mark.parametrize("lag, delay", [(None, 25), (3, 25), (40, 40)])
+def test_retry_after_of_failed_writes_is_waited_out(
+    site: "pywikibot.site.BaseSite",
+    session: "Session",
+    monkeypatch: pytest.MonkeyPatch,
+    lag: float | None,
+    delay: float,
+) -> None:
+    from pywikibot.exceptions import APIError, MaxlagTimeoutError
+
+    def write() -> None:
+        if lag is None:
+            raise MaxlagTimeoutError("Maximum retries attempted due to maxlag")
+        raise APIError("maxlag", "Waiting for a replica", lag=lag)
+
+    # as pywikibot leaves it after a response carrying `Retry-After: 25`
+    monkeypatch.setattr(site.throttle, "retry_after", 25)
+    scheduler = WriteScheduler(min_delay=0, initial_delay=0, max_delay=60)
+    updater = EntityUpdater(session, site, "test", scheduler, entities={})
+    with pytest.raises((APIError, MaxlagTimeoutError)):
+        updater.paced(write)
+    assert scheduler.delay == delay
@@ -0,0 +1,383 @@
+import hashlib
+import io
+import typing
+from pathlib import Path
+
+import pytest
+
+from benchmarks.corpus import CorpusOptions, generate_corpus
+from benchmarks.fakewiki import FakeWiki
+from stargazer.composite import COMPOSITING_AVAILABLE, SpriteCompositor
+from stargazer.entity import EntityPrototype
+from stargazer.index import PrototypeIndex
+from stargazer.loader import load_prototypes
+from stargazer.prototype import create_prototype, resolve_prototypes
+from stargazer.report import RunReport
+from stargazer.rsi import RsiIndex
+from stargazer.segments import (
+    AUTO_GENERATED_SEGMENT_HEADER,
+    PageSegmentStore,
+    parse_segments,
+)
+from stargazer.throttle import WriteScheduler
+from stargazer.updaters import EntityUpdater, SpriteUpdater
+
+if typing.TYPE_CHECKING:
+    import pywikibot
+    from sqlalchemy.orm import Session
+
+
+def entities_of(objects: list[dict[str, typing.Any]]) -> dict[str, EntityPrototype]:
+    entities = {}
+    for obj in objects:
+        entity = typing.cast(EntityPrototype, create_prototype(obj))
+        entities[entity.id] = entity
+    resolve_prototypes(entities)
+    return entities
+
+
+FAMILY: list[dict[str, typing.Any]] = [
+    {"type": "entity", "id": "Base", "abstract": True},
+    {"type": "entity", "id": "Middle", "parent": "Base"},
+    {"type": "entity", "id": "LeafA", "parent": "Middle"},
+    {"type": "entity", "id": "LeafB", "parent": "Base"},
+]
+
+
+def sync_entities(
+    site: "pywikibot.site.BaseSite",
+    session: "Session",
+    entities: dict[str, EntityPrototype],
+    **attributes: typing.Any,
+) -> EntityUpdater:
+    updater = EntityUpdater(
+        session,
+        site,
+        "test",
+        WriteScheduler(min_delay=0, initial_delay=0),
+        entities=entities,
+    )
+    for name, value in attributes.items():
+        setattr(updater, name, value)
+    updater.run()
+    return updater
+
+
+def test_derived_segment_only_on_entities_with_descendants(session: "Session") -> None:
+    entities = entities_of(FAMILY)
+    index = PrototypeIndex(entities)
+    store = PageSegmentStore(session)
+
+    base = EntityUpdater.generate_segments(entities["Base"], index=index, store=store)
+    assert "3 prototypes inherit from Base, 2 of them directly" in base["Derived"]
+    assert "[[Entity:Middle|Middle]] (1 derived)" in base["Derived"]
+    assert "Derived" not in EntityUpdater.generate_segments(
+        entities["LeafA"], index=index, store=store
+    )
+
+
+def test_derived_segment_is_emptied_once_it_exists(session: "Session") -> None:
+    entities = entities_of(FAMILY[:2])
+    index = PrototypeIndex(entities)
+    store = PageSegmentStore(session)
+    store.set(EntityUpdater.page_name("Middle"), "Derived", "hash of an older list")
+
+    segments = EntityUpdater.generate_segments(
+        entities["Middle"], index=index, store=store
+    )
+    assert segments["Derived"] == EntityUpdater.generate_derived(
+        entities["Middle"], index
+    )
+    assert "== Derived prototypes ==" not in segments["Derived"]
+
+
+def test_derived_segment_sync(
+    site: "pywikibot.site.BaseSite", wiki: "FakeWiki", session: "Session"
+) -> None:
+    sync_entities(site, session, entities_of(FAMILY))
+    assert wiki.requests["edit"] == 4
+    assert "Derived" in parse_segments(wiki.pages["Entity:Middle"].text)
+    assert "Derived" not in parse_segments(wiki.pages["Entity:LeafA"].text)
+
+    # LeafA is moved under Base, which leaves Middle without derived prototypes
+    wiki.reset_counts()
+    moved = [*FAMILY[:2], {**FAMILY[2], "parent": "Base"}, FAMILY[3]]
+    sync_entities(site, session, entities_of(moved))
+    assert wiki.requests["edit"] == 3
+    middle = wiki.pages["Entity:Middle"].text
+    span = parse_segments(middle)["Derived"]
+    assert "LeafA" not in middle[span.start : span.end]
+    assert "LeafA" in wiki.pages["Entity:Base"].text
+
+
+# the queries made for pages, leaving out the user info pywikibot adds to them
+def page_queries(wiki: "FakeWiki") -> dict[str, int]:
+    return {
+        query: count
+        for query, count in wiki.queries.items()
+        if query.startswith("prop=")
+    }
+
+
+PRELOAD_QUERY = "prop=revisions|info|categoryinfo|templates"
+
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_pages_are_fetched_in_batches(
+    site: "pywikibot.site.BaseSite",
+    wiki: "FakeWiki",
+    session: "Session",
+    existing: bool,
+) -> None:
+    entities = entities_of([{"type": "entity", "id": f"Entity{i}"} for i in range(120)])
+    if existing:
+        for entity_id in entities:
+            wiki.create_page(EntityUpdater.page_name(entity_id), "Written by hand.")
+    # the edit token is only fetched once per session
+    site.tokens["csrf"]
+    wiki.reset_counts()
+
+    sync_entities(site, session, entities, preload_batch_size=50)
+
+    # new pages are created from the preloaded batches as well, without being fetched again one by one
+    assert page_queries(wiki) == {PRELOAD_QUERY: 3}
+    assert wiki.requests["query"] == 3
+    assert wiki.requests["edit"] == 120
+    assert all(
+        wiki.pages[EntityUpdater.page_name(entity_id)].text.startswith(
+            "Written by hand."
+            if existing
+            else AUTO_GENERATED_SEGMENT_HEADER.format("Infobox")
+        )
+        for entity_id in entities
+    )
+
+
+def test_requests_per_run_over_a_corpus(
+    tmp_path: Path,
+    site: "pywikibot.site.BaseSite",
+    wiki: "FakeWiki",
+    session: "Session",
+) -> None:
+    generate_corpus(str(tmp_path), CorpusOptions(entities=60))
+    registry = load_prototypes(str(tmp_path))
+    registry.resolve()
+    site.tokens["csrf"]
+
+    def measure() -> tuple[dict[str, int], int, RunReport]:
+        wiki.reset_counts()
+        report = RunReport()
+        sync_entities(
+            site,
+            session,
+            registry.entities,
+            report=report,
+            preload_batch_size=25,
+            query_batch_size=25,
+        )
+        return page_queries(wiki), wiki.requests["edit"], report
+
+    # every page is new, so there is nothing to check for drift and each page is created from its preloaded batch
+    queries, edits, report = measure()
+    assert queries == {PRELOAD_QUERY: 3}
+    assert edits == 60
+    assert report.counters["pages_updated"] == 60
+
+    # with nothing changed only the revisions of the pages are checked, and no page text is fetched
+    queries, edits, report = measure()
+    assert queries == {"prop=info": 3}
+    assert edits == 0
+    assert report.counters["pages_skipped"] == 60
+
+    # pages edited by someone else are fetched again, though only those whose segments were lost need an edit
+    titles = sorted(wiki.pages)
+    for title in titles[:3]:
+        wiki.create_page(title, wiki.pages[title].text + "\nEdited by hand.")
+    for title in titles[3:5]:
+        wiki.create_page(title, "Rewritten by hand.")
+    queries, edits, report = measure()
+    assert queries == {"prop=info": 3, PRELOAD_QUERY: 1}
+    assert edits == 2
+    assert report.counters["pages_drifted"] == 5
+    assert report.counters["pages_unchanged"] == 3
+
+
+def sprite_entity(entity_id: str, state: str) -> dict[str, typing.Any]:
+    return {
+        "type": "entity",
+        "id": entity_id,
+        "components": [
+            {"type": "Sprite", "sprite": "Objects/thing.rsi", "state": state}
+        ],
+    }
+
+
+ICON = SpriteUpdater.file_id_from_path("Objects/thing.rsi/icon.png")
+BROKEN = SpriteUpdater.file_id_from_path("Objects/thing.rsi/broken.png")
+
+
+# the title the wiki gives the file of a sprite
+def file_title(file_id: str) -> str:
+    return FakeWiki.normalize(SpriteUpdater.page_name(file_id))
+
+
+def sync_sprites(
+    site: "pywikibot.site.BaseSite",
+    session: "Session",
+    project_path: Path,
+    entities: dict[str, EntityPrototype],
+    compositor: "SpriteCompositor | None" = None,
+) -> RunReport:
+    report = RunReport()
+    updater = SpriteUpdater(
+        session,
+        site,
+        "test",
+        str(project_path),
+        WriteScheduler(min_delay=0, initial_delay=0),
+        report,
+        compositor=compositor,
+    )
+    updater.prepare(entities=entities)
+    updater.run()
+    return report
+
+
+def test_sprites_are_uploaded_once_per_file(
+    site: "pywikibot.site.BaseSite",
+    wiki: "FakeWiki",
+    session: "Session",
+    tmp_path: Path,
+    textures_path: Path,
+    write_rsi: typing.Callable[..., None],
+) -> None:
+    write_rsi(
+        "Objects/thing.rsi",
+        {"icon": b"icon", "broken": b"broken"},
+        copyright="Drawn by someone",
+    )
+    entities = entities_of(
+        [
+            sprite_entity("Thing", "icon"),
+            sprite_entity("OtherThing", "icon"),
+            sprite_entity("BrokenThing", "broken"),
+            sprite_entity("MissingThing", "missing"),
+        ]
+    )
+
+    # entities sharing a sprite share its upload, and states missing from their rsi are left out
+    report = sync_sprites(site, session, tmp_path, entities)
+    assert wiki.requests["upload"] == 2
+    assert report.counters["sprites_uploaded"] == 2
+    icon = wiki.files[file_title(ICON)]
+    assert icon.data == b"icon"
+    assert icon.sha1 == hashlib.sha1(b"icon").hexdigest()
+    text = wiki.pages[file_title(ICON)].text
+    assert "File path: Objects/thing.rsi/icon.png" in text
+    assert "License: CC-BY-SA-3.0" in text
+    assert "Attribution: Drawn by someone" in text
+
+    # sprites whose hash is the one stored after their last upload are neither looked up nor uploaded again
+    wiki.reset_counts()
+    (textures_path / "Objects/thing.rsi/broken.png").write_bytes(b"broken again")
+    report = sync_sprites(site, session, tmp_path, entities)
+    assert wiki.requests["upload"] == 1
+    assert page_queries(wiki) == {"prop=imageinfo": 1}
+    assert report.counters["sprites_hashed"] == 2
+    assert wiki.files[file_title(BROKEN)].data == b"broken again"
+
+
+def test_files_already_on_the_wiki_are_not_uploaded(
+    site: "pywikibot.site.BaseSite",
+    wiki: "FakeWiki",
+    session: "Session",
+    tmp_path: Path,
+    write_rsi: typing.Callable[..., None],
+) -> None:
+    write_rsi("Objects/thing.rsi", {"icon": b"icon", "broken": b"broken"})
+    entities = entities_of(
+        [sprite_entity("Thing", "icon"), sprite_entity("BrokenThing", "broken")]
+    )
+    # uploaded by hand, or by a run whose database was lost
+    wiki.create_file(ICON, b"icon")
+    wiki.create_file(BROKEN, b"an older drawing")
+
+    report = sync_sprites(site, session, tmp_path, entities)
+    assert wiki.requests["upload"] == 1
+    assert report.counters["sprites_unchanged"] == 1
+    assert report.counters["sprites_uploaded"] == 1
+    assert wiki.files[file_title(BROKEN)].data == b"broken"
+
+    # both are known to be up to date from then on
+    wiki.reset_counts()
+    sync_sprites(site, session, tmp_path, entities)
+    assert wiki.requests["query"] == 0
+    assert wiki.requests["upload"] == 0
+
+
+@pytest.mark.skipif(not COMPOSITING_AVAILABLE, reason="requires numpy and Pillow")
+def test_layered_sprites_are_uploaded_as_composites(
+    site: "pywikibot.site.BaseSite",
+    wiki: "FakeWiki",
+    session: "Session",
+    tmp_path: Path,
+    textures_path: Path,
+    write_rsi: typing.Callable[..., None],
+) -> None:
+    from PIL import Image
+
+    def png(color: tuple[int, int, int, int]) -> bytes:
+        output = io.BytesIO()
+        Image.new("RGBA", (4, 4), color).save(output, format="PNG")
+        return output.getvalue()
+
+    write_rsi(
+        "Objects/thing.rsi",
+        {"base": png((255, 255, 255, 255)), "stripe": png((0, 0, 0, 128))},
+        size=(4, 4),
+    )
+    layers = [{"state": "base", "color": "#FF0000"}, {"state": "stripe"}]
+    entities = entities_of(
+        [
+            {
+                "type": "entity",
+                "id": entity_id,
+                "components": [
+                    {"type": "Sprite", "sprite": "Objects/thing.rsi", "layers": layers}
+                ],
+            }
+            for entity_id in ("Thing", "SameThing")
+        ]
+        + [
+            {
+                "type": "entity",
+                "id": "SingleLayer",
+                "components": [
+                    {
+                        "type": "Sprite",
+                        "sprite": "Objects/thing.rsi",
+                        "layers": [{"state": "base"}],
+                    }
+                ],
+            }
+        ]
+    )
+    rsi_index = RsiIndex(str(textures_path))
+    compositor = SpriteCompositor(
+        str(textures_path), str(tmp_path / "composites"), rsi_index
+    )
+
+    report = sync_sprites(site, session, tmp_path, entities, compositor)
+
+    # a single layer is uploaded as the sprite it is, identical layers make a single composite
+    assert wiki.requests["upload"] == 2
+    assert report.counters["composites_rendered"] == 1
+    base = SpriteUpdater.file_id_from_path("Objects/thing.rsi/base.png")
+    assert file_title(base) in wiki.files
+    (composite,) = [title for title in wiki.files if "composite" in title]
+    assert "File path: Objects/thing.rsi/base.png, Objects/thing.rsi/stripe.png" in (
+        wiki.pages[composite].text
+    )
+    with Image.open(io.BytesIO(wiki.files[composite].data)) as image:
+        # red tinted white, under black at an opacity of 128/255: 255 * (1 - 128/255) of red is left
+        assert image.getpixel((0, 0)) == (127, 0, 0, 255)